@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+""" smdv benchmarks: time the hot paths of smdv and fail on regressions """
+
+
+## Imports
+
+# python standard library
+import os
+import sys
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+
+## Globals
+
+# the directory containing smdv.py
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# benchmarks by name (filled by the benchmark decorator)
+BENCHMARKS = {}
+
+# default thresholds (in seconds) of the measurements of all benchmarks
+THRESHOLDS = {}
+
+
+## Normal functions (alphabetic)
+
+
+# register a benchmark
+def benchmark(**thresholds) -> callable:
+    """ register a benchmark function under its name
+
+    A benchmark function takes the parsed command line arguments and returns
+    a dictionary with the median time (in seconds) of each of its measurements.
+
+    Args:
+        **thresholds: the default maximum time (in seconds) of each measurement
+
+    Returns:
+        decorator: callable: the decorator registering the benchmark
+    """
+
+    def decorator(func: callable) -> callable:
+        BENCHMARKS[func.__name__] = func
+        THRESHOLDS.update(thresholds)
+        return func
+
+    return decorator
+
+
+# time starting smdv when no server is running
+@benchmark(**{"cold-start": 1.5, "cold-start-single": 1.2})
+def cold_start(args: argparse.Namespace) -> dict:
+    """ time `smdv <file>` when no server is running yet
+
+    The servers are started, their readiness is awaited and the file is
+    synced to them, in the default (flask and websocket server) and in the
+    single-process mode. No browser is opened and no pandoc servers are
+    started, such that only the startup of smdv itself is measured.
+
+    Args:
+        args: the parsed command line arguments
+
+    Returns:
+        times: dict: the median time (in seconds) of each measurement
+    """
+    times = {}
+    home = tempfile.mkdtemp(prefix="smdv-benchmark-")
+    env = dict(os.environ, XDG_RUNTIME_DIR=home, SMDV_DEFAULT_ARGS="")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # time smdv as installed: compiled
+    env["PYTHONPYCACHEPREFIX"] = os.path.join(home, "pycache")
+    env["PATH"] = f"{home}{os.pathsep}{env['PATH']}"  # the servers are started as `smdv`
+    smdv = os.path.join(home, "smdv")
+    with open(smdv, "w") as file:
+        file.write(f'#!/bin/sh\nexec "{sys.executable}" "{DIRECTORY}/smdv.py" "$@"\n')
+    os.chmod(smdv, 0o755)
+    filename = os.path.join(home, "readme.md")
+    with open(filename, "w") as file:
+        file.write("# smdv benchmark\n")
+    ports = [free_port(), free_port()]
+    options = ["-H", home, "-p", str(ports[0]), "-w", str(ports[1]), "--no-browser"]
+    options += ["--pandoc-workers", "0", "--prefetch-budget", "0"]
+    null = subprocess.DEVNULL
+    run = lambda *argv: subprocess.run(
+        [smdv, *argv], env=env, stdin=null, stdout=null, stderr=null
+    )
+
+    def stop(*mode):
+        run("--stop", *options, *mode)
+        for port in ports:
+            for _ in range(100):
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                    if sock.connect_ex(("localhost", port)) != 0:
+                        break
+                time.sleep(0.05)
+
+    try:
+        run("--help")  # compile smdv
+        for name, mode in (("cold-start", []), ("cold-start-single", ["-s"])):
+            times[name] = median_time(
+                lambda: run(filename, *options, *mode).check_returncode(),
+                args.repeat,
+                teardown=lambda: stop(*mode),
+            )
+    finally:
+        stop()
+        shutil.rmtree(home, ignore_errors=True)
+    return times
+
+
+# a port nobody listens on
+def free_port() -> int:
+    """ ask the os for a free tcp port
+
+    Returns:
+        port: int: the free port
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+# main benchmark program
+def main() -> int:
+    """ run the requested benchmarks and compare them with their thresholds
+
+    Returns:
+        exit_status: 1 if a measurement exceeds its threshold, 0 otherwise
+    """
+    args = parse_args(sys.argv[1:])
+    thresholds = dict(THRESHOLDS)
+    for threshold in args.max:
+        name, _, seconds = threshold.partition("=")
+        thresholds[name] = float(seconds)
+    exit_status = 0
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        for measurement, seconds in BENCHMARKS[name](args).items():
+            maximum = thresholds.get(measurement, float("inf"))
+            failed = seconds > maximum
+            exit_status = exit_status or int(failed)
+            print(
+                f"{measurement:<16} {1000*seconds:8.1f} ms"
+                + (f"  (max {1000*maximum:.0f} ms)" if maximum < float("inf") else "")
+                + ("  FAILED" if failed else "")
+            )
+    return exit_status
+
+
+# time a callable
+def median_time(func: callable, repeat: int, teardown: callable = None) -> float:
+    """ median wall clock time of a callable
+
+    Args:
+        func: the callable to time
+        repeat: the number of times to call it
+        teardown: callable to call (untimed) after each call
+
+    Returns:
+        seconds: float: the median time (in seconds) of a call
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        if teardown is not None:
+            teardown()
+    return statistics.median(times)
+
+
+# parse the benchmark command line arguments
+def parse_args(args: tuple) -> argparse.Namespace:
+    """ populate the benchmark command line arguments
+
+    Args:
+        args: the arguments to parse
+
+    Returns:
+        parsed_args: the parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="smdv benchmarks")
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"the benchmarks to run: {', '.join(sorted(BENCHMARKS))} (default: all)",
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=10,
+        help="number of times each measurement is repeated (the median is reported)",
+    )
+    parser.add_argument(
+        "--max",
+        action="append",
+        default=[],
+        metavar="MEASUREMENT=SECONDS",
+        help=(
+            "set the threshold of a measurement, e.g. --max import=0.1. "
+            f"defaults: {', '.join(f'{k}={v}' for k, v in sorted(THRESHOLDS.items()))}"
+        ),
+    )
+    parsed_args = parser.parse_args(args=args)
+    for name in parsed_args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+    return parsed_args
+
+
+# time resolving the relative urls of a link heavy document
+@benchmark(**{"rewrite-urls": 0.15})
+def rewrite_urls_link_heavy(args: argparse.Namespace) -> dict:
+    """ time rewriting the urls of a rendered document with 20000 links
+
+    The links are a mix of relative files, markdown files, images, anchors
+    and absolute urls, such that every branch of the rewrite is taken.
+
+    Args:
+        args: the parsed command line arguments
+
+    Returns:
+        times: dict: the median time (in seconds) of each measurement
+    """
+    sys.path.insert(0, DIRECTORY)
+    import smdv
+
+    smdv.ARGS = smdv.parse_args([])
+    block = (
+        '<p>See <a href="other.md#usage">the usage</a>, <a href="data/table.csv">'
+        'the data</a>, <a href="#top">the top</a> and <a href="https://example.com">'
+        'the site</a>.</p>\n<p><img src="img/plot.png" alt="plot" /></p>\n'
+    )
+    html = block * 4000
+    return {
+        "rewrite-urls": median_time(
+            lambda: smdv.rewrite_urls(html, "/docs/"), args.repeat
+        )
+    }
+
+
+# time the startup of the command line client
+@benchmark(**{"import": 0.08, "round-trip": 0.02, "sync": 0.2})
+def startup(args: argparse.Namespace) -> dict:
+    """ time the command line client syncing a file to a running server
+
+    A websocket server is started in a temporary home directory. The
+    measurements are the time to import smdv (on top of starting the
+    interpreter), the local socket round trip and a full `smdv <file>`
+    invocation (what the sync on save autocmd pays).
+
+    Args:
+        args: the parsed command line arguments
+
+    Returns:
+        times: dict: the median time (in seconds) of each measurement
+    """
+    times = {}
+    home = tempfile.mkdtemp(prefix="smdv-benchmark-")
+    env = dict(os.environ, XDG_RUNTIME_DIR=home, SMDV_DEFAULT_ARGS="")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # time smdv as installed: compiled
+    env["PYTHONPYCACHEPREFIX"] = os.path.join(home, "pycache")
+    python = lambda *argv: subprocess.run(
+        [sys.executable, *argv], cwd=DIRECTORY, env=env, check=True
+    )
+    filename = os.path.join(home, "readme.md")
+    with open(filename, "w") as file:
+        file.write("# smdv benchmark\n")
+    options = ["-H", home, "-s", "-p", str(free_port()), "--no-browser"]
+
+    python("-c", "import smdv")  # compile smdv
+    interpreter = median_time(lambda: python("-c", "pass"), args.repeat)
+    times["import"] = max(
+        median_time(lambda: python("-c", "import smdv"), args.repeat) - interpreter, 0.0
+    )
+
+    read, write = os.pipe()
+    server = subprocess.Popen(
+        [sys.executable, "smdv.py", *options, "--start-websocket-server"]
+        + ["--no-watch", "--pandoc-workers", "0", "--prefetch-budget", "0"]
+        + ["--ready-fd", str(write)],
+        cwd=DIRECTORY,
+        env=env,
+        pass_fds=(write,),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    os.close(write)
+    try:
+        if not os.read(read, 64):
+            raise RuntimeError("the smdv websocket server could not be started")
+        sys.path.insert(0, DIRECTORY)
+        import smdv
+
+        os.environ["XDG_RUNTIME_DIR"] = home
+        smdv.ARGS = smdv.parse_args([filename, *options])
+        if smdv.send_filename_to_local_socket() is None:
+            raise RuntimeError("the smdv websocket server does not accept files")
+        times["round-trip"] = median_time(
+            smdv.send_filename_to_local_socket, args.repeat
+        )
+        times["sync"] = median_time(
+            lambda: python("smdv.py", filename, *options), args.repeat
+        )
+    finally:
+        os.close(read)
+        server.terminate()
+        server.wait()
+        shutil.rmtree(home, ignore_errors=True)
+    return times
+
+
+# time streaming documents through the renderer's stdin
+@benchmark(**{"stream-1MB": 0.015, "stream-10MB": 0.1, "stream-100MB": 1.0})
+def stream_stdin(args: argparse.Namespace) -> dict:
+    """ time streaming 1MB, 10MB and 100MB documents through a one-shot renderer
+
+    pandoc is replaced by `cat`, such that the measurements are the cost of
+    smdv streaming a document into the renderer's stdin and collecting its
+    output, and not the (much larger) cost of pandoc itself.
+
+    Args:
+        args: the parsed command line arguments
+
+    Returns:
+        times: dict: the median time (in seconds) of each measurement
+    """
+    times = {}
+    directory = tempfile.mkdtemp(prefix="smdv-benchmark-")
+    path = os.environ["PATH"]
+    try:
+        with open(os.path.join(directory, "pandoc"), "w") as file:
+            file.write("#!/bin/sh\nexec cat\n")
+        os.chmod(os.path.join(directory, "pandoc"), 0o755)
+        os.environ["PATH"] = f"{directory}{os.pathsep}{path}"
+        sys.path.insert(0, DIRECTORY)
+        import smdv
+
+        paragraph = "Some *markdown* with a [link](other.md) and `code` in it.\n\n"
+        for size in (1, 10, 100):
+            content = paragraph * (size * 2 ** 20 // len(paragraph))
+            times[f"stream-{size}MB"] = median_time(
+                lambda: smdv.pandoc(content), max(args.repeat // size, 1)
+            )
+    finally:
+        os.environ["PATH"] = path
+        shutil.rmtree(directory, ignore_errors=True)
+    return times
+
+
+# time rendering text and source files
+@benchmark(**{"txt2body": 0.015, "txt2body-numbered": 0.02})
+def txt2body(args: argparse.Namespace) -> dict:
+    """ time rendering a 1MB source file without pandoc
+
+    For comparison, the time of rendering it with pandoc as a code block
+    (the way text files used to be rendered) is reported as well, if pandoc
+    is installed.
+
+    Args:
+        args: the parsed command line arguments
+
+    Returns:
+        times: dict: the median time (in seconds) of each measurement
+    """
+    sys.path.insert(0, DIRECTORY)
+    import smdv
+
+    smdv.ARGS = smdv.parse_args([])
+    line = "    if left < right and right > 0:  # compare & return\n"
+    content = line * (2 ** 20 // len(line))
+    times = {"txt2body": median_time(lambda: smdv.txt2body(content), args.repeat)}
+    smdv.ARGS.line_numbers = True
+    times["txt2body-numbered"] = median_time(lambda: smdv.txt2body(content), args.repeat)
+    if shutil.which("pandoc"):
+        times["txt2body-pandoc"] = median_time(
+            lambda: smdv.pandoc(f"```\n{content}\n```"), max(args.repeat // 5, 1)
+        )
+    return times
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -29,18 +29,41 @@ import re
 import sys
 import json
 import time
+import base64
+import bisect
+import binascii
+import hashlib
 import socket
-import asyncio
+import struct
+import mmap
+import array
+import queue
+import select
+import signal
 import argparse
 import warnings
 import subprocess
 import webbrowser
+import importlib.util
+import threading
+import codecs
 import collections
-import http.client
-
-# 3rd party dependencies
-import flask
-import websockets
+import urllib.parse
+
+# python standard library, only used by the servers (imported by import_dependencies)
+# asyncio
+# concurrent.futures
+# ctypes.util
+# difflib
+# email.utils
+# http.client
+# mimetypes
+# multiprocessing
+
+# 3rd party dependencies (imported by import_dependencies)
+# flask
+# websockets
+# werkzeug (flask dependency)
 
 # 3rd party CLI dependencies
 # fuser
@@ -49,15 +72,43 @@ import websockets
 
 ## Globals
 ARGS = ""  # the smdv command line arguments
+flask = None  # the flask module (imported by import_dependencies)
+websockets = None  # the websockets module (imported by import_dependencies)
+werkzeug = None  # the werkzeug module (flask's http server, imported by import_dependencies)
 SMDV_DEFAULT_ARGS = os.environ.get("SMDV_DEFAULT_ARGS", "")  # default smdv arguments
-JSCLIENTS = set()  # jsclients wait for an update from the pyclient
 PYCLIENTS = set()  # pyclients update the html body of the jsclient
 WEBSOCKETS_SERVER = None  # websockets server
-BACKMESSAGES = collections.deque()  # for communication between js and py
-FORWARDMESSAGES = collections.deque()  # for communication between js and py
-EVENT_LOOP = asyncio.get_event_loop()
-
-MESSAGE = {}
+EVENT_LOOP = None  # the asyncio event loop (created by import_dependencies)
+RENDER_CACHE = None  # cache for rendered file bodies (created by the websocket server)
+RENDER_EXECUTOR = None  # thread pool for renders and scans (created by the websocket server)
+DIRECTORY_CACHE = None  # cache of directory listings (created on first use)
+IPYNB_LOCK = threading.Lock()  # guards the (re)start of the notebook worker
+IPYNB_WORKER = None  # process with a warm nbconvert exporter (started on first use)
+IPYNB_EXPORTER = None  # the nbconvert exporter (inside the notebook worker)
+PANDOC_POOL = None  # pool of long-lived pandoc servers (created by the websocket server)
+PANDOC_VERSION = None  # pandoc version string (part of the render cache key)
+SESSIONS = {}  # preview sessions (shown document, history and browsers), keyed by id
+PYCHANNEL = None  # persistent channel to the websocket server (created by the flask server)
+FLASK_SERVER = None  # the http server of the flask app (created by run_flask_server)
+FILE_WATCHER = None  # watcher of the open files (created by the websocket server)
+STREAM_SIZE = 2 ** 22  # documents larger than this are streamed to a one-shot pandoc
+LARGE_FILES = collections.OrderedDict()  # line indexes of the (recently) opened large files
+RESOURCE_STORE = None  # store of externalized plots and large outputs (created on first use)
+RESOURCE_LOCK = threading.Lock()  # guards the creation of the resource store
+RESOURCE_HTML_SIZE = 2 ** 18  # larger html outputs of notebooks are shown in an iframe
+DATA_URI_PATTERN = re.compile(  # embedded data (larger than 2KB) in src/href attributes
+    r"""(src|href)=(["'])data:([\w.+-]+/[\w.+-]+);base64,([A-Za-z0-9+/=\s]{2048,})\2"""
+)
+RESOURCE_URL_PATTERN = re.compile(  # urls of the resource store in rendered html
+    r"/@resource/([0-9a-f]{64}\.[A-Za-z0-9]+)"
+)
+URL_PATTERN = re.compile(r"""\b(src|href)=(["'])(.*?)\2""")  # urls of rendered html
+URL_SCHEME_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9+.-]*:")  # urls with a scheme
+PREFETCHER = None  # renders the documents opened next (created by the websocket server)
+PREFETCH_SIZE = 2 ** 20  # larger markdown files are not prefetched
+PREFETCH_RECENT = 4  # number of recently modified markdown files prefetched per directory
+PAGE_HTML = None  # html shell of the page (rendered once, at server start)
+ASSETS = {}  # stylesheets and scripts of the page, keyed by their content-hashed name
 
 ## Templates
 HTMLTEMPLATE = """
@@ -65,176 +116,7 @@ HTMLTEMPLATE = """
 <html>
     <head>
         <title>smdv {interactive} </title>
-        <link rel="stylesheet" href="{md_css_cdn}">
-        <style>
-            .markdown-body {{
-                box-sizing: border-box;
-                min-width: 200px;
-                max-width: 980px;
-                margin: 0 auto;
-                padding: 45px;
-            }}
-            @media (max-width: 767px) {{
-                .markdown-body {{
-                    padding: 15px;
-                }}
-            }}
-            .tooltip {{
-                position: relative;
-                display: inline-block;
-                color: #006080;
-                text-decoration: none;
-            }}
-            .tooltip .tooltiptext {{
-                visibility: hidden;
-                position: absolute;
-                width: 120px;
-                background-color: #555555;
-                color: #ffffff;
-                text-align: center;
-                padding: 5px 0;
-                border-radius: 6px;
-                z-index: 1;
-                opacity: 0;
-                transition: opacity 0.3s;
-            }}
-            .tooltip:hover .tooltiptext {{
-                visibility: visible;
-                opacity: 1;
-            }}
-            .tooltip-bottom {{
-                top: 135%;
-                left: 50%;
-                margin-left: -60px;
-            }}
-            .tooltip-bottom::after {{
-                content: "";
-                position: absolute;
-                bottom: 100%;
-                left: 50%;
-                margin-left: -5px;
-                border-width: 5px;
-                border-style: solid;
-                border-color: transparent transparent #555555 transparent;
-            }}
-            .tooltip-left {{
-                top: -5px;
-                bottom:auto;
-                right: 128%;
-            }}
-            .tooltip-left::after {{
-                content: "";
-                position: absolute;
-                top: 50%;
-                left: 100%;
-                margin-top: -5px;
-                border-width: 5px;
-                border-style: solid;
-                border-color: transparent transparent transparent #555555;
-            }}
-            .tooltip-right {{
-                top: -5px;
-                left: 125%;
-            }}
-            .tooltip-right::after {{
-                content: "";
-                position: absolute;
-                top: 50%;
-                right: 100%;
-                margin-top: -5px;
-                border-width: 5px;
-                border-style: solid;
-                border-color: transparent #555555 transparent transparent;
-            }}
-            #navbar {{
-                font-family: -apple-system,BlinkMacSystemFont,Segoe UI,Helvetica,Arial,sans-serif,Apple Color Emoji,Segoe UI Emoji,Segoe UI Symbol;
-                text-align: center;
-                height: 23px;
-                border-bottom: 1px dotted black;
-            }}
-            #notNavbar {{
-                font-family: -apple-system,BlinkMacSystemFont,Segoe UI,Helvetica,Arial,sans-serif,Apple Color Emoji,Segoe UI Emoji,Segoe UI Symbol;
-                text-align: right;
-                height: 0px;
-            }}
-            .input_area, .output_area{{
-              line-height: 1;
-            }}
-            .highlight {{
-              background: #fafafa;
-              border: #ccc;
-              border-radius: 5px;
-              padding-left: 10pt;
-            }}
-            .highlight .ge {{ font-style: italic }} /* Generic.Emph */
-            .highlight .gs {{ font-weight: bold }} /* Generic.Strong */
-            .highlight .hll {{ background-color: #ffffcc }}
-            /*.highlight .err {{ border: 1px solid #FF0000 }} /* Error */
-            .highlight .gr {{ color: #FF0000 }} /* Generic.Error */
-            .highlight .gh {{ color: #000080; font-weight: bold }} /* Generic.Heading */
-            .highlight .gp {{ color: #000080; font-weight: bold }} /* Generic.Prompt */
-            .highlight .gt {{ color: #0044DD }} /* Generic.Traceback */
-            .highlight .nc {{ color: #0000FF; font-weight: bold }} /* Name.Class */
-            .highlight .nf {{ color: #0000FF }} /* Name.Function */
-            .highlight .nn {{ color: #0000FF; font-weight: bold }} /* Name.Namespace */
-            .highlight .fm {{ color: #0000FF }} /* Name.Function.Magic */
-            .highlight .ss {{ color: #19177C }} /* Literal.String.Symbol */
-            .highlight .vc {{ color: #19177C }} /* Name.Variable.Class */
-            .highlight .vg {{ color: #19177C }} /* Name.Variable.Global */
-            .highlight .vi {{ color: #19177C }} /* Name.Variable.Instance */
-            .highlight .vm {{ color: #19177C }} /* Name.Variable.Magic */
-            .highlight .k {{ color: #1eaedb; font-weight: bold }} /* Keyword */
-            .highlight .kc {{ color: #1eaedb; font-weight: bold }} /* Keyword.Constant */
-            .highlight .kd {{ color: #1eaedb; font-weight: bold }} /* Keyword.Declaration */
-            .highlight .kn {{ color: #1eaedb; font-weight: bold }} /* Keyword.Namespace */
-            .highlight .kp {{ color: #1eaedb }} /* Keyword.Pseudo */
-            .highlight .kr {{ color: #1eaedb; font-weight: bold }} /* Keyword.Reserved */
-            .highlight .nb {{ color: #1eaedb }} /* Name.Builtin */
-            .highlight .nt {{ color: #1eaedb; font-weight: bold }} /* Name.Tag */
-            .highlight .sx {{ color: #1eaedb }} /* Literal.String.Other */
-            .highlight .bp {{ color: #1eaedb }} /* Name.Builtin.Pseudo */
-            .highlight .m {{ color: #1eaedc }} /* Literal.Number */
-            .highlight .mb {{ color: #1eaedc }} /* Literal.Number.Bin */
-            .highlight .mf {{ color: #1eaedc }} /* Literal.Number.Float */
-            .highlight .mh {{ color: #1eaedc }} /* Literal.Number.Hex */
-            .highlight .mi {{ color: #1eaedc }} /* Literal.Number.Integer */
-            .highlight .mo {{ color: #1eaedc }} /* Literal.Number.Oct */
-            .highlight .il {{ color: #1eaedc }} /* Literal.Number.Integer.Long */
-            .highlight .o {{ color: #00a000 }} /* Operator */
-            .highlight .gi {{ color: #00a000 }} /* Generic.Inserted */
-            .highlight .c {{ color: #408080; font-style: italic }} /* Comment */
-            .highlight .ch {{ color: #408080; font-style: italic }} /* Comment.Hashbang */
-            .highlight .cm {{ color: #408080; font-style: italic }} /* Comment.Multiline */
-            .highlight .cpf {{ color: #408080; font-style: italic }} /* Comment.PreprocFile */
-            .highlight .c1 {{ color: #408080; font-style: italic }} /* Comment.Single */
-            .highlight .cs {{ color: #408080; font-style: italic }} /* Comment.Special */
-            .highlight .cp {{ color: #BC7A00 }} /* Comment.Preproc */
-            .highlight .gd {{ color: #A00000 }} /* Generic.Deleted */
-            .highlight .go {{ color: #888888 }} /* Generic.Output */
-            .highlight .gu {{ color: #800080; font-weight: bold }} /* Generic.Subheading */
-            .highlight .kt {{ color: #B00040 }} /* Keyword.Type */
-            .highlight .s {{ color: #0fa0ce }} /* Literal.String */
-            .highlight .na {{ color: #7D9029 }} /* Name.Attribute */
-            .highlight .no {{ color: #880000 }} /* Name.Constant */
-            .highlight .nd {{ color: #AA22FF }} /* Name.Decorator */
-            .highlight .ni {{ color: #999999; font-weight: bold }} /* Name.Entity */
-            .highlight .ne {{ color: #D2413A; font-weight: bold }} /* Name.Exception */
-            .highlight .nl {{ color: #A0A000 }} /* Name.Label */
-            .highlight .nv {{ color: #19177C }} /* Name.Variable */
-            .highlight .ow {{ color: #AA22FF; font-weight: bold }} /* Operator.Word */
-            .highlight .w {{ color: #bbbbbb }} /* Text.Whitespace */
-            .highlight .sa {{ color: #0fa0ce }} /* Literal.String.Affix */
-            .highlight .sb {{ color: #0fa0ce }} /* Literal.String.Backtick */
-            .highlight .sc {{ color: #0fa0ce }} /* Literal.String.Char */
-            .highlight .dl {{ color: #0fa0ce }} /* Literal.String.Delimiter */
-            .highlight .sd {{ color: #0fa0ce; font-style: italic }} /* Literal.String.Doc */
-            .highlight .s2 {{ color: #0fa0ce }} /* Literal.String.Double */
-            .highlight .se {{ color: #BB6622; font-weight: bold }} /* Literal.String.Escape */
-            .highlight .sh {{ color: #0fa0ce }} /* Literal.String.Heredoc */
-            .highlight .si {{ color: #BB6688; font-weight: bold }} /* Literal.String.Interpol */
-            .highlight .sr {{ color: #BB6688 }} /* Literal.String.Regex */
-            .highlight .s1 {{ color: #0fa0ce }} /* Literal.String.Single */
-        </style>
+        {stylesheets}
     </head>
     <body>
         <div id="navbar">
@@ -261,233 +143,2178 @@ HTMLTEMPLATE = """
                 <span id="showNavbar"></span>
             </div>
         </div>
-        <div class="markdown-body" id="content"></div>
-        <script>
-            // global variables
-            var message = {{}};
-            var home = "{home}";
-            var websocket = new WebSocket("ws://{host}:{port}/");
-
-            // navbar elements
-            var showNavIf = function(element, condition, icon, tooltiptext, tooltipClass="tooltip-bottom", separator="&nbsp;\\n"){{ // &middot;
-                element.innerHTML = (condition) ? separator + "<a href=\\"#\\" class=\\"tooltip\\">"+icon+"<span class=\\"tooltiptext " + tooltipClass +"\\">" + tooltiptext + "</span></a>" : "";
-                element.style.display = (condition) ? "inline" : "none"
-            }}
-
-            // logging
-            var log_message = function() {{
-                for (var key in message) {{
-                    console.log(key, ":", message[key].toString().slice(0,20));
-                }}
-                console.log("\\n");
-            }}
-
-            // navbar
-            var updateNavbar = function () {{
-                var navbarIsHidden = (localStorage.navbarIsHidden == "true") ? true : false;
-                navbar.style.display = (navbarIsHidden) ? "none" : "block";
-                showNavIf(hideNavbar, !navbarIsHidden, "➖", "hide navbar", tooltipClass="tooltip-left");
-                showNavIf(showNavbar, navbarIsHidden, "➕", "show navbar", tooltipClass="tooltip-left");
-                showNavIf(closeFile, (message.fileOpen), "✖", "close file", tooltipClass="tooltip-right");
-                showNavIf(homeButton, (message.cwd != "/" && !message.fileOpen), "🏠", "home", tooltipClass="tooltip-right");
-                showNavIf(backButton, (!message.fileOpen), "⬅", "back", tooltipClass="tooltip-right");
-                showNavIf(upDirectory, (message.cwd != "/" && !message.fileOpen), "⬆", "folder up", tooltipClass="tooltip-right");
-                showNavIf(currentDirectory, true, "📁", "folder view", tooltipClass = "tooltip-right");
-                showNavIf(directoryLocation, true, message.cwd, home+message.cwd, tooltipClass = "tooltip-bottom", separator="");
-                showNavIf(showFile, message.filename, "📄", "file view", tooltipClass = "tooltip-bottom");
-                filenameTooltip = (message.filename == "@pipe") ? "content piped into smdv" : (message.filename == "@put") ? "content placed by PUT request": home + message.fileCwd + message.filename;
-                showNavIf(fileLocation, message.filename, message.filename, filenameTooltip, tooltipClass = "tooltip-bottom", separator="");
-                showNavIf(encodingType, (message.fileEncoding && message.fileOpen), "["+message.fileEncoding+"]", "file encoding", tooltipClass = "tooltip-bottom");
-                showNavIf(editFile, (message.fileOpen && message.filename != "@pipe" && message.filename != "@put"), "🖋", "edit", tooltipClass = "tooltip-bottom");
-            }}
-
-            // body
-            var updateBody = function () {{
-                if (message.fileOpen) {{
-                    document.getElementById("content").innerHTML = message.fileBody;
-                }} else {{
-                    document.getElementById("content").innerHTML = message.cwdBody;
-                }}
-            }}
-
-            // activate navbar
-            window.onload = function() {{
-                updateNavbar();
-                history.pushState({{}}, "", "/");
-            }}
-
-            // send message via websocket
-            sendMessage = function(msg) {{
-                msg.client = "js";
-                websocket.send(JSON.stringify(msg));
-            }}
-
-            // websockets
-            websocket.onopen = function() {{
-                // on first connection, let server know there is a new client
-                sendMessage({{"func":"newjsclient"}});
-            }}
-            websocket.onmessage = function (event) {{
-                // parse message
-                message = JSON.parse(event.data);
-                localStorage.pressedButton = "false";
-
-                // update page
-                updateBody()
-                updateNavbar()
-
-                // change browser url
-                // history.pushState({{}}, '');
-                url = (message.fileOpen) ? message.cwd + message.filename : message.cwd
-                history.pushState({{url:url}}, url, url);
-                // window.history.replaceState({{}}, "", url);
-
-                // scroll marker into view
-                marker = document.getElementById("marker");
-                if (marker) {{
-                     marker.scrollIntoView();
-                }}
-            }}
-
-            // navbar
-            homeButton.onclick = function() {{
-                if (message.cwd != "/") {{
-                    message.func = "dir";
-                    message.cwd = "/";
-                    message.cwdBody = "";
-                    message.cwdEncoded = false;
-                    message.fileOpen = false;
-                    sendMessage(message);
-                }}
-            }}
-            backButton.onclick = function() {{
-                sendMessage({{"func":"back"}});
-            }}
-            currentDirectory.onclick = directoryLocation.onclick = function() {{
-                if (message.fileOpen) {{
-                    message.func = "dir";
-                    message.fileOpen = false;
-                    sendMessage(message);
-                }}
-            }}
-            showFile.onclick = fileLocation.onclick = function() {{
-                if (!message.fileOpen) {{
-                    message.fileOpen = true;
-                    message.cwd = message.fileCwd;
-                    message.cwdEncoded = false;
-                    sendMessage(message);
-                }}
-            }}
-            upDirectory.onclick = function() {{
-                if (!message.fileOpen) {{
-                    message.func = "dir";
-                    message.cwd = message.cwd.slice(0, message.cwd.slice(0, -1).lastIndexOf("/"))+"/";
-                    message.cwdBody = "";
-                    message.cwdEncoded = false;
-                    message.fileOpen = false;
-                    sendMessage(message);
-                }}
-            }}
-            closeFile.onclick = function() {{
-                if (message.fileOpen) {{
-                    message.func = "dir";
-                    message.fileOpen = false;
-                    message.filename = "";
-                    message.fileBody = "";
-                    message.fileCwd = "";
-                    message.fileEncoding = "";
-                    message.fileOpen = false;
-                    message.forceClose = true;
-                    sendMessage(message);
-                }}
-            }}
-            showNavbar.onclick = hideNavbar.onclick = function() {{
-                localStorage.navbarIsHidden = (localStorage.navbarIsHidden == "true") ? "false" : "true";
-                window.onload();
-            }}
-            encodingType.onclick = function() {{
-            }}
-            editFile.onclick = function() {{
-                sendMessage({{"func":"editFile"}});
-            }}
-
-        </script>
+        <div class="markdown-body" id="content">
+            <div id="fileView"></div>
+            <div id="dirView"></div>
+        </div>
+        <script src="{script}"></script>
     </body>
 </html>
 """
 
+STYLESHEET = """
+.markdown-body {
+    box-sizing: border-box;
+    min-width: 200px;
+    max-width: 980px;
+    margin: 0 auto;
+    padding: 45px;
+}
+@media (max-width: 767px) {
+    .markdown-body {
+        padding: 15px;
+    }
+}
+.tooltip {
+    position: relative;
+    display: inline-block;
+    color: #006080;
+    text-decoration: none;
+}
+.tooltip .tooltiptext {
+    visibility: hidden;
+    position: absolute;
+    width: 120px;
+    background-color: #555555;
+    color: #ffffff;
+    text-align: center;
+    padding: 5px 0;
+    border-radius: 6px;
+    z-index: 1;
+    opacity: 0;
+    transition: opacity 0.3s;
+}
+.tooltip:hover .tooltiptext {
+    visibility: visible;
+    opacity: 1;
+}
+.tooltip-bottom {
+    top: 135%;
+    left: 50%;
+    margin-left: -60px;
+}
+.tooltip-bottom::after {
+    content: "";
+    position: absolute;
+    bottom: 100%;
+    left: 50%;
+    margin-left: -5px;
+    border-width: 5px;
+    border-style: solid;
+    border-color: transparent transparent #555555 transparent;
+}
+.tooltip-left {
+    top: -5px;
+    bottom:auto;
+    right: 128%;
+}
+.tooltip-left::after {
+    content: "";
+    position: absolute;
+    top: 50%;
+    left: 100%;
+    margin-top: -5px;
+    border-width: 5px;
+    border-style: solid;
+    border-color: transparent transparent transparent #555555;
+}
+.tooltip-right {
+    top: -5px;
+    left: 125%;
+}
+.tooltip-right::after {
+    content: "";
+    position: absolute;
+    top: 50%;
+    right: 100%;
+    margin-top: -5px;
+    border-width: 5px;
+    border-style: solid;
+    border-color: transparent #555555 transparent transparent;
+}
+#navbar {
+    font-family: -apple-system,BlinkMacSystemFont,Segoe UI,Helvetica,Arial,sans-serif,Apple Color Emoji,Segoe UI Emoji,Segoe UI Symbol;
+    text-align: center;
+    height: 23px;
+    border-bottom: 1px dotted black;
+}
+#notNavbar {
+    font-family: -apple-system,BlinkMacSystemFont,Segoe UI,Helvetica,Arial,sans-serif,Apple Color Emoji,Segoe UI Emoji,Segoe UI Symbol;
+    text-align: right;
+    height: 0px;
+}
+#fileView > .smdv-block:first-child > *:first-child {
+    margin-top: 0 !important;
+}
+#dirFilter {
+    width: 100%;
+    margin-bottom: 8px;
+}
+#textLine {
+    margin-bottom: 8px;
+}
+.smdv-window {
+    position: relative;
+}
+.smdv-rows {
+    position: absolute;
+    left: 0;
+    right: 0;
+}
+.smdv-row {
+    height: 24px;
+    line-height: 24px;
+    white-space: nowrap;
+    overflow: hidden;
+}
+#textWindow .smdv-row {
+    font-family: monospace;
+    white-space: pre;
+}
+.smdv-stream pre {
+    margin-bottom: 0;
+    border-radius: 0;
+    padding-top: 0;
+    padding-bottom: 0;
+}
+code.smdv-numbered {
+    counter-reset: smdv-line;
+}
+.smdv-line::before {
+    counter-increment: smdv-line;
+    content: counter(smdv-line);
+    display: inline-block;
+    width: 4em;
+    margin-right: 1em;
+    text-align: right;
+    color: #999999;
+    user-select: none;
+}
+.input_area, .output_area{
+  line-height: 1;
+}
+.highlight {
+  background: #fafafa;
+  border: #ccc;
+  border-radius: 5px;
+  padding-left: 10pt;
+}
+.highlight .ge { font-style: italic } /* Generic.Emph */
+.highlight .gs { font-weight: bold } /* Generic.Strong */
+.highlight .hll { background-color: #ffffcc }
+/*.highlight .err { border: 1px solid #FF0000 } /* Error */
+.highlight .gr { color: #FF0000 } /* Generic.Error */
+.highlight .gh { color: #000080; font-weight: bold } /* Generic.Heading */
+.highlight .gp { color: #000080; font-weight: bold } /* Generic.Prompt */
+.highlight .gt { color: #0044DD } /* Generic.Traceback */
+.highlight .nc { color: #0000FF; font-weight: bold } /* Name.Class */
+.highlight .nf { color: #0000FF } /* Name.Function */
+.highlight .nn { color: #0000FF; font-weight: bold } /* Name.Namespace */
+.highlight .fm { color: #0000FF } /* Name.Function.Magic */
+.highlight .ss { color: #19177C } /* Literal.String.Symbol */
+.highlight .vc { color: #19177C } /* Name.Variable.Class */
+.highlight .vg { color: #19177C } /* Name.Variable.Global */
+.highlight .vi { color: #19177C } /* Name.Variable.Instance */
+.highlight .vm { color: #19177C } /* Name.Variable.Magic */
+.highlight .k { color: #1eaedb; font-weight: bold } /* Keyword */
+.highlight .kc { color: #1eaedb; font-weight: bold } /* Keyword.Constant */
+.highlight .kd { color: #1eaedb; font-weight: bold } /* Keyword.Declaration */
+.highlight .kn { color: #1eaedb; font-weight: bold } /* Keyword.Namespace */
+.highlight .kp { color: #1eaedb } /* Keyword.Pseudo */
+.highlight .kr { color: #1eaedb; font-weight: bold } /* Keyword.Reserved */
+.highlight .nb { color: #1eaedb } /* Name.Builtin */
+.highlight .nt { color: #1eaedb; font-weight: bold } /* Name.Tag */
+.highlight .sx { color: #1eaedb } /* Literal.String.Other */
+.highlight .bp { color: #1eaedb } /* Name.Builtin.Pseudo */
+.highlight .m { color: #1eaedc } /* Literal.Number */
+.highlight .mb { color: #1eaedc } /* Literal.Number.Bin */
+.highlight .mf { color: #1eaedc } /* Literal.Number.Float */
+.highlight .mh { color: #1eaedc } /* Literal.Number.Hex */
+.highlight .mi { color: #1eaedc } /* Literal.Number.Integer */
+.highlight .mo { color: #1eaedc } /* Literal.Number.Oct */
+.highlight .il { color: #1eaedc } /* Literal.Number.Integer.Long */
+.highlight .o { color: #00a000 } /* Operator */
+.highlight .gi { color: #00a000 } /* Generic.Inserted */
+.highlight .c { color: #408080; font-style: italic } /* Comment */
+.highlight .ch { color: #408080; font-style: italic } /* Comment.Hashbang */
+.highlight .cm { color: #408080; font-style: italic } /* Comment.Multiline */
+.highlight .cpf { color: #408080; font-style: italic } /* Comment.PreprocFile */
+.highlight .c1 { color: #408080; font-style: italic } /* Comment.Single */
+.highlight .cs { color: #408080; font-style: italic } /* Comment.Special */
+.highlight .cp { color: #BC7A00 } /* Comment.Preproc */
+.highlight .gd { color: #A00000 } /* Generic.Deleted */
+.highlight .go { color: #888888 } /* Generic.Output */
+.highlight .gu { color: #800080; font-weight: bold } /* Generic.Subheading */
+.highlight .kt { color: #B00040 } /* Keyword.Type */
+.highlight .s { color: #0fa0ce } /* Literal.String */
+.highlight .na { color: #7D9029 } /* Name.Attribute */
+.highlight .no { color: #880000 } /* Name.Constant */
+.highlight .nd { color: #AA22FF } /* Name.Decorator */
+.highlight .ni { color: #999999; font-weight: bold } /* Name.Entity */
+.highlight .ne { color: #D2413A; font-weight: bold } /* Name.Exception */
+.highlight .nl { color: #A0A000 } /* Name.Label */
+.highlight .nv { color: #19177C } /* Name.Variable */
+.highlight .ow { color: #AA22FF; font-weight: bold } /* Operator.Word */
+.highlight .w { color: #bbbbbb } /* Text.Whitespace */
+.highlight .sa { color: #0fa0ce } /* Literal.String.Affix */
+.highlight .sb { color: #0fa0ce } /* Literal.String.Backtick */
+.highlight .sc { color: #0fa0ce } /* Literal.String.Char */
+.highlight .dl { color: #0fa0ce } /* Literal.String.Delimiter */
+.highlight .sd { color: #0fa0ce; font-style: italic } /* Literal.String.Doc */
+.highlight .s2 { color: #0fa0ce } /* Literal.String.Double */
+.highlight .se { color: #BB6622; font-weight: bold } /* Literal.String.Escape */
+.highlight .sh { color: #0fa0ce } /* Literal.String.Heredoc */
+.highlight .si { color: #BB6688; font-weight: bold } /* Literal.String.Interpol */
+.highlight .sr { color: #BB6688 } /* Literal.String.Regex */
+.highlight .s1 { color: #0fa0ce } /* Literal.String.Single */
+"""
+
+JSTEMPLATE = """
+// global variables
+var message = {{}};
+var version = 0;  // version of the message (delta protocol)
+var home = "{home}";
+var session = new URLSearchParams(location.search).get("session") || "";
+var query = (session) ? "?session=" + encodeURIComponent(session) : "";
+var websocket = new WebSocket("ws://{host}:{port}/");
+
+// navbar elements
+var showNavIf = function(element, condition, icon, tooltiptext, tooltipClass="tooltip-bottom", separator="&nbsp;\\n"){{ // &middot;
+    element.innerHTML = (condition) ? separator + "<a href=\\"#\\" class=\\"tooltip\\">"+icon+"<span class=\\"tooltiptext " + tooltipClass +"\\">" + tooltiptext + "</span></a>" : "";
+    element.style.display = (condition) ? "inline" : "none"
+}}
+
+// logging
+var log_message = function() {{
+    for (var key in message) {{
+        console.log(key, ":", message[key].toString().slice(0,20));
+    }}
+    console.log("\\n");
+}}
+
+// navbar
+var updateNavbar = function () {{
+    var navbarIsHidden = (localStorage.navbarIsHidden == "true") ? true : false;
+    navbar.style.display = (navbarIsHidden) ? "none" : "block";
+    showNavIf(hideNavbar, !navbarIsHidden, "➖", "hide navbar", tooltipClass="tooltip-left");
+    showNavIf(showNavbar, navbarIsHidden, "➕", "show navbar", tooltipClass="tooltip-left");
+    showNavIf(closeFile, (message.fileOpen), "✖", "close file", tooltipClass="tooltip-right");
+    showNavIf(homeButton, (message.cwd != "/" && !message.fileOpen), "🏠", "home", tooltipClass="tooltip-right");
+    showNavIf(backButton, (!message.fileOpen), "⬅", "back", tooltipClass="tooltip-right");
+    showNavIf(upDirectory, (message.cwd != "/" && !message.fileOpen), "⬆", "folder up", tooltipClass="tooltip-right");
+    showNavIf(currentDirectory, true, "📁", "folder view", tooltipClass = "tooltip-right");
+    showNavIf(directoryLocation, true, message.cwd, home+message.cwd, tooltipClass = "tooltip-bottom", separator="");
+    showNavIf(showFile, message.filename, "📄", "file view", tooltipClass = "tooltip-bottom");
+    filenameTooltip = (message.filename == "@pipe") ? "content piped into smdv" : (message.filename == "@put") ? "content placed by PUT request": home + message.fileCwd + message.filename;
+    showNavIf(fileLocation, message.filename, message.filename, filenameTooltip, tooltipClass = "tooltip-bottom", separator="");
+    showNavIf(encodingType, (message.fileEncoding && message.fileOpen), "["+message.fileEncoding+"]", "file encoding", tooltipClass = "tooltip-bottom");
+    showNavIf(editFile, (message.fileOpen && message.filename != "@pipe" && message.filename != "@put"), "🖋", "edit", tooltipClass = "tooltip-bottom");
+}}
+
+// body
+var updateBody = function (changed) {{
+    if ("fileBody" in changed) {{
+        fileView.innerHTML = message.fileBody;
+    }}
+    if ("cwdBody" in changed) {{
+        dirView.innerHTML = message.cwdBody;
+    }}
+    if ("fileBody" in changed || "cwdBody" in changed) {{
+        setupWindows();
+    }}
+    fileView.style.display = (message.fileOpen) ? "block" : "none";
+    dirView.style.display = (message.fileOpen) ? "none" : "block";
+    renderWindows();
+}}
+
+// large folders and large text files: only the rows in view are
+// rendered. They are fetched from the server in pages (folder rows
+// optionally filtered by prefix)
+var rowHeight = 24;  // see .smdv-row
+var maxHeight = 1e7;  // browsers don't support (much) higher elements
+var windowScale = function (total) {{
+    // the number of pixels of content per pixel of scrollbar
+    return Math.max(1, total * rowHeight / maxHeight);
+}}
+var windows = {{}};  // page func -> pages (null while requested), total, filter
+var setupWindows = function () {{
+    windows = {{}};
+    for (var view of document.getElementsByClassName("smdv-window")) {{
+        windows[view.dataset.func] = {{
+            "pages": {{}},
+            "total": parseInt(view.dataset.total),
+            "filter": "",
+        }};
+    }}
+    var dirFilter = document.getElementById("dirFilter");
+    if (dirFilter) {{
+        dirFilter.oninput = function () {{
+            windows.dirPage.filter = this.value;
+            windows.dirPage.pages = {{}};
+            window.scrollTo(0, 0);
+            renderWindows();
+        }};
+    }}
+    var textLine = document.getElementById("textLine");
+    if (textLine) {{
+        textLine.onchange = function () {{
+            var view = document.getElementById("textWindow");
+            var line = Math.max(parseInt(this.value) || 1, 1);
+            var scale = windowScale(windows.textPage.total);
+            window.scrollTo(0, view.offsetTop + (line - 1) * rowHeight / scale);
+        }};
+    }}
+}}
+var requestPage = function (view, page) {{
+    var pageSize = parseInt(view.dataset.page);
+    var state = windows[view.dataset.func];
+    state.pages[page] = null;
+    sendMessage({{
+        "func": view.dataset.func,
+        "key": view.dataset.key,
+        "start": page * pageSize,
+        "count": pageSize,
+        "filter": state.filter,
+    }});
+}}
+var renderWindow = function (view) {{
+    var state = windows[view.dataset.func];
+    var pageSize = parseInt(view.dataset.page);
+    var scale = windowScale(state.total);
+    var top = Math.max(0, window.scrollY - view.offsetTop);
+    var first = Math.max(0, Math.floor(top * scale / rowHeight) - 20);
+    var last = Math.min(state.total, Math.ceil((top * scale + window.innerHeight) / rowHeight) + 20);
+    var rows = [];
+    for (var i = first; i < last; i++) {{
+        var page = Math.floor(i / pageSize);
+        if (!(page in state.pages)) {{
+            requestPage(view, page);
+        }}
+        var row = (state.pages[page]) ? state.pages[page][i - page * pageSize] : "";
+        rows.push("<div class='smdv-row'>" + (row || "") + "</div>");
+    }}
+    if (!(0 in state.pages)) {{
+        requestPage(view, 0);  // to learn the (filtered) number of rows
+    }}
+    view.style.height = (state.total * rowHeight / scale) + "px";
+    view.firstElementChild.style.top = (top - (top * scale - first * rowHeight)) + "px";
+    view.firstElementChild.innerHTML = rows.join("");
+}}
+var renderWindows = function () {{
+    for (var view of document.getElementsByClassName("smdv-window")) {{
+        if (view.offsetParent !== null && view.dataset.func in windows) {{
+            renderWindow(view);  // only the visible ones
+        }}
+    }}
+}}
+var receivePage = function (page) {{
+    var state = windows[page.func];
+    var view = document.querySelector(".smdv-window[data-func='" + page.func + "']");
+    if (!view || !state || page.key != view.dataset.key || page.filter != state.filter) {{
+        return;  // the folder, file or filter changed in the meantime
+    }}
+    state.pages[Math.floor(page.start / parseInt(view.dataset.page))] = page.rows;
+    state.total = page.total;
+    renderWindows();
+}}
+var scheduled = false;
+window.onscroll = function () {{
+    if (!scheduled) {{
+        scheduled = true;
+        window.requestAnimationFrame(function () {{
+            scheduled = false;
+            renderWindows();
+        }});
+    }}
+}}
+
+// apply a block patch to the file view (operations are sorted back to front)
+var patchBody = function (patch) {{
+    for (var op of patch) {{
+        for (var i = 0; i < op.remove; i++) {{
+            fileView.removeChild(fileView.children[op.index]);
+        }}
+        var fragment = document.createElement("template");
+        fragment.innerHTML = op.insert.join("");
+        fileView.insertBefore(fragment.content, fileView.children[op.index] || null);
+    }}
+}}
+
+// activate navbar
+window.onload = function() {{
+    updateNavbar();
+    history.pushState({{}}, "", "/" + query);
+}}
+
+// links to other pages of smdv open in the session of this page
+document.addEventListener("click", function(event) {{
+    var link = event.target.closest ? event.target.closest("a[href]") : null;
+    if (session && link && link.port == location.port && link.pathname.indexOf("/@") != 0) {{
+        link.search = query;
+    }}
+}});
+
+// send message via websocket
+sendMessage = function(msg) {{
+    msg.client = "js";
+    msg.session = session;
+    websocket.send(JSON.stringify(msg));
+}}
+
+// ask the server to change the current view. The local message is not
+// modified: it always reflects what the server sent us. The file body
+// is kept by the server, so there is no need to send it back.
+sendChanges = function(changes) {{
+    sendMessage(Object.assign({{}}, message, {{"fileBody": ""}}, changes));
+}}
+
+// websockets
+websocket.onopen = function() {{
+    // on first connection, let server know there is a new client
+    sendMessage({{"func":"newjsclient"}});
+}}
+websocket.onmessage = function (event) {{
+    // parse message
+    var update = JSON.parse(event.data);
+    if (update.func == "dirPage" || update.func == "textPage") {{
+        receivePage(update);
+        return;
+    }}
+    var changed = Object.assign({{}}, update);  // the fields that changed
+    if ("delta" in update) {{
+        // delta protocol: only the changed fields are sent
+        if (update.base != 0 && update.base != version) {{
+            sendMessage({{"func":"resync"}});  // we missed an update
+            return;
+        }}
+        version = update.version;
+        changed = update.delta;
+        update = Object.assign({{}}, (update.base == 0) ? {{}} : message, update.delta);
+    }}
+    if ("filePatch" in changed) {{
+        if (changed.fileBase != message.fileHash) {{
+            // we don't have the blocks this patch applies to
+            sendMessage({{"func":"resync"}});
+            return;
+        }}
+        patchBody(changed.filePatch);
+        delete update.filePatch;
+        delete update.fileBase;
+        delete changed.fileBody;
+        update.fileBody = "";  // the server keeps the full body
+    }}
+    message = update;
+    localStorage.pressedButton = "false";
+
+    // update page (streamed content is followed when scrolled to the end)
+    var bottom = window.innerHeight + window.scrollY >= document.body.scrollHeight - 2;
+    updateBody(changed)
+    updateNavbar()
+    if (message.fileStream && bottom) {{
+        window.scrollTo(0, document.body.scrollHeight);
+    }}
+
+    // change browser url
+    // history.pushState({{}}, '');
+    url = (message.fileOpen) ? message.cwd + message.filename : message.cwd
+    history.pushState({{url:url}}, url, url + query);
+    // window.history.replaceState({{}}, "", url);
+
+    // scroll marker into view
+    marker = document.getElementById("marker");
+    if (marker) {{
+         marker.scrollIntoView();
+    }}
+}}
+
+// navbar
+homeButton.onclick = function() {{
+    if (message.cwd != "/") {{
+        sendChanges({{
+            "func": "dir",
+            "cwd": "/",
+            "cwdBody": "",
+            "cwdEncoded": false,
+            "fileOpen": false,
+        }});
+    }}
+}}
+backButton.onclick = function() {{
+    sendMessage({{"func":"back"}});
+}}
+currentDirectory.onclick = directoryLocation.onclick = function() {{
+    if (message.fileOpen) {{
+        sendChanges({{"func": "dir", "fileOpen": false}});
+    }}
+}}
+showFile.onclick = fileLocation.onclick = function() {{
+    if (!message.fileOpen) {{
+        sendChanges({{"fileOpen": true, "cwd": message.fileCwd, "cwdEncoded": false}});
+    }}
+}}
+upDirectory.onclick = function() {{
+    if (!message.fileOpen) {{
+        sendChanges({{
+            "func": "dir",
+            "cwd": message.cwd.slice(0, message.cwd.slice(0, -1).lastIndexOf("/"))+"/",
+            "cwdBody": "",
+            "cwdEncoded": false,
+            "fileOpen": false,
+        }});
+    }}
+}}
+closeFile.onclick = function() {{
+    if (message.fileOpen) {{
+        sendChanges({{
+            "func": "dir",
+            "fileOpen": false,
+            "filename": "",
+            "fileBody": "",
+            "fileCwd": "",
+            "fileEncoding": "",
+            "forceClose": true,
+        }});
+    }}
+}}
+showNavbar.onclick = hideNavbar.onclick = function() {{
+    localStorage.navbarIsHidden = (localStorage.navbarIsHidden == "true") ? "false" : "true";
+    window.onload();
+}}
+encodingType.onclick = function() {{
+}}
+editFile.onclick = function() {{
+    sendMessage({{"func":"editFile"}});
+}}
+"""
+
+# github-markdown-css (light variant), vendored so that smdv works offline.
+# The MIT licensed stylesheet is by Sindre Sorhus (https://github.com/sindresorhus/github-markdown-css).
+MARKDOWN_STYLESHEET = """
+/*! github-markdown-css | MIT License | (c) Sindre Sorhus <sindresorhus@gmail.com> (https://sindresorhus.com) */
+.markdown-body{--base-size-4: 0.25rem;--base-size-8: 0.5rem;--base-size-16: 1rem;--base-text-weight-normal: 400;--base-text-weight-medium: 500;--base-text-weight-semibold: 600;--fontStack-monospace: ui-monospace, SFMono-Regular, SF Mono, Menlo, Consolas, Liberation Mono, monospace}
+.markdown-body{color-scheme:light;--focus-outlineColor: #0969da;--fgColor-default: #1f2328;--fgColor-muted: #636c76;--fgColor-accent: #0969da;--fgColor-success: #1a7f37;--fgColor-attention: #9a6700;--fgColor-danger: #d1242f;--fgColor-done: #8250df;--bgColor-default: #ffffff;--bgColor-muted: #f6f8fa;--bgColor-neutral-muted: #afb8c133;--bgColor-attention-muted: #fff8c5;--borderColor-default: #d0d7de;--borderColor-muted: #d0d7deb3;--borderColor-neutral-muted: #afb8c133;--borderColor-accent-emphasis: #0969da;--borderColor-success-emphasis: #1a7f37;--borderColor-attention-emphasis: #bf8700;--borderColor-danger-emphasis: #cf222e;--borderColor-done-emphasis: #8250df;--color-prettylights-syntax-comment: #57606a;--color-prettylights-syntax-constant: #0550ae;--color-prettylights-syntax-constant-other-reference-link: #0a3069;--color-prettylights-syntax-entity: #6639ba;--color-prettylights-syntax-storage-modifier-import: #24292f;--color-prettylights-syntax-entity-tag: #0550ae;--color-prettylights-syntax-keyword: #cf222e;--color-prettylights-syntax-string: #0a3069;--color-prettylights-syntax-variable: #953800;--color-prettylights-syntax-brackethighlighter-unmatched: #82071e;--color-prettylights-syntax-brackethighlighter-angle: #57606a;--color-prettylights-syntax-invalid-illegal-text: #f6f8fa;--color-prettylights-syntax-invalid-illegal-bg: #82071e;--color-prettylights-syntax-carriage-return-text: #f6f8fa;--color-prettylights-syntax-carriage-return-bg: #cf222e;--color-prettylights-syntax-string-regexp: #116329;--color-prettylights-syntax-markup-list: #3b2300;--color-prettylights-syntax-markup-heading: #0550ae;--color-prettylights-syntax-markup-italic: #24292f;--color-prettylights-syntax-markup-bold: #24292f;--color-prettylights-syntax-markup-deleted-text: #82071e;--color-prettylights-syntax-markup-deleted-bg: #ffebe9;--color-prettylights-syntax-markup-inserted-text: #116329;--color-prettylights-syntax-markup-inserted-bg: #dafbe1;--color-prettylights-syntax-markup-changed-text: #953800;--color-prettylights-syntax-markup-changed-bg: #ffd8b5;--color-prettylights-syntax-markup-ignored-text: #eaeef2;--color-prettylights-syntax-markup-ignored-bg: #0550ae;--color-prettylights-syntax-meta-diff-range: #8250df;--color-prettylights-syntax-sublimelinter-gutter-mark: #8c959f}
+.markdown-body{-ms-text-size-adjust:100%;-webkit-text-size-adjust:100%;margin:0;color:var(--fgColor-default);background-color:var(--bgColor-default);font-family:-apple-system,BlinkMacSystemFont,"Segoe UI","Noto Sans",Helvetica,Arial,sans-serif,"Apple Color Emoji","Segoe UI Emoji";font-size:16px;line-height:1.5;word-wrap:break-word;scroll-behavior:auto}
+.markdown-body .octicon{display:inline-block;fill:currentColor;vertical-align:text-bottom}
+.markdown-body h1:hover .anchor .octicon-link:before,.markdown-body h2:hover .anchor .octicon-link:before,.markdown-body h3:hover .anchor .octicon-link:before,.markdown-body h4:hover .anchor .octicon-link:before,.markdown-body h5:hover .anchor .octicon-link:before,.markdown-body h6:hover .anchor .octicon-link:before{width:16px;height:16px;content:" ";display:inline-block;background-color:currentColor;-webkit-mask-image:url("data:image/svg+xml,<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 16 16' version='1.1' aria-hidden='true'><path fill-rule='evenodd' d='M7.775 3.275a.75.75 0 001.06 1.06l1.25-1.25a2 2 0 112.83 2.83l-2.5 2.5a2 2 0 01-2.83 0 .75.75 0 00-1.06 1.06 3.5 3.5 0 004.95 0l2.5-2.5a3.5 3.5 0 00-4.95-4.95l-1.25 1.25zm-4.69 9.64a2 2 0 010-2.83l2.5-2.5a2 2 0 012.83 0 .75.75 0 001.06-1.06 3.5 3.5 0 00-4.95 0l-2.5 2.5a3.5 3.5 0 004.95 4.95l1.25-1.25a.75.75 0 00-1.06-1.06l-1.25 1.25a2 2 0 01-2.83 0z'></path></svg>");mask-image:url("data:image/svg+xml,<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 16 16' version='1.1' aria-hidden='true'><path fill-rule='evenodd' d='M7.775 3.275a.75.75 0 001.06 1.06l1.25-1.25a2 2 0 112.83 2.83l-2.5 2.5a2 2 0 01-2.83 0 .75.75 0 00-1.06 1.06 3.5 3.5 0 004.95 0l2.5-2.5a3.5 3.5 0 00-4.95-4.95l-1.25 1.25zm-4.69 9.64a2 2 0 010-2.83l2.5-2.5a2 2 0 012.83 0 .75.75 0 001.06-1.06 3.5 3.5 0 00-4.95 0l-2.5 2.5a3.5 3.5 0 004.95 4.95l1.25-1.25a.75.75 0 00-1.06-1.06l-1.25 1.25a2 2 0 01-2.83 0z'></path></svg>")}
+.markdown-body details,.markdown-body figcaption,.markdown-body figure{display:block}
+.markdown-body summary{display:list-item}
+.markdown-body [hidden]{display:none !important}
+.markdown-body a{background-color:transparent;color:var(--fgColor-accent);text-decoration:none}
+.markdown-body abbr[title]{border-bottom:none;-webkit-text-decoration:underline dotted;text-decoration:underline dotted}
+.markdown-body b,.markdown-body strong{font-weight:var(--base-text-weight-semibold, 600)}
+.markdown-body dfn{font-style:italic}
+.markdown-body h1{margin:.67em 0;font-weight:var(--base-text-weight-semibold, 600);padding-bottom:.3em;font-size:2em;border-bottom:1px solid var(--borderColor-muted)}
+.markdown-body mark{background-color:var(--bgColor-attention-muted);color:var(--fgColor-default)}
+.markdown-body small{font-size:90%}
+.markdown-body sub,.markdown-body sup{font-size:75%;line-height:0;position:relative;vertical-align:baseline}
+.markdown-body sub{bottom:-0.25em}
+.markdown-body sup{top:-0.5em}
+.markdown-body img{border-style:none;max-width:100%;box-sizing:content-box;background-color:var(--bgColor-default)}
+.markdown-body code,.markdown-body kbd,.markdown-body pre,.markdown-body samp{font-family:monospace;font-size:1em}
+.markdown-body figure{margin:1em 40px}
+.markdown-body hr{box-sizing:content-box;overflow:hidden;background:transparent;border-bottom:1px solid var(--borderColor-muted);height:.25em;padding:0;margin:24px 0;background-color:var(--borderColor-default);border:0}
+.markdown-body input{font:inherit;margin:0;overflow:visible;font-family:inherit;font-size:inherit;line-height:inherit}
+.markdown-body [type=button],.markdown-body [type=reset],.markdown-body [type=submit]{-webkit-appearance:button;appearance:button}
+.markdown-body [type=checkbox],.markdown-body [type=radio]{box-sizing:border-box;padding:0}
+.markdown-body [type=number]::-webkit-inner-spin-button,.markdown-body [type=number]::-webkit-outer-spin-button{height:auto}
+.markdown-body [type=search]::-webkit-search-cancel-button,.markdown-body [type=search]::-webkit-search-decoration{-webkit-appearance:none;appearance:none}
+.markdown-body ::-webkit-input-placeholder{color:inherit;opacity:.54}
+.markdown-body ::-webkit-file-upload-button{-webkit-appearance:button;appearance:button;font:inherit}
+.markdown-body a:hover{text-decoration:underline}
+.markdown-body ::placeholder{color:var(--fgColor-muted);opacity:1}
+.markdown-body hr::before{display:table;content:""}
+.markdown-body hr::after{display:table;clear:both;content:""}
+.markdown-body table{border-spacing:0;border-collapse:collapse;display:block;width:max-content;max-width:100%;overflow:auto}
+.markdown-body td,.markdown-body th{padding:0}
+.markdown-body details summary{cursor:pointer}
+.markdown-body details:not([open])>*:not(summary){display:none}
+.markdown-body a:focus,.markdown-body [role=button]:focus,.markdown-body input[type=radio]:focus,.markdown-body input[type=checkbox]:focus{outline:2px solid var(--focus-outlineColor);outline-offset:-2px;box-shadow:none}
+.markdown-body a:focus:not(:focus-visible),.markdown-body [role=button]:focus:not(:focus-visible),.markdown-body input[type=radio]:focus:not(:focus-visible),.markdown-body input[type=checkbox]:focus:not(:focus-visible){outline:solid 1px transparent}
+.markdown-body a:focus-visible,.markdown-body [role=button]:focus-visible,.markdown-body input[type=radio]:focus-visible,.markdown-body input[type=checkbox]:focus-visible{outline:2px solid var(--focus-outlineColor);outline-offset:-2px;box-shadow:none}
+.markdown-body a:not([class]):focus,.markdown-body a:not([class]):focus-visible,.markdown-body input[type=radio]:focus,.markdown-body input[type=radio]:focus-visible,.markdown-body input[type=checkbox]:focus,.markdown-body input[type=checkbox]:focus-visible{outline-offset:0}
+.markdown-body kbd{display:inline-block;padding:3px 5px;font:11px var(--fontStack-monospace, ui-monospace, SFMono-Regular, SF Mono, Menlo, Consolas, Liberation Mono, monospace);line-height:10px;color:var(--fgColor-default);vertical-align:middle;background-color:var(--bgColor-muted);border:solid 1px var(--borderColor-neutral-muted);border-bottom-color:var(--borderColor-neutral-muted);border-radius:6px;box-shadow:inset 0 -1px 0 var(--borderColor-neutral-muted)}
+.markdown-body h1,.markdown-body h2,.markdown-body h3,.markdown-body h4,.markdown-body h5,.markdown-body h6{margin-top:24px;margin-bottom:16px;font-weight:var(--base-text-weight-semibold, 600);line-height:1.25}
+.markdown-body h2{font-weight:var(--base-text-weight-semibold, 600);padding-bottom:.3em;font-size:1.5em;border-bottom:1px solid var(--borderColor-muted)}
+.markdown-body h3{font-weight:var(--base-text-weight-semibold, 600);font-size:1.25em}
+.markdown-body h4{font-weight:var(--base-text-weight-semibold, 600);font-size:1em}
+.markdown-body h5{font-weight:var(--base-text-weight-semibold, 600);font-size:.875em}
+.markdown-body h6{font-weight:var(--base-text-weight-semibold, 600);font-size:.85em;color:var(--fgColor-muted)}
+.markdown-body p{margin-top:0;margin-bottom:10px}
+.markdown-body blockquote{margin:0;padding:0 1em;color:var(--fgColor-muted);border-left:.25em solid var(--borderColor-default)}
+.markdown-body ul,.markdown-body ol{margin-top:0;margin-bottom:0;padding-left:2em}
+.markdown-body ol ol,.markdown-body ul ol{list-style-type:lower-roman}
+.markdown-body ul ul ol,.markdown-body ul ol ol,.markdown-body ol ul ol,.markdown-body ol ol ol{list-style-type:lower-alpha}
+.markdown-body dd{margin-left:0}
+.markdown-body tt,.markdown-body code,.markdown-body samp{font-family:var(--fontStack-monospace, ui-monospace, SFMono-Regular, SF Mono, Menlo, Consolas, Liberation Mono, monospace);font-size:12px}
+.markdown-body pre{margin-top:0;margin-bottom:0;font-family:var(--fontStack-monospace, ui-monospace, SFMono-Regular, SF Mono, Menlo, Consolas, Liberation Mono, monospace);font-size:12px;word-wrap:normal}
+.markdown-body .octicon{display:inline-block;overflow:visible !important;vertical-align:text-bottom;fill:currentColor}
+.markdown-body input::-webkit-outer-spin-button,.markdown-body input::-webkit-inner-spin-button{margin:0;-webkit-appearance:none;appearance:none}
+.markdown-body .mr-2{margin-right:var(--base-size-8, 8px) !important}
+.markdown-body::before{display:table;content:""}
+.markdown-body::after{display:table;clear:both;content:""}
+.markdown-body>*:first-child{margin-top:0 !important}
+.markdown-body>*:last-child{margin-bottom:0 !important}
+.markdown-body a:not([href]){color:inherit;text-decoration:none}
+.markdown-body .absent{color:var(--fgColor-danger)}
+.markdown-body .anchor{float:left;padding-right:4px;margin-left:-20px;line-height:1}
+.markdown-body .anchor:focus{outline:none}
+.markdown-body p,.markdown-body blockquote,.markdown-body ul,.markdown-body ol,.markdown-body dl,.markdown-body table,.markdown-body pre,.markdown-body details{margin-top:0;margin-bottom:16px}
+.markdown-body blockquote>:first-child{margin-top:0}
+.markdown-body blockquote>:last-child{margin-bottom:0}
+.markdown-body h1 .octicon-link,.markdown-body h2 .octicon-link,.markdown-body h3 .octicon-link,.markdown-body h4 .octicon-link,.markdown-body h5 .octicon-link,.markdown-body h6 .octicon-link{color:var(--fgColor-default);vertical-align:middle;visibility:hidden}
+.markdown-body h1:hover .anchor,.markdown-body h2:hover .anchor,.markdown-body h3:hover .anchor,.markdown-body h4:hover .anchor,.markdown-body h5:hover .anchor,.markdown-body h6:hover .anchor{text-decoration:none}
+.markdown-body h1:hover .anchor .octicon-link,.markdown-body h2:hover .anchor .octicon-link,.markdown-body h3:hover .anchor .octicon-link,.markdown-body h4:hover .anchor .octicon-link,.markdown-body h5:hover .anchor .octicon-link,.markdown-body h6:hover .anchor .octicon-link{visibility:visible}
+.markdown-body h1 tt,.markdown-body h1 code,.markdown-body h2 tt,.markdown-body h2 code,.markdown-body h3 tt,.markdown-body h3 code,.markdown-body h4 tt,.markdown-body h4 code,.markdown-body h5 tt,.markdown-body h5 code,.markdown-body h6 tt,.markdown-body h6 code{padding:0 .2em;font-size:inherit}
+.markdown-body summary h1,.markdown-body summary h2,.markdown-body summary h3,.markdown-body summary h4,.markdown-body summary h5,.markdown-body summary h6{display:inline-block}
+.markdown-body summary h1 .anchor,.markdown-body summary h2 .anchor,.markdown-body summary h3 .anchor,.markdown-body summary h4 .anchor,.markdown-body summary h5 .anchor,.markdown-body summary h6 .anchor{margin-left:-40px}
+.markdown-body summary h1,.markdown-body summary h2{padding-bottom:0;border-bottom:0}
+.markdown-body ul.no-list,.markdown-body ol.no-list{padding:0;list-style-type:none}
+.markdown-body ol[type="a s"]{list-style-type:lower-alpha}
+.markdown-body ol[type="A s"]{list-style-type:upper-alpha}
+.markdown-body ol[type="i s"]{list-style-type:lower-roman}
+.markdown-body ol[type="I s"]{list-style-type:upper-roman}
+.markdown-body ol[type="1"]{list-style-type:decimal}
+.markdown-body div>ol:not([type]){list-style-type:decimal}
+.markdown-body ul ul,.markdown-body ul ol,.markdown-body ol ol,.markdown-body ol ul{margin-top:0;margin-bottom:0}
+.markdown-body li>p{margin-top:16px}
+.markdown-body li+li{margin-top:.25em}
+.markdown-body dl{padding:0}
+.markdown-body dl dt{padding:0;margin-top:16px;font-size:1em;font-style:italic;font-weight:var(--base-text-weight-semibold, 600)}
+.markdown-body dl dd{padding:0 16px;margin-bottom:16px}
+.markdown-body table th{font-weight:var(--base-text-weight-semibold, 600)}
+.markdown-body table th,.markdown-body table td{padding:6px 13px;border:1px solid var(--borderColor-default)}
+.markdown-body table td>:last-child{margin-bottom:0}
+.markdown-body table tr{background-color:var(--bgColor-default);border-top:1px solid var(--borderColor-muted)}
+.markdown-body table tr:nth-child(2n){background-color:var(--bgColor-muted)}
+.markdown-body table img{background-color:transparent}
+.markdown-body img[align=right]{padding-left:20px}
+.markdown-body img[align=left]{padding-right:20px}
+.markdown-body .emoji{max-width:none;vertical-align:text-top;background-color:transparent}
+.markdown-body span.frame{display:block;overflow:hidden}
+.markdown-body span.frame>span{display:block;float:left;width:auto;padding:7px;margin:13px 0 0;overflow:hidden;border:1px solid var(--borderColor-default)}
+.markdown-body span.frame span img{display:block;float:left}
+.markdown-body span.frame span span{display:block;padding:5px 0 0;clear:both;color:var(--fgColor-default)}
+.markdown-body span.align-center{display:block;overflow:hidden;clear:both}
+.markdown-body span.align-center>span{display:block;margin:13px auto 0;overflow:hidden;text-align:center}
+.markdown-body span.align-center span img{margin:0 auto;text-align:center}
+.markdown-body span.align-right{display:block;overflow:hidden;clear:both}
+.markdown-body span.align-right>span{display:block;margin:13px 0 0;overflow:hidden;text-align:right}
+.markdown-body span.align-right span img{margin:0;text-align:right}
+.markdown-body span.float-left{display:block;float:left;margin-right:13px;overflow:hidden}
+.markdown-body span.float-left span{margin:13px 0 0}
+.markdown-body span.float-right{display:block;float:right;margin-left:13px;overflow:hidden}
+.markdown-body span.float-right>span{display:block;margin:13px auto 0;overflow:hidden;text-align:right}
+.markdown-body code,.markdown-body tt{padding:.2em .4em;margin:0;font-size:85%;white-space:break-spaces;background-color:var(--bgColor-neutral-muted);border-radius:6px}
+.markdown-body code br,.markdown-body tt br{display:none}
+.markdown-body del code{text-decoration:inherit}
+.markdown-body samp{font-size:85%}
+.markdown-body pre code{font-size:100%}
+.markdown-body pre>code{padding:0;margin:0;word-break:normal;white-space:pre;background:transparent;border:0}
+.markdown-body .highlight{margin-bottom:16px}
+.markdown-body .highlight pre{margin-bottom:0;word-break:normal}
+.markdown-body .highlight pre,.markdown-body pre{padding:16px;overflow:auto;font-size:85%;line-height:1.45;color:var(--fgColor-default);background-color:var(--bgColor-muted);border-radius:6px}
+.markdown-body pre code,.markdown-body pre tt{display:inline;max-width:auto;padding:0;margin:0;overflow:visible;line-height:inherit;word-wrap:normal;background-color:transparent;border:0}
+.markdown-body .csv-data td,.markdown-body .csv-data th{padding:5px;overflow:hidden;font-size:12px;line-height:1;text-align:left;white-space:nowrap}
+.markdown-body .csv-data .blob-num{padding:10px 8px 9px;text-align:right;background:var(--bgColor-default);border:0}
+.markdown-body .csv-data tr{border-top:0}
+.markdown-body .csv-data th{font-weight:var(--base-text-weight-semibold, 600);background:var(--bgColor-muted);border-top:0}
+.markdown-body [data-footnote-ref]::before{content:"["}
+.markdown-body [data-footnote-ref]::after{content:"]"}
+.markdown-body .footnotes{font-size:12px;color:var(--fgColor-muted);border-top:1px solid var(--borderColor-default)}
+.markdown-body .footnotes ol{padding-left:16px}
+.markdown-body .footnotes ol ul{display:inline-block;padding-left:16px;margin-top:16px}
+.markdown-body .footnotes li{position:relative}
+.markdown-body .footnotes li:target::before{position:absolute;top:-8px;right:-8px;bottom:-8px;left:-24px;pointer-events:none;content:"";border:2px solid var(--borderColor-accent-emphasis);border-radius:6px}
+.markdown-body .footnotes li:target{color:var(--fgColor-default)}
+.markdown-body .footnotes .data-footnote-backref g-emoji{font-family:monospace}
+.markdown-body .pl-c{color:var(--color-prettylights-syntax-comment)}
+.markdown-body .pl-c1,.markdown-body .pl-s .pl-v{color:var(--color-prettylights-syntax-constant)}
+.markdown-body .pl-e,.markdown-body .pl-en{color:var(--color-prettylights-syntax-entity)}
+.markdown-body .pl-smi,.markdown-body .pl-s .pl-s1{color:var(--color-prettylights-syntax-storage-modifier-import)}
+.markdown-body .pl-ent{color:var(--color-prettylights-syntax-entity-tag)}
+.markdown-body .pl-k{color:var(--color-prettylights-syntax-keyword)}
+.markdown-body .pl-s,.markdown-body .pl-pds,.markdown-body .pl-s .pl-pse .pl-s1,.markdown-body .pl-sr,.markdown-body .pl-sr .pl-cce,.markdown-body .pl-sr .pl-sre,.markdown-body .pl-sr .pl-sra{color:var(--color-prettylights-syntax-string)}
+.markdown-body .pl-v,.markdown-body .pl-smw{color:var(--color-prettylights-syntax-variable)}
+.markdown-body .pl-bu{color:var(--color-prettylights-syntax-brackethighlighter-unmatched)}
+.markdown-body .pl-ii{color:var(--color-prettylights-syntax-invalid-illegal-text);background-color:var(--color-prettylights-syntax-invalid-illegal-bg)}
+.markdown-body .pl-c2{color:var(--color-prettylights-syntax-carriage-return-text);background-color:var(--color-prettylights-syntax-carriage-return-bg)}
+.markdown-body .pl-sr .pl-cce{font-weight:bold;color:var(--color-prettylights-syntax-string-regexp)}
+.markdown-body .pl-ml{color:var(--color-prettylights-syntax-markup-list)}
+.markdown-body .pl-mh,.markdown-body .pl-mh .pl-en,.markdown-body .pl-ms{font-weight:bold;color:var(--color-prettylights-syntax-markup-heading)}
+.markdown-body .pl-mi{font-style:italic;color:var(--color-prettylights-syntax-markup-italic)}
+.markdown-body .pl-mb{font-weight:bold;color:var(--color-prettylights-syntax-markup-bold)}
+.markdown-body .pl-md{color:var(--color-prettylights-syntax-markup-deleted-text);background-color:var(--color-prettylights-syntax-markup-deleted-bg)}
+.markdown-body .pl-mi1{color:var(--color-prettylights-syntax-markup-inserted-text);background-color:var(--color-prettylights-syntax-markup-inserted-bg)}
+.markdown-body .pl-mc{color:var(--color-prettylights-syntax-markup-changed-text);background-color:var(--color-prettylights-syntax-markup-changed-bg)}
+.markdown-body .pl-mi2{color:var(--color-prettylights-syntax-markup-ignored-text);background-color:var(--color-prettylights-syntax-markup-ignored-bg)}
+.markdown-body .pl-mdr{font-weight:bold;color:var(--color-prettylights-syntax-meta-diff-range)}
+.markdown-body .pl-ba{color:var(--color-prettylights-syntax-brackethighlighter-angle)}
+.markdown-body .pl-sg{color:var(--color-prettylights-syntax-sublimelinter-gutter-mark)}
+.markdown-body .pl-corl{text-decoration:underline;color:var(--color-prettylights-syntax-constant-other-reference-link)}
+.markdown-body [role=button]:focus:not(:focus-visible),.markdown-body [role=tabpanel][tabindex="0"]:focus:not(:focus-visible),.markdown-body button:focus:not(:focus-visible),.markdown-body summary:focus:not(:focus-visible),.markdown-body a:focus:not(:focus-visible){outline:none;box-shadow:none}
+.markdown-body [tabindex="0"]:focus:not(:focus-visible),.markdown-body details-dialog:focus:not(:focus-visible){outline:none}
+.markdown-body g-emoji{display:inline-block;min-width:1ch;font-family:"Apple Color Emoji","Segoe UI Emoji","Segoe UI Symbol";font-size:1em;font-style:normal !important;font-weight:var(--base-text-weight-normal, 400);line-height:1;vertical-align:-0.075em}
+.markdown-body g-emoji img{width:1em;height:1em}
+.markdown-body .task-list-item{list-style-type:none}
+.markdown-body .task-list-item label{font-weight:var(--base-text-weight-normal, 400)}
+.markdown-body .task-list-item.enabled label{cursor:pointer}
+.markdown-body .task-list-item+.task-list-item{margin-top:var(--base-size-4)}
+.markdown-body .task-list-item .handle{display:none}
+.markdown-body .task-list-item-checkbox{margin:0 .2em .25em -1.4em;vertical-align:middle}
+.markdown-body .contains-task-list:dir(rtl) .task-list-item-checkbox{margin:0 -1.6em .25em .2em}
+.markdown-body .contains-task-list{position:relative}
+.markdown-body .contains-task-list:hover .task-list-item-convert-container,.markdown-body .contains-task-list:focus-within .task-list-item-convert-container{display:block;width:auto;height:24px;overflow:visible;clip:auto}
+.markdown-body ::-webkit-calendar-picker-indicator{filter:invert(50%)}
+.markdown-body .markdown-alert{padding:var(--base-size-8) var(--base-size-16);margin-bottom:var(--base-size-16);color:inherit;border-left:.25em solid var(--borderColor-default)}
+.markdown-body .markdown-alert>:first-child{margin-top:0}
+.markdown-body .markdown-alert>:last-child{margin-bottom:0}
+.markdown-body .markdown-alert .markdown-alert-title{display:flex;font-weight:var(--base-text-weight-medium, 500);align-items:center;line-height:1}
+.markdown-body .markdown-alert.markdown-alert-note{border-left-color:var(--borderColor-accent-emphasis)}
+.markdown-body .markdown-alert.markdown-alert-note .markdown-alert-title{color:var(--fgColor-accent)}
+.markdown-body .markdown-alert.markdown-alert-important{border-left-color:var(--borderColor-done-emphasis)}
+.markdown-body .markdown-alert.markdown-alert-important .markdown-alert-title{color:var(--fgColor-done)}
+.markdown-body .markdown-alert.markdown-alert-warning{border-left-color:var(--borderColor-attention-emphasis)}
+.markdown-body .markdown-alert.markdown-alert-warning .markdown-alert-title{color:var(--fgColor-attention)}
+.markdown-body .markdown-alert.markdown-alert-tip{border-left-color:var(--borderColor-success-emphasis)}
+.markdown-body .markdown-alert.markdown-alert-tip .markdown-alert-title{color:var(--fgColor-success)}
+.markdown-body .markdown-alert.markdown-alert-caution{border-left-color:var(--borderColor-danger-emphasis)}
+.markdown-body .markdown-alert.markdown-alert-caution .markdown-alert-title{color:var(--fgColor-danger)}
+.markdown-body>*:first-child>.heading-element:first-child{margin-top:0 !important}
+"""
+
+
+## Classes (alphabetic)
+
+# cache of directory listings
+class DirectoryCache:
+    """ cache of directory listings, keyed by directory
+
+    A listing is rebuilt only when the modification time of its directory
+    changed (i.e. when an entry was added, removed or renamed). Listings of
+    directories that were modified less than a second ago are not trusted,
+    as a second change could happen within the resolution of the timestamp.
+
+    Args:
+        maxsize: the maximum number of directory listings to keep
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.listings = collections.OrderedDict()  # path -> (mtime, listing)
+        self.lock = threading.Lock()  # listings are built in several threads
+        self.stats = collections.Counter(hits=0, misses=0, evictions=0, invalidations=0)
+
+    def get(self, path: str) -> "DirectoryListing":
+        """ get the listing of a directory, rebuilding it if the directory changed
+
+        Args:
+            path: the absolute path of the directory
+
+        Returns:
+            listing: DirectoryListing: the directory listing
+        """
+        stat = os.stat(path)
+        mtime = stat.st_mtime_ns
+        with self.lock:
+            listing = self.listings.get(path)
+            if listing is not None and listing[0] == mtime:
+                self.listings.move_to_end(path)
+                self.stats["hits"] += 1
+                return listing[1]
+        self.stats["misses"] += 1
+        listing = scan_directory(path)
+        if time.time() - stat.st_mtime < 1.0:
+            return listing
+        with self.lock:
+            self.listings[path] = (mtime, listing)
+            self.listings.move_to_end(path)
+            while len(self.listings) > self.maxsize:
+                self.listings.popitem(last=False)
+                self.stats["evictions"] += 1
+        return listing
+
+    def invalidate(self, path: str):
+        """ drop the listing of a directory
+
+        Args:
+            path: the absolute path of the directory
+        """
+        with self.lock:
+            if self.listings.pop(path, None) is not None:
+                self.stats["invalidations"] += 1
+
+    def info(self) -> dict:
+        """ the cache statistics
+
+        Returns:
+            info: dictionary with hit/miss/eviction counters and the cache size
+        """
+        return dict(self.stats, size=len(self.listings), maxsize=self.maxsize)
+
+
+# the rows of a directory listing: directories first, both sorted by their key
+DirectoryListing = collections.namedtuple("DirectoryListing", ["keys", "rows", "ndirs"])
+
+
+# watcher of the open files
+class FileWatcher:
+    """ watch the open files with inotify and reload them when they change
+
+    Many editors save by writing a temporary file and renaming it over the
+    original, which replaces the inode of the file. Therefore the directory
+    of a file is watched, and its events are filtered by filename. A burst
+    of events results in a single reload, once the file stayed untouched for
+    the debounce time.
+
+    Args:
+        callback: coroutine function, called with the path of the changed file
+        debounce: the time (in seconds) the file should stay untouched before reloading
+
+    Raises:
+        OSError: if inotify is not available
+    """
+
+    # inotify constants (see inotify(7))
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, callback: callable, debounce: float = 0.1):
+        self.callback = callback
+        self.debounce = debounce
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify is not available")
+        self.watches = {}  # directory -> its watch descriptor
+        self.filenames = {}  # watch descriptor -> (directory, names of its watched files)
+        self.pending = {}  # path -> the scheduled (debounced) reload
+        self.stats = collections.Counter(events=0, reloads=0)
+        asyncio.get_event_loop().add_reader(self.fd, self._read)
+
+    def _read(self):
+        """ read the inotify events and schedule a reload if the watched file changed """
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = struct.unpack_from("iIII", data, offset)
+            name = os.fsdecode(data[offset + 16 : offset + 16 + length].rstrip(b"\0"))
+            offset += 16 + length
+            directory, filenames = self.filenames.get(wd, ("", ()))
+            if name in filenames:
+                self.stats["events"] += 1
+                changed.add(os.path.join(directory, name))
+        for path in changed:
+            if path in self.pending:
+                self.pending[path].cancel()
+            loop = asyncio.get_event_loop()
+            self.pending[path] = loop.call_later(self.debounce, self._reload, path)
+
+    def _reload(self, path: str):
+        """ reload a watched file """
+        self.pending.pop(path, None)
+        self.stats["reloads"] += 1
+        asyncio.ensure_future(self.callback(path))
+
+    def watch(self, paths: set):
+        """ watch a set of files (in stead of the currently watched files)
+
+        Args:
+            paths: the absolute paths of the files to watch
+        """
+        directories = collections.defaultdict(set)
+        for path in paths:
+            directory, filename = os.path.split(path)
+            directories[directory].add(filename)
+        for directory in set(self.watches) - set(directories):
+            wd = self.watches.pop(directory)
+            self.filenames.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+        for directory, filenames in directories.items():
+            if directory not in self.watches:
+                wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+                if wd < 0:
+                    continue  # e.g. the directory was removed
+                self.watches[directory] = wd
+            self.filenames[self.watches[directory]] = (directory, filenames)
+
+    def info(self) -> dict:
+        """ the watcher statistics
+
+        Returns:
+            info: dictionary with the watched files and event/reload counters
+        """
+        paths = [
+            os.path.join(directory, filename)
+            for directory, filenames in self.filenames.values()
+            for filename in sorted(filenames)
+        ]
+        return dict(self.stats, paths=paths)
+
+
+# sparse line index of a large text file
+class LargeTextFile:
+    """ sparse line index of a large text file, read through mmap
+
+    Only the offset of the first line starting in each block of the file is
+    kept, such that the index stays small regardless of the size of the
+    file. A range of lines is read by scanning forward from the nearest
+    indexed line. Data appended to the file (e.g. a growing log) is indexed
+    incrementally.
+
+    Args:
+        path: the absolute path of the file
+        blocksize: the size (in bytes) of the blocks of the file
+    """
+
+    def __init__(self, path: str, blocksize: int = 2 ** 16):
+        self.path = path
+        self.blocksize = blocksize
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """ forget the index """
+        self.inode = None
+        self.size = 0  # number of bytes indexed
+        self.newlines = 0  # number of newlines in the indexed bytes
+        self.numbers = array.array("q", [0])  # line numbers of the indexed lines
+        self.offsets = array.array("q", [0])  # offsets of the indexed lines
+        self.terminated = True  # whether the indexed data ends with a newline
+
+    def refresh(self) -> int:
+        """ index the file (again) if it changed
+
+        Returns:
+            lines: int: the number of lines in the file
+        """
+        with self.lock:
+            stat = os.stat(self.path)
+            if stat.st_ino != self.inode or stat.st_size < self.size:
+                self._reset()  # replaced or truncated
+                self.inode = stat.st_ino
+            if stat.st_size > self.size:
+                with open(self.path, "rb") as file:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        size = min(stat.st_size, len(data))
+                        for start in range(self.size, size, self.blocksize):
+                            block = data[start : min(start + self.blocksize, size)]
+                            first = block.find(b"\n")
+                            if first >= 0 and start + first + 1 < size:
+                                self.numbers.append(self.newlines + 1)
+                                self.offsets.append(start + first + 1)
+                            self.newlines += block.count(b"\n")
+                        self.size = size
+                        self.terminated = data[size - 1 : size] == b"\n"
+            return self.newlines + int(not self.terminated)
+
+    def lines(self, start: int, count: int) -> list:
+        """ read a range of lines
+
+        Args:
+            start: the index of the first line
+            count: the number of lines to read
+
+        Returns:
+            lines: list: the lines (decoded, without newline)
+        """
+        with self.lock:
+            i = bisect.bisect_right(self.numbers, start) - 1
+            number, offset = self.numbers[i], self.offsets[i]
+            size = self.size
+        if not size:
+            return []
+        lines = []
+        with open(self.path, "rb") as file:
+            if not os.fstat(file.fileno()).st_size:
+                return []  # truncated in the meantime
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                size = min(size, len(data))
+                while number < start and offset < size:
+                    end = data.find(b"\n", offset, size)
+                    offset = size if end < 0 else end + 1
+                    number += 1
+                while len(lines) < count and offset < size:
+                    end = data.find(b"\n", offset, size)
+                    end = size if end < 0 else end
+                    lines.append(data[offset:end].rstrip(b"\r").decode(errors="replace"))
+                    offset = end + 1
+        return lines
+
+
+# latest-wins outbox of a js client
+class Outbox:
+    """ latest-wins outbox of a js client
+
+    A broadcast only marks the outbox as pending. The outbox then sends a
+    single frame that brings the client up to date with the latest message,
+    such that intermediate updates are dropped for clients that can't keep
+    up, and one slow client never delays the others. A client that doesn't
+    accept a frame within the send timeout is disconnected.
+
+    Args:
+        client: the js client (websocket) to send the frames to
+        session: the session the js client shows
+        timeout: the maximum time (in seconds) sending a single frame may take
+    """
+
+    def __init__(
+        self,
+        client: "websockets.WebSocketServerProtocol",
+        session: "Session",
+        timeout: float = 10.0,
+    ):
+        self.client = client
+        self.session = session
+        self.timeout = timeout
+        self.pending = asyncio.Event()
+        self.stats = collections.Counter(sent=0, dropped=0, stalled=0)
+        self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        """ send the latest frame each time the outbox is notified """
+        while True:
+            await self.pending.wait()
+            self.pending.clear()
+            version = self.session.jsstate.get(self.client, (0, {}))[0]
+            frame = js_frame(self.session, self.client)
+            if not frame:
+                continue
+            if version:
+                self.stats["dropped"] += max(self.session.version - version - 1, 0)
+            try:
+                await asyncio.wait_for(self.client.send(frame), self.timeout)
+                self.stats["sent"] += 1
+            except asyncio.TimeoutError:
+                self.stats["stalled"] += 1
+                await self.client.close(code=1008, reason="client too slow")
+                return
+            except websockets.ConnectionClosed:
+                return
+
+    def notify(self):
+        """ notify the outbox that there is a new message """
+        self.pending.set()
+
+    def close(self):
+        """ stop sending frames """
+        self.task.cancel()
+
+    def info(self) -> dict:
+        """ the outbox statistics
+
+        Returns:
+            info: dictionary with the queue depth, buffered bytes and send/drop counters
+        """
+        transport = getattr(self.client, "transport", None)
+        return dict(
+            self.stats,
+            address=str(getattr(self.client, "remote_address", "")),
+            version=self.session.jsstate.get(self.client, (0, {}))[0],
+            queueDepth=int(self.pending.is_set()),
+            bufferedBytes=transport.get_write_buffer_size() if transport else 0,
+        )
+
+
+# a long-lived pandoc server process and a (keep-alive) connection to it
+PandocWorker = collections.namedtuple(
+    "PandocWorker", ["process", "port", "connection", "started"]
+)
+
+
+# pool of long-lived pandoc servers
+class PandocPool:
+    """ pool of long-lived `pandoc server` processes
+
+    Starting pandoc is the most expensive part of rendering a small
+    document. This pool keeps a few pandoc servers warm and sends each
+    conversion to an idle one over a keep-alive http connection. Crashed
+    or unresponsive workers are restarted by a periodic health check. If
+    a pandoc server can't be started (e.g. pandoc older than 2.19, or built
+    without server support), no new one is tried for a while.
+
+    Args:
+        size: the number of pandoc servers to keep running
+        timeout: the maximum time (in seconds) a single conversion may take
+        interval: the time (in seconds) between two health checks
+    """
+
+    def __init__(self, size: int = 2, timeout: float = 30.0, interval: float = 5.0):
+        self.size = size
+        self.timeout = timeout
+        self.interval = interval
+        self.idle = queue.Queue()
+        self.stats = collections.Counter(
+            conversions=0, failures=0, restarts=0, spawn_failures=0
+        )
+        self.stopped = threading.Event()
+        self.backoff = 0.0  # no pandoc server is spawned before this time
+
+    def _spawn(self) -> PandocWorker:
+        """ spawn a new pandoc server on a free port (and wait until it answers requests)
+
+        Raises:
+            ConnectionError: if the pandoc server could not be started
+        """
+        if time.time() < self.backoff:
+            raise ConnectionError("pandoc server failed to start recently")
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        command = ["pandoc", "server", "--port", str(port), "--timeout", str(int(self.timeout))]
+        try:
+            with open(os.devnull, "w") as null:
+                process = subprocess.Popen(
+                    command, stdout=null, stderr=null, preexec_fn=die_with_parent
+                )
+        except OSError as e:  # no pandoc at all
+            self.stats["spawn_failures"] += 1
+            self.backoff = time.time() + 12 * self.interval
+            raise ConnectionError(f"pandoc server could not be started: {e}")
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=self.timeout)
+        worker = PandocWorker(process, port, connection, time.time())
+        deadline = time.time() + min(self.timeout, 10.0)
+        while process.poll() is None and time.time() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            except OSError:
+                time.sleep(0.01)
+                continue
+            if self._healthy(worker):  # some builds accept connections but can't serve
+                return worker
+            break
+        self._kill(worker)
+        self.stats["spawn_failures"] += 1
+        self.backoff = time.time() + 12 * self.interval
+        raise ConnectionError("pandoc server did not start (pandoc 2.19+ is required)")
+
+    def _restart(self, worker: PandocWorker) -> PandocWorker:
+        """ replace a (crashed) worker by a fresh one
+
+        Raises:
+            ConnectionError: if no new pandoc server could be started
+        """
+        self._kill(worker)
+        worker = self._spawn()
+        self.stats["restarts"] += 1
+        return worker
+
+    def _kill(self, worker: PandocWorker):
+        """ stop a worker """
+        worker.connection.close()
+        if worker.process.poll() is None:
+            worker.process.kill()
+            worker.process.wait()
+
+    def _healthy(self, worker: PandocWorker) -> bool:
+        """ check if a worker is alive and answers requests """
+        if worker.process.poll() is not None:
+            return False
+        try:
+            worker.connection.request("GET", "/version")
+            worker.connection.getresponse().read()
+            return True
+        except (OSError, http.client.HTTPException):
+            worker.connection.close()
+            return False
+
+    def _health_check(self):
+        """ periodically restart idle workers that crashed """
+        while not self.stopped.wait(self.interval):
+            for _ in range(self.idle.qsize()):
+                try:
+                    worker = self.idle.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    if not self._healthy(worker):
+                        worker = self._restart(worker)
+                except ConnectionError:
+                    pass  # tried again at the next health check (after the backoff)
+                self.idle.put(worker)
+
+    def start(self):
+        """ start the pandoc servers and the health check
+
+        Raises:
+            ConnectionError: if pandoc can't run as a server
+        """
+        for _ in range(self.size):
+            self.idle.put(self._spawn())
+        threading.Thread(target=self._health_check, daemon=True).start()
+
+    def stop(self):
+        """ stop all pandoc servers """
+        self.stopped.set()
+        while not self.idle.empty():
+            self._kill(self.idle.get_nowait())
+
+    def convert(self, content: str, source: str = "gfm", target: str = "html") -> str:
+        """ convert content with one of the pandoc servers
+
+        Args:
+            content: the content to convert
+            source: the pandoc input format
+            target: the pandoc output format
+
+        Returns:
+            output: str: the converted content
+
+        Raises:
+            ConnectionError: if no pandoc server could do the conversion
+        """
+        if self.stopped.is_set():
+            raise ConnectionError("pandoc pool was stopped")
+        try:
+            worker = self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise ConnectionError("no pandoc server available")
+        if worker.process.poll() is not None:
+            try:
+                worker = self._restart(worker)
+            except ConnectionError:
+                self.idle.put(worker)  # restarted by the health check (after the backoff)
+                raise
+        try:
+            body = json.dumps({"text": content, "from": source, "to": target})
+            headers = {"Content-Type": "application/json", "Accept": "application/json"}
+            worker.connection.request("POST", "/", body.encode(), headers)
+            response = worker.connection.getresponse()
+            result = response.read()
+            if response.status != 200:
+                raise ConnectionError(f"pandoc server error: {result.decode().strip()}")
+            self.stats["conversions"] += 1
+            return json.loads(result)["output"]
+        except (OSError, ValueError, KeyError, http.client.HTTPException) as e:
+            self.stats["failures"] += 1
+            worker.connection.close()  # reconnects on next request
+            raise ConnectionError(f"pandoc server conversion failed: {e}")
+        finally:
+            self.idle.put(worker)
+
+    def info(self) -> dict:
+        """ the pool statistics
+
+        Returns:
+            info: dictionary with the pool size and conversion/restart counters
+        """
+        return dict(self.stats, size=self.size, idle=self.idle.qsize())
+
+
+# bounded scrollback of streamed content
+class PipeBuffer:
+    """ bounded scrollback of the content streamed into smdv
+
+    Only the last `maxlines` lines are kept; older lines are dropped as new
+    content arrives. The number of dropped lines is counted, such that text
+    can be split into blocks that don't shift when lines are dropped.
+    """
+
+    def __init__(self, message: dict, maxlines: int = 10000):
+        """ create an empty scrollback
+
+        Args:
+            message: the message that opened the stream
+            maxlines: the maximum number of lines to keep
+        """
+        keys = ["cwd", "cwdBody", "cwdEncoded", "filename", "fileOpen", "fileEncoding"]
+        self.message_base = {key: message[key] for key in keys}
+        self.message_base.update(
+            func="file", fileCwd=message.get("fileCwd", message["cwd"]), fileStream=True
+        )
+        self.lines = collections.deque([""], maxlen=max(maxlines, 1) + 1)  # last: partial line
+        self.dropped = 0
+        self.appended = 0
+        self.changed = False  # content was appended since the last message
+        self.rendering = False  # a render of the scrollback is running
+
+    def append(self, chunk: str):
+        """ append a chunk of streamed content
+
+        Args:
+            chunk: the content to append (need not end on a line boundary)
+        """
+        lines = chunk.split("\n")
+        lines[0] = self.lines.pop() + lines[0]
+        overflow = len(self.lines) + len(lines) - self.lines.maxlen
+        self.dropped += max(overflow, 0)
+        self.appended += len(chunk)
+        self.lines.extend(lines)
+        self.changed = True
+
+    def message(self) -> dict:
+        """ the message showing the current content of the scrollback
+
+        Returns:
+            message: dict: the (unencoded) @pipe message
+        """
+        self.changed = False
+        return dict(
+            self.message_base,
+            client="pipe",
+            fileBody="\n".join(self.lines),
+            fileEncoded=False,
+            fileFirstLine=self.dropped,
+        )
+
+    def info(self) -> dict:
+        """ get the scrollback statistics
+
+        Returns:
+            info: dictionary with the number of kept and dropped lines
+        """
+        return {
+            "lines": len(self.lines) - 1,
+            "maxlines": self.lines.maxlen - 1,
+            "dropped": self.dropped,
+            "appended": self.appended,
+        }
+
+
+# low-priority background renderer
+class Prefetcher:
+    """ speculative, low-priority renderer feeding the render cache
+
+    Documents the user is likely to open next (the README/index files and the
+    most recently modified markdown files of a listed directory, the markdown
+    files linked from a rendered document) are rendered in a background
+    thread, such that opening them only hits the render cache.
+
+    The prefetcher yields to foreground renders: it doesn't start a render
+    while one is running. After each render it sleeps long enough to spend
+    at most a `budget` fraction of the time rendering.
+
+    Args:
+        budget: the fraction of the time the prefetcher may spend rendering
+        maxpending: the maximum number of pending jobs (the oldest are dropped)
+    """
+
+    def __init__(self, budget: float = 0.25, maxpending: int = 64):
+        self.budget = min(max(budget, 0.01), 1.0)
+        self.maxpending = maxpending
+        self.pending = collections.OrderedDict()  # (kind, target) -> payload; newest last
+        self.holds = 0  # number of running foreground renders
+        self.condition = threading.Condition()
+        self.stats = collections.Counter(rendered=0, skipped=0, dropped=0, errors=0)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _directory(self, path: str) -> list:
+        """ the markdown files of a directory worth prefetching (most likely first) """
+        files = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith(".md") and entry.is_file():
+                    files.append((entry.stat().st_mtime, entry.name, entry.path))
+        readmes = [f for f in files if f[1].lower()[:-3] in {"readme", "index"}]
+        recent = sorted(set(files) - set(readmes), reverse=True)[:PREFETCH_RECENT]
+        return [path for _, _, path in readmes + recent]
+
+    def _file(self, path: str):
+        """ render a markdown file into the render cache (blocks in cache are not rendered again) """
+        if os.path.getsize(path) > PREFETCH_SIZE:
+            self.stats["skipped"] += 1
+            return
+        cwd = os.path.dirname(path)[len(ARGS.home) :] + "/"
+        message = {
+            "func": "file",
+            "filename": os.path.basename(path),
+            "fileBody": read_file(path),
+            "fileCwd": cwd,
+            "fileEncoding": "md",
+            "fileEncoded": False,
+        }
+        encode(message)
+        self.stats["rendered"] += 1
+
+    def _links(self, html: str) -> list:
+        """ the (existing) markdown files linked from rendered html """
+        prefix = re.escape(f"http://{ARGS.host}:{ARGS.port}")
+        paths = []
+        for match in re.finditer(f'href="{prefix}(/[^"#?]*?\\.md)(?=["#?])', html):
+            path = os.path.normpath(ARGS.home + urllib.parse.unquote(match.group(1)))
+            if path.startswith(ARGS.home + "/") and path not in paths:
+                paths.append(path)
+        return [path for path in paths if os.path.isfile(path)]
+
+    def _run(self):
+        """ prefetch the pending jobs, newest first """
+        while True:
+            with self.condition:
+                while not self.pending or self.holds:
+                    self.condition.wait()
+                (kind, target), payload = self.pending.popitem(last=True)
+            start = time.monotonic()
+            try:
+                if kind == "file":
+                    self._file(target)
+                    continue
+                paths = self._directory(target) if kind == "dir" else self._links(payload)
+                with self.condition:  # most likely file last: it's prefetched first
+                    for path in reversed(paths):
+                        self._push(("file", path), None)
+            except Exception:  # a failed prefetch should never stop the prefetcher
+                self.stats["errors"] += 1
+            finally:
+                elapsed = time.monotonic() - start
+                time.sleep(elapsed * (1 - self.budget) / self.budget)
+
+    def _push(self, job: tuple, payload):
+        """ add a job to the pending jobs (the condition should be held) """
+        self.pending.pop(job, None)
+        self.pending[job] = payload
+        while len(self.pending) > self.maxpending:
+            self.pending.popitem(last=False)
+            self.stats["dropped"] += 1
+
+    def directory(self, cwd: str):
+        """ prefetch the README/index and recently modified markdown files of a directory
+
+        Args:
+            cwd: the directory (relative to the smdv home)
+        """
+        with self.condition:
+            self._push(("dir", os.path.normpath(ARGS.home + cwd)), None)
+            self.condition.notify()
+
+    def links(self, document: tuple, html: str):
+        """ prefetch the markdown files linked from a rendered document
+
+        Args:
+            document: key identifying the document (e.g. (fileCwd, filename))
+            html: the rendered html of the document
+        """
+        with self.condition:
+            self._push(("links", document), html)
+            self.condition.notify()
+
+    def hold(self):
+        """ pause prefetching while a foreground render runs """
+        with self.condition:
+            self.holds += 1
+
+    def release(self):
+        """ resume prefetching after a foreground render finished """
+        with self.condition:
+            self.holds -= 1
+            self.condition.notify()
+
+    def info(self) -> dict:
+        """ the prefetcher statistics
+
+        Returns:
+            info: dictionary with the rendered/skipped/dropped/error counters
+        """
+        return dict(self.stats, pending=len(self.pending), budget=self.budget)
+
+
+# persistent channel from the flask server to the websocket server
+class PyClientChannel:
+    """ persistent channel from the flask server to the websocket server
+
+    All request threads of the flask server share a single long-lived
+    websocket connection, owned by a background thread. Messages are queued
+    in a bounded queue: sending blocks while the queue is full, which
+    pushes back on the request threads in stead of dropping messages. A
+    message only leaves the channel after the websocket server acknowledged
+    it; on a connection failure the channel reconnects and sends it again.
+
+    Args:
+        url: the url of the websocket server
+        maxsize: the maximum number of queued messages
+        timeout: the maximum time (in seconds) to wait for room in the queue
+    """
+
+    def __init__(self, url: str, maxsize: int = 64, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize)
+        self.stats = collections.Counter(queued=0, sent=0, retries=0, reconnects=0)
+        self.lock = threading.Lock()
+        self.loop = None
+        self.wakeup = None
+
+    async def _connect(self) -> "websockets.WebSocketClientProtocol":
+        """ (re)connect to the websocket server, with exponential backoff """
+        delay = 0.05
+        while True:
+            try:
+                self.stats["reconnects"] += 1
+                return await websockets.connect(self.url)
+            except (OSError, websockets.WebSocketException):
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, 2.0)
+
+    async def _deliver(self):
+        """ deliver the queued messages in order, one acknowledged message at a time """
+        self.wakeup = asyncio.Event()
+        websocket = None
+        while True:
+            self.wakeup.clear()
+            while not self.queue.empty():
+                message = self.queue.get_nowait()
+                frame = json.dumps(message)
+                acknowledged = False
+                while not acknowledged:
+                    try:
+                        if websocket is None or websocket.closed:
+                            websocket = await self._connect()
+                        await websocket.send(frame)
+                        while not acknowledged:
+                            reply = json.loads(await websocket.recv())
+                            acknowledged = (
+                                isinstance(reply, dict) and reply.get("ack") == message["ack"]
+                            )
+                    except (OSError, ValueError, websockets.WebSocketException):
+                        self.stats["retries"] += 1
+                        websocket = None
+                self.stats["sent"] += 1
+                self.queue.task_done()
+            await self.wakeup.wait()
+
+    def _wake(self):
+        """ wake up the delivery loop (called in the event loop of the channel) """
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def send(self, message: dict):
+        """ queue a message for the websocket server
+
+        Args:
+            message: the message to send (in dictionary format)
+
+        Raises:
+            ConnectionError: if the queue stays full for longer than the timeout
+        """
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=self.loop.run_until_complete, args=(self._deliver(),), daemon=True
+                )
+                thread.start()
+            self.stats["queued"] += 1
+            message = dict(message, client="py", ack=self.stats["queued"])
+        try:
+            self.queue.put(message, timeout=self.timeout)
+        except queue.Full:
+            raise ConnectionError("websocket server does not keep up with the messages")
+        self.loop.call_soon_threadsafe(self._wake)
+
+    def info(self) -> dict:
+        """ the channel statistics
+
+        Returns:
+            info: dictionary with the queue depth and send/retry counters
+        """
+        return dict(self.stats, queueDepth=self.queue.qsize())
+
+
+# content-addressed cache for rendered file bodies
+class RenderCache:
+    """ content-addressed cache for rendered file bodies
+
+    The cache consists of a bounded in-memory LRU tier and an optional
+    on-disk tier (one file per render) that survives a restart of smdv.
+    When the on-disk tier grows larger than `disksize` bytes, the least
+    recently used renders are removed from it.
+
+    Args:
+        maxsize: the maximum number of renders to keep in memory
+        directory: the directory of the on-disk tier (disabled if empty)
+        disksize: the maximum total size (in bytes) of the on-disk tier
+    """
+
+    def __init__(self, maxsize: int = 128, directory: str = "", disksize: int = 2 ** 28):
+        self.maxsize = max(int(maxsize), 0)
+        self.directory = os.path.abspath(os.path.expanduser(directory)) if directory else ""
+        self.disksize = disksize
+        self.memory = collections.OrderedDict()
+        self.lock = threading.Lock()  # renders happen in several threads
+        self.prune_lock = threading.Lock()  # a single thread prunes the on-disk tier
+        self.stats = collections.Counter(
+            hits=0,
+            disk_hits=0,
+            misses=0,
+            evictions=0,
+            invalidations=0,
+            disk_pruned=0,
+            disk_errors=0,
+        )
+        self.size = 0  # total size of the on-disk tier
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self.size = sum(entry.stat().st_size for entry in self._entries())
+            if self.size > self.disksize:
+                self._prune()
+
+    def _entries(self) -> list:
+        """ the files of the on-disk tier (the resource store next to it excluded) """
+        entries = []
+        for folder in os.scandir(self.directory):
+            if len(folder.name) == 2 and folder.is_dir():
+                entries.extend(e for e in os.scandir(folder.path) if e.name.endswith(".html"))
+        return entries
+
+    def _grow(self, size: int):
+        """ account for a change in size of the on-disk tier, pruning it when too large """
+        with self.lock:
+            self.size += size
+            full = self.size > self.disksize
+        if full:
+            self._prune()
+
+    def _path(self, key: str) -> str:
+        """ location of a cache entry in the on-disk tier """
+        return os.path.join(self.directory, key[:2], key[2:] + ".html")
+
+    def _prune(self):
+        """ remove the least recently used renders until the on-disk tier is 3/4 full """
+        if not self.prune_lock.acquire(blocking=False):
+            return  # another thread is pruning already
+        try:
+            entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+            for entry in entries:
+                if self.size <= self.disksize * 3 // 4:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.unlink(entry.path)
+                except OSError:
+                    continue
+                with self.lock:
+                    self.size -= size
+                    self.stats["disk_pruned"] += 1
+        finally:
+            self.prune_lock.release()
+
+    def _remember(self, key: str, html: str):
+        """ store a render in the in-memory tier, evicting the oldest entries """
+        with self.lock:
+            self.memory[key] = html
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.maxsize:
+                self.memory.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def discard(self, key: str):
+        """ remove a render from both tiers of the cache
+
+        Args:
+            key: the cache key of the render
+        """
+        with self.lock:
+            self.memory.pop(key, None)
+            self.stats["invalidations"] += 1
+        if self.directory:
+            try:
+                path = self._path(key)
+                size = os.stat(path).st_size
+                os.unlink(path)
+                self._grow(-size)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                self.stats["disk_errors"] += 1
+
+    def get(self, key: str):
+        """ get a render from the cache
+
+        Args:
+            key: the cache key of the render
+
+        Returns:
+            html: the cached render (None if not in cache)
+        """
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.memory[key]
+        if self.directory:
+            try:
+                with open(self._path(key), "r") as file:
+                    html = file.read()
+                os.utime(self._path(key))  # recently used: pruned last
+                self._remember(key, html)
+                self.stats["disk_hits"] += 1
+                return html
+            except FileNotFoundError:
+                pass
+            except OSError:
+                self.stats["disk_errors"] += 1
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, html: str):
+        """ store a render in the cache
+
+        Args:
+            key: the cache key of the render
+            html: the rendered html
+        """
+        self._remember(key, html)
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "w") as file:
+                file.write(html)
+            size = os.stat(tmp).st_size
+            try:
+                size -= os.stat(path).st_size  # replaced render
+            except FileNotFoundError:
+                pass
+            os.replace(tmp, path)  # atomic: never expose half-written renders
+        except OSError:
+            self.stats["disk_errors"] += 1
+            return
+        self._grow(size)
+
+    def info(self) -> dict:
+        """ the cache statistics
+
+        Returns:
+            info: dictionary with hit/miss/eviction counters and cache sizes
+        """
+        return dict(
+            self.stats,
+            size=len(self.memory),
+            maxsize=self.maxsize,
+            directory=self.directory,
+            disk_size=self.size,
+            disk_maxsize=self.disksize,
+        )
+
+
+# latest-wins render scheduler
+class RenderScheduler:
+    """ latest-wins scheduler for file renders
+
+    Pending renders of the same document are coalesced: after the debounce
+    window, only the newest request for a document is rendered. A render
+    whose result is superseded by a newer request by the time it finishes
+    is discarded, such that the view always converges on the newest content
+    and never goes back to an older one.
+
+    Args:
+        debounce: the time (in seconds) to wait for newer content before rendering
+    """
+
+    def __init__(self, debounce: float = 0.0):
+        self.debounce = debounce
+        self.latest = {}  # document -> sequence number of its newest request
+        self.scheduled = 0  # sequence number of the newest request
+        self.applied = 0  # sequence number of the newest applied render
+        self.stats = collections.Counter(rendered=0, coalesced=0, cancelled=0)
+
+    async def run(self, document: tuple, render: callable) -> bool:
+        """ render a document, unless newer content comes in first
+
+        Args:
+            document: key identifying the document (e.g. (fileCwd, filename))
+            render: function that does the actual render
+
+        Returns:
+            current: bool: True if the render is the newest and its result should be shown
+        """
+        self.scheduled += 1
+        sequence = self.latest[document] = self.scheduled
+        await asyncio.sleep(self.debounce)  # give newer content a chance to come in
+        if self.latest.get(document) != sequence or self.applied > sequence:
+            self.stats["coalesced"] += 1
+            return False
+        await run_in_executor(render)
+        if self.latest.get(document) != sequence or self.applied > sequence:
+            self.stats["cancelled"] += 1
+            return False
+        del self.latest[document]
+        self.applied = sequence
+        self.stats["rendered"] += 1
+        return True
+
+    def info(self) -> dict:
+        """ the scheduler statistics
+
+        Returns:
+            info: dictionary with the rendered/coalesced/cancelled counters
+        """
+        return dict(self.stats, pending=len(self.latest), debounce=self.debounce)
+
+
+# content-addressed store of externalized resources
+class ResourceStore:
+    """ content-addressed store of externalized resources (plots, large outputs, ...)
+
+    Resources are stored on disk, one file per resource named after the hash
+    of its content, such that both the flask server and the websocket server
+    can serve them and browsers can cache them forever. When the store grows
+    larger than `maxsize` bytes, the least recently stored resources are
+    removed.
+
+    Args:
+        directory: the directory of the store
+        maxsize: the maximum total size (in bytes) of the store
+    """
+
+    def __init__(self, directory: str, maxsize: int = 2 ** 29):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.lock = threading.Lock()  # resources are stored from several threads
+        self.stats = collections.Counter(stored=0, reused=0, pruned=0)
+        os.makedirs(self.directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(self.directory))
+
+    def put(self, data: bytes, mimetype: str) -> str:
+        """ store a resource
+
+        Args:
+            data: the content of the resource
+            mimetype: the mimetype of the resource
+
+        Returns:
+            name: str: the name of the resource (its hash and extension)
+        """
+        extension = mimetypes.guess_extension(mimetype) or ".bin"
+        name = hashlib.sha256(data).hexdigest() + extension
+        path = os.path.join(self.directory, name)
+        with self.lock:
+            if os.path.exists(path):
+                os.utime(path)  # recently used: pruned last
+                self.stats["reused"] += 1
+                return name
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as file:
+                file.write(data)
+            os.replace(tmp, path)  # atomic: never serve half-written resources
+            self.size += len(data)
+            self.stats["stored"] += 1
+            if self.size > self.maxsize:
+                self._prune()
+        return name
+
+    def _prune(self):
+        """ remove the least recently stored resources until the store is 3/4 full """
+        entries = sorted(os.scandir(self.directory), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self.size <= self.maxsize * 3 // 4:
+                break
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+            except OSError:
+                continue
+            self.size -= size
+            self.stats["pruned"] += 1
+
+    def touch(self, names: list) -> bool:
+        """ mark resources as recently used, such that they are pruned last
+
+        Args:
+            names: the names of the resources (their hash and extension)
+
+        Returns:
+            present: bool: False if one of the resources was pruned already
+        """
+        for name in names:
+            try:
+                os.utime(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                return False
+        return True
+
+    def info(self) -> dict:
+        """ the store statistics
+
+        Returns:
+            info: dictionary with the stored/reused/pruned counters and the store size
+        """
+        return dict(self.stats, size=self.size, maxsize=self.maxsize, directory=self.directory)
+
+
+# state of a preview session
+class Session:
+    """ state of a preview session: the shown document, its history and its browsers
+
+    Each browser tab and each command line client (e.g. an editor) previews
+    in a session, identified by the `session` query parameter of the page and
+    by --session respectively. Updates of a session are only sent to the js
+    clients showing that session.
+
+    Args:
+        name: the session id (empty for the default session)
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.message = {}  # the shown directory and file
+        self.back = collections.deque()  # for communication between js and py
+        self.forward = collections.deque()  # for communication between js and py
+        self.blocks = []  # (hash, html) of the markdown blocks of the open file
+        self.version = 1  # version of the message (incremented on every broadcast)
+        self.snapshot = {}  # copy of the message at the current version
+        self.patch = ("", None)  # (base hash, block patch) of the last file body change
+        self.frames = {}  # frames for the current version, serialized once per base version
+        self.jsstate = {}  # per js client: (version, message) it last received
+        self.outboxes = {}  # per js client: its latest-wins outbox
+        self.waiters = set()  # futures of python clients waiting for a js client
+        self.pipe = None  # scrollback of the content streamed into the session
+        self.scheduler = RenderScheduler(debounce=ARGS.debounce)
+        self.nvim_address = ARGS.nvim_address
+        self.active = time.monotonic()  # the last time the session was used
+
+    def open_file_path(self) -> str:
+        """ the absolute path of the open file
+
+        Returns:
+            path: str: the path of the open file (empty for piped or PUT content)
+        """
+        filename = self.message.get("filename", "")
+        if not filename or filename in ["@pipe", "@put"]:
+            return ""
+        return os.path.join(ARGS.home + self.message.get("fileCwd", "/"), filename)
+
+    def idle(self) -> float:
+        """ the time (in seconds) since the session was last used by any client
+
+        Returns:
+            idle: float: the idle time (zero while a browser shows the session)
+        """
+        if self.outboxes:
+            return 0.0
+        return time.monotonic() - self.active
+
+    def info(self) -> dict:
+        """ the session statistics
+
+        Returns:
+            info: dictionary with the open file and the statistics of the js clients
+        """
+        return {
+            "filename": self.message.get("filename", ""),
+            "version": self.version,
+            "idle": round(self.idle(), 1),
+            "jsClients": [outbox.info() for outbox in self.outboxes.values()],
+            "pipeBuffer": self.pipe.info() if self.pipe else {},
+            "renderScheduler": self.scheduler.info(),
+        }
+
 
 ## Async functions (alphabetic)
 
 # as number of js clients
-async def ask_num_js_clients():
-    """ ask the number of js clients from the websocket server """
+async def ask_num_js_clients(wait: bool = False):
+    """ ask the number of js clients showing the session from the websocket server
+
+    Args:
+        wait: wait for at least one js client to be connected before answering
+    """
+    func = "waitForJSClient" if wait else "numJSClients"
     async with websockets.connect(
         f"ws://{ARGS.websocket_host}:{ARGS.websocket_port}"
     ) as websocket:
-        await websocket.send(json.dumps({"client": "py", "func": "numJSClients"}))
+        request = {"client": "py", "func": func, "session": ARGS.session}
+        await websocket.send(json.dumps(request))
         num_clients = await websocket.recv()
     return int(num_clients)
 
 
+# ask the server statistics
+async def ask_stats() -> dict:
+    """ ask the statistics (render cache, pandoc pool, ...) from the websocket server """
+    async with websockets.connect(
+        f"ws://{ARGS.websocket_host}:{ARGS.websocket_port}"
+    ) as websocket:
+        await websocket.send(json.dumps({"client": "py", "func": "stats"}))
+        stats = await websocket.recv()
+    return json.loads(stats)
+
+
+# evict idle sessions
+async def evict_idle_sessions():
+    """ drop the sessions that were idle for longer than the session timeout
+
+    A session is idle while no browser shows it. Evicting a session frees
+    its message, history and frames; it starts empty when it's used again.
+    """
+    while True:
+        await asyncio.sleep(max(ARGS.session_timeout / 4, 1.0))
+        for name, session in list(SESSIONS.items()):
+            if session.idle() > ARGS.session_timeout:
+                del SESSIONS[name]
+        watch_open_files()
+
+
 # handle a message sent by one of the clients:
-async def handle_message(client: websockets.WebSocketServerProtocol, message: str):
+async def handle_message(client: "websockets.WebSocketServerProtocol", message: str):
     """ handle a message sent by one of the clients
 
     Args:
-        message: the message to update the global message with
+        client: the client (websocket) that sent the message (None if sent internally)
+        message: the message to update the message of its session with
     """
+    if "ack" in message:  # sent over a persistent channel: acknowledge receipt
+        await client.send(json.dumps({"ack": message.pop("ack")}))
     func = message.get("func")
-    ARGS.nvim_address = message.pop("nvimAddress", ARGS.nvim_address)
+    if func == "stats":
+        await client.send(json.dumps(server_stats()))
+        return
+    session = get_session(message.pop("session", ""))
+    session.nvim_address = message.pop("nvimAddress", session.nvim_address)
     validate_message(message)
     if "cwd" in message:
         os.chdir(ARGS.home + message["cwd"])
     if not func:
         return
     if func == "numJSClients":
-        await client.send(str(len(JSCLIENTS)))
+        await client.send(str(len(session.outboxes)))
+        return
+    if func == "waitForJSClient":
+        if not session.outboxes:
+            waiter = asyncio.get_event_loop().create_future()
+            session.waiters.add(waiter)
+            try:
+                await waiter
+            finally:
+                session.waiters.discard(waiter)
+        try:
+            await client.send(str(len(session.outboxes)))
+        except websockets.ConnectionClosed:
+            pass  # the python client stopped waiting
         return
+    if func == "resync":
+        if client in session.outboxes:
+            session.jsstate[client] = (0, {})
+            session.outboxes[client].notify()
+        return
+    if func == "append":
+        buffer = session.pipe
+        if buffer is None:
+            return  # the stream was replaced by another file
+        buffer.append(message.get("fileChunk", ""))
+        if buffer.rendering:
+            return  # the running render loop picks the chunk up
+        buffer.rendering = True
+        try:
+            # render all chunks that came in during the previous render at once
+            while buffer.changed and session.pipe is buffer:
+                await handle_message(None, dict(buffer.message(), session=session.name))
+        finally:
+            buffer.rendering = False
+        return
+    if func == "file" and message.get("filename") != "@pipe":
+        session.pipe = None
+    elif func == "file" and message.get("fileStream") and message.get("client") == "py":
+        session.pipe = PipeBuffer(message, ARGS.scrollback)  # a new stream starts
+    if func in {"dirPage", "textPage"}:
+        args = (message["key"], message.get("start", 0), message.get("count", 100))
+        if func == "dirPage":
+            page = await run_in_executor(dir_page, *args, message.get("filter", ""))
+        else:
+            page = await run_in_executor(text_page, *args)
+        page.update(func=func, key=message["key"], filter=message.get("filter", ""))
+        await client.send(json.dumps(page))
+        return
+    current = session.message
     if func == "editFile":
-        edit_in_neovim(ARGS.home + MESSAGE["fileCwd"] + MESSAGE["filename"])
+        path = ARGS.home + current["fileCwd"] + current["filename"]
+        edit_in_neovim(path, address=session.nvim_address)
         return
     if func == "back":
-        if len(BACKMESSAGES) < 2:
+        if len(session.back) < 2:
             return
         if message.get("fileOpen"):
-            message = BACKMESSAGES.popleft()
+            message = session.back.popleft()
         else:
-            FORWARDMESSAGES.appendleft(BACKMESSAGES.popleft())
-            message = BACKMESSAGES.popleft()
-        if len(FORWARDMESSAGES) > 20:
-            FORWARDMESSAGES.pop()
-        await handle_message(client, message)
+            session.forward.appendleft(session.back.popleft())
+            message = session.back.popleft()
+        if len(session.forward) > 20:
+            session.forward.pop()
+        await handle_message(client, dict(message, session=session.name))
         return
     if func == "dir":
+        if not message["cwdEncoded"]:
+            # scan the directory first: the message could be updated in the meantime
+            message["cwdBody"] = await run_in_executor(dir2body, message["cwd"])
+            message["cwdEncoded"] = True
         if (
             not message.get("filename")
-            and MESSAGE.get("filename")
+            and current.get("filename")
             and not message.pop("forceClose", False)
         ):
-            message["filename"] = MESSAGE["filename"]
-            message["fileCwd"] = MESSAGE["fileCwd"]
-            message["fileBody"] = MESSAGE["fileBody"]
-            message["fileEncoding"] = MESSAGE["fileEncoding"]
-            message["fileEncoded"] = MESSAGE["fileEncoded"]
-        if not message["cwdEncoded"]:
-            message["cwdBody"] = dir2body(message["cwd"])
-            message["cwdEncoded"] = True
+            message["filename"] = current["filename"]
+            message["fileCwd"] = current["fileCwd"]
+            message["fileBody"] = current["fileBody"]
+            message["fileEncoding"] = current["fileEncoding"]
+            message["fileEncoded"] = current["fileEncoded"]
+            message["fileHash"] = current.get("fileHash", "")
+    patch = None
     if func == "file":
-        encode(message)
+        if PREFETCHER is not None:
+            PREFETCHER.hold()  # foreground renders go first
+        try:
+            document = (message.get("fileCwd"), message.get("filename"))
+            if not await session.scheduler.run(document, lambda: encode(message)):
+                return  # superseded by newer content
+        finally:
+            if PREFETCHER is not None:
+                PREFETCHER.release()
+        if PREFETCHER is not None and message["fileEncoding"] == "md":
+            PREFETCHER.links(document, message["fileBody"])
+        blocks = message.pop("fileBlocks", None)
+        if blocks is not None:
+            message["fileHash"] = blocks_hash(blocks)
+            if (
+                session.blocks
+                and current.get("fileHash") == blocks_hash(session.blocks)
+                and current.get("filename") == message["filename"]
+                and current.get("fileCwd") == message["fileCwd"]
+            ):
+                patch = blocks_patch(session.blocks, blocks)
+            session.blocks[:] = blocks
     if func in {"dir", "file"}:
-        MESSAGE.update(message)
-        if ARGS.interactive and MESSAGE["func"]=="file":
-            edit_in_neovim(ARGS.home + MESSAGE["fileCwd"] + MESSAGE["filename"])
-        await send_message_to_all_js_clients()
+        if (
+            message.get("client") == "js"
+            and message.get("filename") == current.get("filename")
+            and message.get("fileCwd") == current.get("fileCwd")
+        ):
+            # js clients can't change the file body; don't trust their (patched) copy
+            message["fileBody"] = current.get("fileBody", "")
+            message["fileHash"] = current.get("fileHash", "")
+        if "fileHash" not in message:
+            same_body = message.get("fileBody") == current.get("fileBody")
+            message["fileHash"] = current.get("fileHash", "") if same_body else ""
+        # js clients already hold this exact message (e.g. a save without edits)
+        unchanged = all(current.get(k) == v for k, v in message.items() if k != "client")
+        base = current.get("fileHash", "")
+        cwd = message.get("cwd")
+        if PREFETCHER is not None and cwd and (func == "dir" or cwd != current.get("cwd")):
+            PREFETCHER.directory(cwd)
+        current.update(message)
+        watch_open_files()
+        if (
+            ARGS.interactive
+            and current["func"] == "file"
+            and message.get("client") not in {"watch", "pipe"}
+        ):
+            path = ARGS.home + current["fileCwd"] + current["filename"]
+            edit_in_neovim(path, address=session.nvim_address)
+        if not unchanged:
+            await send_message_to_all_js_clients(session, patch=patch, base=base)
         return
 
 
 # register websocket client
-async def register_client(client: websockets.WebSocketServerProtocol):
+async def register_client(client: "websockets.WebSocketServerProtocol"):
     """ register a client
 
     This function registers a client (websocket) in either the set of
@@ -499,18 +2326,81 @@ async def register_client(client: websockets.WebSocketServerProtocol):
     Args:
         client: the client (websocket) to register.
 
+    Returns:
+        session: the session shown by the js client (None for python clients)
+
     """
     message = await client.recv()
     message = json.loads(message)
     clienttype = message.get("client", "")
+    session = None
     if clienttype == "js":
-        JSCLIENTS.add(client)
-        await client.send(json.dumps(MESSAGE))
+        session = get_session(message.get("session", ""))
+        session.jsstate[client] = (0, {})
+        session.outboxes[client] = Outbox(client, session, timeout=ARGS.send_timeout)
+        session.outboxes[client].notify()
+        for waiter in session.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        session.waiters.clear()
     elif clienttype == "py":
         PYCLIENTS.add(client)
     else:
         raise ValueError("not a valid client identifier specified.")
     await handle_message(client, message)
+    return session
+
+
+# reload an open file
+async def reload_file(path: str):
+    """ reload an open file after it changed on disk
+
+    Args:
+        path: the absolute path of the file that changed
+    """
+    sessions = [session for session in SESSIONS.values() if session.open_file_path() == path]
+    if not sessions:
+        return  # another file was opened in the meantime
+    try:
+        large = os.path.getsize(path) > ARGS.large_file_size
+        content = "" if large else await run_in_executor(read_file, path)
+    except (OSError, UnicodeDecodeError):
+        return  # removed, or replaced by a binary file
+    keys = ["cwd", "cwdBody", "cwdEncoded", "filename", "fileCwd", "fileOpen"]
+    for session in sessions:
+        encoding = session.message.get("fileEncoding", "")
+        if large:
+            encoding = "window"
+        elif encoding == "window":
+            encoding = ""
+        message = {key: session.message[key] for key in keys}
+        message.update(
+            client="watch",
+            func="file",
+            session=session.name,
+            fileBody=content,
+            fileEncoding=encoding,
+            fileEncoded=False,
+        )
+        await handle_message(None, message)
+
+
+# run a blocking function in the render executor
+async def run_in_executor(func: callable, *args):
+    """ run a blocking function (render, directory scan, ...) in the render executor
+
+    This keeps the websocket server responsive while rendering.
+
+    Args:
+        func: the function to run
+        *args: the arguments to call the function with
+
+    Returns:
+        result: the return value of the function
+    """
+    if RENDER_EXECUTOR is None:
+        return func(*args)
+    return await asyncio.get_event_loop().run_in_executor(RENDER_EXECUTOR, func, *args)
 
 
 # python websocket client
@@ -527,8 +2417,36 @@ async def send_as_pyclient_async(message: dict):
         await websocket.send(json.dumps(message))
 
 
+# stream stdin to the smdv server
+async def send_stream_as_pyclient_async(message: dict):
+    """ stream stdin to the smdv server as it arrives
+
+    The message opens the (empty) @pipe document; every chunk read from stdin
+    is then appended to it by the server.
+
+    Args:
+        message: the message opening the streamed document
+    """
+    loop = asyncio.get_event_loop()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    message["client"] = "py"
+    async with websockets.connect(
+        f"ws://{ARGS.websocket_host}:{ARGS.websocket_port}"
+    ) as websocket:
+        await websocket.send(json.dumps(message))
+        while True:
+            data = await loop.run_in_executor(None, os.read, 0, 2 ** 16)
+            chunk = decoder.decode(data, final=not data)
+            if chunk:
+                append = {"client": "py", "func": "append", "fileChunk": chunk}
+                append["session"] = message.get("session", "")
+                await websocket.send(json.dumps(append))
+            if not data:
+                return
+
+
 # serve clients
-async def serve_client(client: websockets.WebSocketServerProtocol, path: str):
+async def serve_client(client: "websockets.WebSocketServerProtocol", path: str):
     """ asynchronous websocket server to serve a websocket client
 
     Args:
@@ -536,60 +2454,246 @@ async def serve_client(client: websockets.WebSocketServerProtocol, path: str):
         path: the path over which to serve
 
     """
-    await register_client(client)
+    session = await register_client(client)
     try:
         async for message in client:
-            await handle_message(client, json.loads(message))
+            if client in PYCLIENTS:  # handle python messages concurrently
+                asyncio.ensure_future(handle_message(client, json.loads(message)))
+            else:
+                await handle_message(client, json.loads(message))
     finally:
-        await unregister_client(client)
+        await unregister_client(client, session)
 
 
 # send updated body contents to javascript clients
-async def send_message_to_all_js_clients():
-    """ send a message to all js clients
+async def send_message_to_all_js_clients(
+    session: Session, patch: list = None, base: str = ""
+):
+    """ send the message of a session to all js clients showing the session
 
     Args:
-        message: dict: the message to send
+        session: the session of which the message changed
+        patch: list: block patch to send in stead of the full file body
+        base: str: hash of the file blocks the patch should be applied to
 
     """
-    if (not BACKMESSAGES) or (MESSAGE["cwd"] != BACKMESSAGES[0]["cwd"]):
-        BACKMESSAGES.appendleft(
+    message = session.message
+    session.version += 1
+    # the (server-internal) sender ("py", "watch", ...) is not part of the document state
+    session.snapshot = {k: v for k, v in message.items() if k != "client"}
+    session.patch = (base, patch)
+    session.frames.clear()
+    if (not session.back) or (message["cwd"] != session.back[0]["cwd"]):
+        session.back.appendleft(
             {
                 "client": "py",
                 "func": "dir",
-                "cwd": MESSAGE["cwd"],
-                "cwdBody": MESSAGE["cwdBody"],
-                "cwdEncoded": MESSAGE["cwdEncoded"],
+                "cwd": message["cwd"],
+                "cwdBody": message["cwdBody"],
+                "cwdEncoded": message["cwdEncoded"],
                 "filename": "",
                 "fileBody": "",
                 "fileCwd": "",
                 "fileOpen": False,
                 "fileEncoding": "",
                 "fileEncoded": False,
+                "fileHash": "",
             }
         )
-        if len(BACKMESSAGES) > 20:
-            BACKMESSAGES.pop()
-    if JSCLIENTS:
-        await asyncio.wait([client.send(json.dumps(MESSAGE)) for client in JSCLIENTS])
+        if len(session.back) > 20:
+            session.back.pop()
+    for outbox in session.outboxes.values():
+        outbox.notify()
+
+
+# serve plain http requests (single process mode)
+async def serve_http_request(path: str, request_headers: "websockets.http.Headers"):
+    """ serve the smdv page and static files from the websocket server
+
+    In single process mode, the websocket server also answers the plain http
+    GET requests that would otherwise go to the flask server. The messages
+    for the requested paths are handed to the websocket server in memory.
+
+    Args:
+        path: the requested path (including the query string)
+        request_headers: the http request headers
+
+    Returns:
+        response: (status, headers, body) tuple (None for websocket handshakes)
+    """
+    if request_headers.get("Upgrade", "").lower() == "websocket":
+        return None
+    path, query = urllib.parse.urlsplit(path)[2:4]
+    path = urllib.parse.unquote(path)
+    if path.startswith("/@static/"):
+        args = (path[len("/@static/") :], request_headers)
+        return await run_in_executor(static_response, *args)
+    if path.startswith("/@resource/"):
+        return await run_in_executor(resource_response, path[len("/@resource/") :])
+    if path.startswith("/@asset/"):
+        return asset_response(path[len("/@asset/") :])
+    path = path.strip("/")
+    try:
+        message = await run_in_executor(path2message, path)
+    except FileNotFoundError:
+        return (http.HTTPStatus.NOT_FOUND, {}, b"not found\n")
+    if message is None:  # binary file
+        location = "/@static/" + urllib.parse.quote(path)
+        return (http.HTTPStatus.FOUND, {"Location": location}, b"")
+    message["client"] = "py"
+    message["session"] = urllib.parse.parse_qs(query).get("session", [""])[0]
+    asyncio.ensure_future(handle_message(None, message))
+    headers = {"Content-Type": "text/html; charset=utf-8"}
+    return (http.HTTPStatus.OK, headers, page_html().encode())
+
+
+# serve command line clients on the local socket
+async def serve_local_client(
+    reader: "asyncio.StreamReader", writer: "asyncio.StreamWriter"
+):
+    """ open a path for a command line client connected to the local socket
+
+    The command line client sends a single json line with the absolute path
+    to open; reading the file and scanning its directory is done here, such
+    that the client only needs a single round trip.
+
+    Args:
+        reader: the stream to read the request from
+        writer: the stream to write the reply to
+    """
+    try:
+        request = json.loads(await reader.readline())
+        path = os.path.abspath(request["path"])
+        if path.startswith(ARGS.home):
+            path = path[len(ARGS.home) :]
+        message = await run_in_executor(path2message, path)
+        if message is None:
+            raise ValueError(f"cannot open binary file {request['path']}")
+        message["client"] = "py"
+        message["session"] = request.get("session", "")
+        message["nvimAddress"] = request.get("nvimAddress", ARGS.nvim_address)
+        asyncio.ensure_future(handle_message(None, message))
+        reply = {"numJSClients": len(get_session(message["session"]).outboxes)}
+    except (OSError, ValueError, KeyError) as e:
+        reply = {"error": str(e)}
+    try:
+        writer.write(json.dumps(reply).encode() + b"\n")
+        await writer.drain()
+    finally:
+        writer.close()
 
 
 # unregister websocket client
-async def unregister_client(client: websockets.WebSocketServerProtocol):
+async def unregister_client(
+    client: "websockets.WebSocketServerProtocol", session: Session = None
+):
     """ unregister a client
 
     Args:
         client: the client (websocket) to unregister.
+        session: the session shown by the client (None for python clients)
 
     """
-    if client in JSCLIENTS:
-        JSCLIENTS.remove(client)
     if client in PYCLIENTS:
         PYCLIENTS.remove(client)
+    if session is not None:
+        session.jsstate.pop(client, None)
+        if client in session.outboxes:
+            session.outboxes.pop(client).close()
+        session.active = time.monotonic()
 
 
 ## Normal functions (alphabetic)
 
+# serve an asset of the smdv page
+def asset_response(name: str) -> tuple:
+    """ serve a stylesheet or script of the smdv page
+
+    Args:
+        name: the content-hashed name of the asset (e.g. smdv.0123456789abcdef.css)
+
+    Returns:
+        response: (status, headers, body) tuple
+    """
+    page_html()  # the assets are registered while rendering the page
+    if name not in ASSETS:
+        return (http.HTTPStatus.NOT_FOUND, {}, b"not found\n")
+    headers = {
+        "Content-Type": f"{mimetypes.guess_type(name)[0]}; charset=utf-8",
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{name.split(".")[-2]}"',
+    }
+    return (http.HTTPStatus.OK, headers, ASSETS[name])
+
+
+# hash a list of file blocks
+def blocks_hash(blocks: list) -> str:
+    """ hash a list of rendered file blocks
+
+    Args:
+        blocks: list of (hash, html) tuples
+
+    Returns:
+        hash: str: a short hash identifying the list of blocks
+    """
+    return hashlib.sha256("".join(h for h, _ in blocks).encode()).hexdigest()[:16]
+
+
+# compute the patch between two lists of blocks
+def blocks_patch(old: list, new: list) -> list:
+    """ compute the patch that transforms one list of rendered blocks into another
+
+    Args:
+        old: the list of (hash, html) tuples the js clients currently show
+        new: the list of (hash, html) tuples to show
+
+    Returns:
+        patch: list: the insert/remove/replace operations, sorted back to front
+            such that they can be applied one after the other.
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [h for h, _ in old], [h for h, _ in new], autojunk=False
+    )
+    patch = []
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == "equal":
+            continue
+        patch.append(
+            {
+                "op": "remove" if tag == "delete" else tag,
+                "index": i1,
+                "remove": i2 - i1,
+                "insert": [html for _, html in new[j1:j2]],
+            }
+        )
+    return patch
+
+
+# get a render from the render cache
+def cached_render(key: str) -> str:
+    """ get a render from the render cache, if the resources it refers to still exist
+
+    Renders referring to resources pruned from the resource store are
+    removed from the cache, such that they are rendered (and their
+    resources stored) again.
+
+    Args:
+        key: the cache key of the render
+
+    Returns:
+        html: str: the cached render (None if not in cache or outdated)
+    """
+    if RENDER_CACHE is None:
+        return None
+    html = RENDER_CACHE.get(key)
+    if html is None or "/@resource/" not in html:
+        return html
+    if resource_store().touch(RESOURCE_URL_PATTERN.findall(html)):
+        return html
+    RENDER_CACHE.discard(key)
+    return None
+
+
 # function to change the current working directory
 def change_current_working_directory(path: str) -> str:
     """ change the current working directory
@@ -623,7 +2727,7 @@ def change_current_working_directory(path: str) -> str:
 
 
 # flask app factory
-def create_app() -> flask.Flask:
+def create_app() -> "flask.Flask":
     """ flask app factory
 
     Returns:
@@ -632,6 +2736,8 @@ def create_app() -> flask.Flask:
     """
 
     app = flask.Flask(__name__, static_folder=ARGS.home, static_url_path="/@static")
+    # the static route answers conditional (304) and range requests with strong ETags
+    app.config["SEND_FILE_MAX_AGE_DEFAULT"] = ARGS.static_max_age or None
 
     # stop the flask server
     def stop_flask_server() -> int:
@@ -641,13 +2747,35 @@ def create_app() -> flask.Flask:
             exit_status: exit status of the request (0: success, 1: failure)
 
         """
-        func = flask.request.environ.get("werkzeug.server.shutdown")
         try:
-            func()
+            # shut down from another thread: shutdown waits for this request to finish
+            threading.Thread(target=FLASK_SERVER.shutdown).start()
             return 0
         except Exception as e:
             return 1
 
+    # route for the stylesheets and scripts of the page
+    @app.route("/@asset/<name>", methods=["GET"])
+    def asset(name: str) -> "flask.Response":
+        """ serve a stylesheet or script of the smdv page
+
+        Returns:
+            response: the asset (with headers allowing browsers to cache it forever)
+        """
+        status, headers, body = asset_response(name)
+        return flask.Response(body, status=status, headers=headers)
+
+    # route for the externalized resources (plots, large outputs, ...)
+    @app.route("/@resource/<name>", methods=["GET"])
+    def resource(name: str) -> "flask.Response":
+        """ serve a resource from the resource store
+
+        Returns:
+            response: the resource (with headers allowing browsers to cache it forever)
+        """
+        status, headers, body = resource_response(name)
+        return flask.Response(body, status=status, headers=headers)
+
     # index route for the smdv app
     @app.route("/", methods=["GET", "PUT", "DELETE"])
     @app.route("/<path:path>/", methods=["GET"])
@@ -659,89 +2787,122 @@ def create_app() -> flask.Flask:
         """
         if flask.request.method == "GET":
             try:
-                cwd, filename = change_current_working_directory(path)
+                message = path2message(path)
             except FileNotFoundError:
                 return flask.abort(404)
-
-            html = HTMLTEMPLATE.format(
-                home=ARGS.home,
-                interactive=f"{'--interactive' if ARGS.interactive else ''}",
-                md_css_cdn=ARGS.md_css_cdn,
-                host=ARGS.websocket_host,
-                port=ARGS.websocket_port,
-            )
-            if filename:
-                if is_binary_file(filename):
-                    return flask.redirect(flask.url_for("static", filename=path))
-                with open(filename, "r") as file:
-                    send_as_pyclient(
-                        {
-                            "func": "file",
-                            "cwd": cwd,
-                            "cwdBody": dir2body(cwd),
-                            "cwdEncoded": True,
-                            "filename": filename,
-                            "fileBody": file.read(),
-                            "fileCwd": cwd,
-                            "fileOpen": True,
-                            "fileEncoding": "",
-                            "fileEncoded": False,
-                        }
-                    )
-                    return html
-            # this only happens if requested path is a directory
-            send_as_pyclient(
-                {
-                    "func": "dir",
-                    "cwd": cwd,
-                    "cwdBody": dir2body(cwd),
-                    "cwdEncoded": True,
-                    "filename": filename,
-                    "fileBody": "",
-                    "fileCwd": cwd,
-                    "fileOpen": False,
-                    "fileEncoding": "",
-                    "fileEncoded": False,
-                }
-            )
-            return html
+            if message is None:  # binary file
+                return flask.redirect(flask.url_for("static", filename=path))
+            message["session"] = flask.request.args.get("session", "")
+            try:
+                send_as_pyclient(message)
+            except ConnectionError:
+                return flask.abort(503)
+            return page_html()
 
         if flask.request.method == "PUT":
             cwd = (
                 os.path.abspath(os.path.expanduser(os.getcwd()))[len(ARGS.home) :] + "/"
             )
-            send_as_pyclient(
-                {
-                    "func": "file",
-                    "cwd": cwd,
-                    "cwdBody": dir2body(cwd),
-                    "cwdEncoded": True,
-                    "filename": "@put",
-                    "fileBody": flask.request.data.decode(),
-                    "fileCwd": cwd,
-                    "fileOpen": True,
-                    "fileEncoding": "md",
-                    "fileEncoded": False,
-                }
-            )
+            message = {
+                "func": "file",
+                "cwd": cwd,
+                "cwdBody": dir2body(cwd),
+                "cwdEncoded": True,
+                "filename": "@put",
+                "fileBody": flask.request.data.decode(),
+                "fileCwd": cwd,
+                "fileOpen": True,
+                "fileEncoding": "md",
+                "fileEncoded": False,
+                "session": flask.request.args.get("session", ""),
+            }
+            try:
+                send_as_pyclient(message)
+            except ConnectionError:
+                return flask.abort(503)
             return ""
 
         if flask.request.method == "DELETE":
             exit_status = stop_flask_server()
             return "failed.\n" if exit_status else "success.\n"
 
-        # should never get here:
-        return "failed.\n"
+        # should never get here:
+        return "failed.\n"
+
+    return app
+
+
+# make a subprocess exit when its parent dies
+def die_with_parent():
+    """ ask the kernel to terminate the calling process when its parent dies
+
+    This is used as `preexec_fn` for helper processes (like the pandoc
+    servers), such that they don't outlive a killed smdv server.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.prctl(1, signal.SIGTERM)  # 1 = PR_SET_PDEATHSIG (linux only)
+    except (OSError, AttributeError):
+        pass
+
+
+# get a page of a directory listing
+def dir_page(cwd: str, start: int = 0, count: int = 100, prefix: str = "") -> dict:
+    """ get a page of rows of a (large) directory listing
+
+    Args:
+        cwd: str: the directory (relative to the smdv home)
+        start: int: the index of the first row
+        count: int: the number of rows (at most --dir-page-size)
+        prefix: str: only list the entries starting with this (case insensitive) prefix
+
+    Returns:
+        page: dict: the rows of the page and the total number of (matching) rows
+    """
+    listing = directory_listing(cwd)
+    rows = listing.rows
+    if prefix:
+        # both the directories and the files are sorted: each has one range of matches
+        prefix = prefix.upper()
+        rows = []
+        for lo, hi in [(0, listing.ndirs), (listing.ndirs, len(listing.rows))]:
+            first = bisect.bisect_left(listing.keys, prefix, lo, hi)
+            last = bisect.bisect_left(listing.keys, prefix + "\U0010ffff", lo, hi)
+            rows += listing.rows[first:last]
+    start = max(int(start), 0)
+    count = min(max(int(count), 0), ARGS.dir_page_size)
+    return {"start": start, "total": len(rows), "rows": rows[start : start + count]}
+
+
+# list a directory (cached)
+def directory_listing(cwd: str) -> DirectoryListing:
+    """ get the (cached) listing of a directory
+
+    Args:
+        cwd: str: the directory (relative to the smdv home)
 
-    return app
+    Returns:
+        listing: DirectoryListing: the directory listing
+    """
+    global DIRECTORY_CACHE
+    i = 1 if (cwd and cwd[0] == "/") else 0
+    path = os.path.normpath(os.path.join(ARGS.home, cwd[i:]))
+    if DIRECTORY_CACHE is None:
+        DIRECTORY_CACHE = DirectoryCache()
+    return DIRECTORY_CACHE.get(path)
 
 
 # encode a string in the given encoding format
 def encode(message: dict) -> dict:
-    """ encode the body of a message. """
+    """ encode the body of a message.
+
+    Relative urls are resolved against the directory of the file (not the
+    current working directory), such that encoding is safe to do in a thread.
+    """
     if message.get("fileEncoded", False):
         return message  # don't encode again if the message is already encoded
     message["fileEncoded"] = True
+    cwd = message.get("fileCwd") or message.get("cwd") or "/"
     encoding = message.get("fileEncoding")
     filename = message.get("filename")
     if not encoding:
@@ -753,16 +2914,28 @@ def encode(message: dict) -> dict:
                 encoding = ARGS.stdin
         message["fileEncoding"] = encoding
     if encoding == "md":
-        message["fileBody"] = md2body(message["fileBody"])
+        message["fileBlocks"] = md2blocks(message["fileBody"], cwd=cwd)
+        message["fileBody"] = "".join(html for _, html in message["fileBlocks"])
         return message
     if encoding == "ipynb":
         try:
-            message["fileBody"] = ipynb2body(message["fileBody"])
+            message["fileBlocks"] = ipynb2blocks(message["fileBody"], cwd=cwd)
+            message["fileBody"] = "".join(html for _, html in message["fileBlocks"])
             return message
-        except ImportError:
+        except (ImportError, ValueError):  # no nbconvert, or not a (complete) notebook
             encoding = message["fileEncoding"] = "txt"
-    if encoding == "txt":
-        message["fileBody"] = txt2body(message["fileBody"])
+    if encoding == "window":  # large file: only the lines in view are sent
+        path = ARGS.home + cwd + filename
+        message["fileBody"] = largefile2body(path)
+        return message
+    if encoding == "txt" and message.get("fileStream"):  # streamed: patch blocks
+        message["fileBlocks"] = txt2blocks(
+            message["fileBody"], start=message.get("fileFirstLine", 0)
+        )
+        message["fileBody"] = "".join(html for _, html in message["fileBlocks"])
+        return message
+    if encoding == "txt":  # escaping is cheaper than caching
+        message["fileBody"] = txt2body(message["fileBody"], cwd=cwd)
         return message
     if message["fileEncoding"] == "html":
         return message
@@ -782,33 +2955,32 @@ def dir2body(cwd: str) -> str:
     Returns:
         html: str: the resulting html
     """
-    i = 1 if (cwd and cwd[0] == "/") else 0
-    path = os.path.join(ARGS.home, cwd[i:])
-    paths = sorted([p for p in os.listdir(path)], key=str.upper)
-    paths = [os.path.join(path, p) for p in paths]
-    url = lambda path: path.replace(ARGS.home, f"http://127.0.0.1:{ARGS.port}")
-    link = lambda i, t, p: (f"{t}{i}&nbsp;{os.path.basename(p)}{t[0]}/{t[1:]}", url(p))
-    dirlinks = [link("📁", "<b>", p) for p in paths if os.path.isdir(p)]
-    filelinks = [link("📄", " ", p) for p in paths if not os.path.isdir(p)]
-    dirhtml = [f'<a href="{url}">{name}</a>' for name, url in dirlinks]
-    filehtml = [
-        f'<a href="{url}">{name.replace("/","")}</a>' for name, url in filelinks
-    ]
-    html = "<br>\n".join(dirhtml + filehtml)
-    return html
+    listing = directory_listing(cwd)
+    if len(listing.rows) <= ARGS.dir_page_size:
+        return "<br>\n".join(listing.rows)
+    # large folders are shown in a window of which the rows are fetched in pages
+    cwd = cwd if cwd.startswith("/") else "/" + cwd
+    cwd = cwd.replace("&", "&amp;").replace('"', "&quot;")
+    return (
+        f'<input id="dirFilter" type="search" placeholder="filter by prefix">\n'
+        f'<div id="dirWindow" class="smdv-window" data-func="dirPage" data-key="{cwd}" '
+        f'data-total="{len(listing.rows)}" data-page="{ARGS.dir_page_size}">'
+        f'<div class="smdv-rows"></div></div>'
+    )
 
 
 # open file in neovim
-def edit_in_neovim(filename: str = ""):
+def edit_in_neovim(filename: str = "", address: str = ""):
     """ Open file in neovim using neovim-remote
 
     Args:
         filename: str="": the filename to open in neovim
+        address: str="": the address of neovim (default: --nvim-address)
     """
     path = os.path.abspath(os.path.expanduser(filename))
     if not os.path.exists(path):
         return
-    sock = ARGS.nvim_address.strip()
+    sock = (address or ARGS.nvim_address).strip()
     if not ":" in sock:  # unix socket
         dirname = os.path.dirname(sock)
         if not os.path.exists(dirname):
@@ -819,38 +2991,256 @@ def edit_in_neovim(filename: str = ""):
         subprocess.Popen([ARGS.terminal, "-e", "nvr", "-s", "--servername", sock, path])
 
 
-# convert a jupyter notebook to html
-def ipynb2body(content: str) -> str:
-    """ convert jupyter notebook
+# externalize embedded data of rendered html
+def externalize_data_uris(html: str) -> str:
+    """ move the (large) data uris of rendered html into the resource store
+
+    Embedded images (e.g. the plots of a notebook) are replaced by urls to the
+    resource store, such that they are sent to the browser (and cached by it)
+    only once, in stead of with every update of the file.
+
+    Args:
+        html: the rendered html
+
+    Returns:
+        html: str: the html referring to the externalized resources
+    """
+
+    def externalize(match):
+        try:
+            data = base64.b64decode(match.group(4))
+        except (binascii.Error, ValueError):
+            return match.group(0)
+        url = resource_url(resource_store().put(data, match.group(3)))
+        return f"{match.group(1)}={match.group(2)}{url}{match.group(2)}"
+
+    if "data:" not in html:
+        return html
+    return DATA_URI_PATTERN.sub(externalize, html)
+
 
-    TODO: make this work from stdin
+# externalize the large outputs of a notebook cell
+def externalize_outputs(cell: dict) -> dict:
+    """ move the large html outputs of a notebook cell into the resource store
+
+    Large html outputs (interactive plots, ...) are shown in an iframe that
+    loads them from the resource store.
+
+    Args:
+        cell: the (version 4) notebook cell
+
+    Returns:
+        cell: dict: the cell referring to the externalized outputs
+    """
+    if "outputs" not in cell:
+        return cell
+    outputs = []
+    for output in cell["outputs"]:
+        data = output.get("data", {})
+        html = data.get("text/html", "")
+        html = "".join(html) if isinstance(html, list) else html
+        if len(html) > RESOURCE_HTML_SIZE:
+            url = resource_url(resource_store().put(html.encode(), "text/html"))
+            iframe = (
+                f'<iframe src="{url}" class="smdv-output" frameborder="0" width="100%" '
+                "onload=\"this.style.height=this.contentDocument.body.scrollHeight+'px'\">"
+                "</iframe>"
+            )
+            output = dict(output, data=dict(data, **{"text/html": iframe}))
+        outputs.append(output)
+    return dict(cell, outputs=outputs)
+
+
+# get a preview session
+def get_session(name: str = "") -> Session:
+    """ get a preview session (created on first use)
+
+    Args:
+        name: the session id (empty for the default session)
+
+    Returns:
+        session: Session: the session, marked as used
+    """
+    session = SESSIONS.get(name)
+    if session is None:
+        session = SESSIONS[name] = Session(name)
+    session.active = time.monotonic()
+    return session
+
+
+# import the 3rd party dependencies
+def import_dependencies():
+    """ import flask, websockets and the parts of the standard library only the servers use
+
+    These imports are deferred until they are needed: they take most of
+    the startup time of the command line client, which doesn't need them
+    when it can hand the file to a running server over the local socket.
+    The event loop is created here as well.
+    """
+    global flask, websockets, werkzeug, EVENT_LOOP
+    global asyncio, concurrent, ctypes, difflib, email, http, mimetypes, multiprocessing
+    import asyncio
+    import concurrent.futures
+    import ctypes.util
+    import difflib
+    import email.utils
+    import http.client
+    import mimetypes
+    import multiprocessing
+    import flask
+    import websockets
+    import werkzeug.serving
+
+    EVENT_LOOP = asyncio.get_event_loop()
+
+
+# convert jupyter notebook to a list of rendered cells
+def ipynb2blocks(content: str, cwd: str = None) -> list:
+    """ convert jupyter notebook to html, cell by cell
+
+    Only cells that are not in the render cache yet are converted (by the
+    warm exporter of the notebook worker), such that re-saving a notebook
+    only converts the cells that changed.
 
     Args:
         content: the notebook contents to convert
+        cwd: the directory of the notebook (part of the render cache key)
 
     Returns:
-        html: str: the html representation for the requested jupyter notebook file.
+        blocks: list: (hash, html) tuple for each cell of the notebook
 
     Note:
         this function requires nbconvert
+    """
+    notebook = json.loads(content)
+    if notebook.get("nbformat") != 4:  # old notebooks are upgraded (and converted) at once
+        key = render_cache_key("ipynb", content, cwd)
+        html = cached_render(key)
+        if html is None:
+            html = externalize_data_uris(ipynb_worker_call(ipynb_notebook2html, content))
+            if RENDER_CACHE is not None:
+                RENDER_CACHE.put(key, html)
+        return [(key, f'<div class="smdv-block">{html}</div>')]
+    metadata = notebook.get("metadata", {})
+    minor = notebook.get("nbformat_minor", 0)
+    header = json.dumps([metadata, minor], sort_keys=True)
+    cells = notebook.get("cells", [])
+    keys = [
+        render_cache_key("ipynb-cell", header + json.dumps(cell, sort_keys=True), cwd)
+        for cell in cells
+    ]
+    htmls, missing = {}, {}
+    for key, cell in zip(keys, cells):
+        html = cached_render(key)
+        if html is None:
+            missing[key] = cell
+        else:
+            htmls[key] = html
+    if missing:
+        cells = [externalize_outputs(cell) for cell in missing.values()]
+        rendered = ipynb_worker_call(ipynb_cells2html, metadata, cells, minor)
+        for key, html in zip(missing, rendered):
+            htmls[key] = externalize_data_uris(html)
+            if RENDER_CACHE is not None:
+                RENDER_CACHE.put(key, htmls[key])
+    return [(key, f'<div class="smdv-block">{htmls[key]}</div>') for key in keys]
+
+
+# convert jupyter notebook cells (in the notebook worker)
+def ipynb_cells2html(metadata: dict, cells: list, minor: int = 0) -> list:
+    """ convert jupyter notebook cells to html with the warm exporter
+
+    Every cell is exported as a notebook of its own, such that the result
+    can be cached per cell (the exports of all cells add up to the export of
+    the notebook).
 
+    Args:
+        metadata: the notebook metadata (kernel, language, ...)
+        cells: the (version 4) notebook cells to convert
+        minor: the minor version of the notebook format
+
+    Returns:
+        htmls: list: the html representation of each cell
     """
-    from nbconvert.nbconvertapp import NbConvertApp
-    from nbconvert.exporters.html import HTMLExporter
+    import nbformat
 
-    # create an NbConvertApp:
-    app = NbConvertApp.instance()
-    # initialize the app with the arguments
-    app.initialize(["--template=basic"])
-    # create an exporter
-    app.exporter = HTMLExporter(config=app.config)
-    # get html output
-    html, _ = app.export_single_notebook(
-        notebook_filename=None, resources=None, input_buffer=io.StringIO(content)
-    )
+    notebook = {"nbformat": 4, "nbformat_minor": minor, "metadata": metadata, "cells": cells}
+    notebook = nbformat.reads(json.dumps(notebook), as_version=4)  # joins multiline strings
+    htmls = []
+    for cell in list(notebook.cells):
+        notebook.cells = [cell]
+        html, _ = IPYNB_EXPORTER.from_notebook_node(notebook)
+        htmls.append(html)
+    return htmls
+
+
+# convert a complete jupyter notebook (in the notebook worker)
+def ipynb_notebook2html(content: str) -> str:
+    """ convert a jupyter notebook of any version to html with the warm exporter
+
+    Args:
+        content: the notebook contents to convert
+
+    Returns:
+        html: str: the html representation of the notebook
+    """
+    import nbformat
+
+    html, _ = IPYNB_EXPORTER.from_notebook_node(nbformat.reads(content, as_version=4))
     return html
 
 
+# call a function in the notebook worker
+def ipynb_worker_call(func: callable, *args):
+    """ call a function in the notebook worker process
+
+    The worker (and its exporter) is started on first use. A crashed worker
+    is replaced by a new one.
+
+    Args:
+        func: the function to call (ipynb_cells2html, ipynb_notebook2html)
+        *args: the arguments to call the function with
+
+    Returns:
+        result: the return value of the function
+
+    Raises:
+        ImportError: if nbconvert is not installed
+    """
+    global IPYNB_WORKER
+    for attempt in range(2):
+        with IPYNB_LOCK:
+            if IPYNB_WORKER is None:
+                if importlib.util.find_spec("nbconvert") is None:
+                    raise ImportError("nbconvert is required to view jupyter notebooks")
+                IPYNB_WORKER = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=ipynb_worker_init,
+                )
+            worker = IPYNB_WORKER
+        try:
+            return worker.submit(func, *args).result()
+        except concurrent.futures.process.BrokenProcessPool:
+            with IPYNB_LOCK:
+                if IPYNB_WORKER is worker:
+                    IPYNB_WORKER = None
+            if attempt:
+                raise
+
+
+# initialize the notebook worker
+def ipynb_worker_init():
+    """ create the nbconvert exporter of the notebook worker process (once) """
+    global IPYNB_EXPORTER, ctypes
+    import ctypes.util  # for die_with_parent: import_dependencies doesn't run here
+    from nbconvert.exporters.html import HTMLExporter
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the server handles interrupts
+    die_with_parent()
+    IPYNB_EXPORTER = HTMLExporter(template_name="basic")
+
+
 # check if a file is a binary
 def is_binary_file(filename: str) -> bool:
     """ check if a file can be considered a binary file
@@ -878,6 +3268,53 @@ def is_binary_file(filename: str) -> bool:
         return False
 
 
+# build the message frame for a js client
+def js_frame(session: Session, client: "websockets.WebSocketServerProtocol") -> str:
+    """ build the frame that brings a js client up to date with the message of its session
+
+    With the delta protocol, only the fields that differ from what the client
+    last received are sent, together with the version the delta applies to
+    (base 0 means: start from scratch). If the file body changed and the client
+    holds the blocks the last patch applies to, the patch is sent in stead of
+    the body. With the full protocol, the whole message is sent.
+
+    A frame only depends on the version the client holds, hence each frame
+    is serialized only once per version, however many clients receive it.
+
+    Args:
+        session: the session shown by the js client
+        client: the js client to build the frame for
+
+    Returns:
+        frame: str: the json encoded frame (empty if the client is up to date)
+    """
+    version, held = session.jsstate.get(client, (0, {}))
+    if version == session.version:
+        return ""
+    session.jsstate[client] = (session.version, session.snapshot)
+    frames = session.frames
+    if ARGS.protocol == "full":
+        version = "full"
+    if version in frames:
+        return frames[version]
+    if ARGS.protocol == "full":
+        frames[version] = json.dumps(session.snapshot)
+        return frames[version]
+    delta = {
+        k: v
+        for k, v in session.snapshot.items()
+        if k not in held or (held[k] is not v and held[k] != v)
+    }
+    base, patch = session.patch
+    if "fileBody" in delta and patch is not None and base and held.get("fileHash") == base:
+        del delta["fileBody"]
+        delta.update(filePatch=patch, fileBase=base)
+    frames[version] = json.dumps(
+        {"version": session.version, "base": version, "delta": delta}
+    ) if (delta or not version) else ""
+    return frames[version]
+
+
 # kill the websocket server
 def kill_websocket_server() -> int:
     """ kills the websocket server
@@ -891,6 +3328,93 @@ def kill_websocket_server() -> int:
     return exit_status
 
 
+# get the line index of a large text file
+def large_text_file(path: str) -> LargeTextFile:
+    """ get the (up to date) line index of a large text file
+
+    Args:
+        path: str: the absolute path of the file
+
+    Returns:
+        index: LargeTextFile: the line index of the file
+    """
+    index = LARGE_FILES.pop(path, None) or LargeTextFile(path)
+    LARGE_FILES[path] = index
+    while len(LARGE_FILES) > 8:
+        LARGE_FILES.popitem(last=False)
+    index.refresh()
+    return index
+
+
+# convert a large text file to a scrolling window
+def largefile2body(path: str) -> str:
+    """ convert a large text file to a window of which the lines are fetched on demand
+
+    Args:
+        path: str: the absolute path of the file
+
+    Returns:
+        html: str: the (empty) window with the number of lines of the file
+    """
+    lines = large_text_file(path).refresh()
+    key = path[len(ARGS.home) :].replace("&", "&amp;").replace('"', "&quot;")
+    return (
+        f'<input id="textLine" type="number" min="1" max="{lines}" placeholder="go to line">\n'
+        f'<div id="textWindow" class="smdv-window" data-func="textPage" data-key="{key}" '
+        f'data-total="{lines}" data-page="{ARGS.dir_page_size}"><div class="smdv-rows"></div></div>'
+    )
+
+
+# path of the local socket of the websocket server
+def local_socket_path() -> str:
+    """ path of the unix socket on which the websocket server accepts command line clients
+
+    Returns:
+        path: str: the path of the socket
+    """
+    directory = os.environ.get("XDG_RUNTIME_DIR", "/tmp")
+    return os.path.join(directory, f"smdv-{os.getuid()}-{ARGS.websocket_port}.sock")
+
+
+# convert markdown to a list of rendered blocks
+def md2blocks(content: str = "", cwd: str = None) -> list:
+    """ convert markdown to html, block by block
+
+    The markdown is split into top-level blocks. Only blocks that are not
+    in the render cache yet are converted (in a single pandoc call), such
+    that the render cost of an edit scales with the edit and not with the
+    document.
+
+    Args:
+        content: the markdown string to convert
+        cwd: the directory relative urls are resolved against (default: current)
+
+    Returns:
+        blocks: list: (hash, html) tuple for each block of the document
+    """
+    # huge documents are rendered in one go, streamed to a pandoc subprocess
+    sources = split_markdown(content) if len(content) <= STREAM_SIZE else [content]
+    keys = [render_cache_key("md-block", source, cwd) for source in sources]
+    htmls, missing = {}, {}
+    for key, source in zip(keys, sources):
+        html = cached_render(key)
+        if html is None:
+            missing[key] = source
+        else:
+            htmls[key] = html
+    if missing:
+        separator = "<!-- smdv-block-separator -->"
+        joined = f"\n\n{separator}\n\n".join(missing.values())
+        rendered = md2body(joined, cwd=cwd).split(separator)
+        if len(rendered) != len(missing):  # a separator was swallowed by a block
+            rendered = [md2body(source, cwd=cwd) for source in missing.values()]
+        for key, html in zip(missing, rendered):
+            htmls[key] = externalize_data_uris(html.strip())
+            if RENDER_CACHE is not None:
+                RENDER_CACHE.put(key, htmls[key])
+    return [(key, f'<div class="smdv-block">{htmls[key]}</div>') for key in keys]
+
+
 # ask the number of
 def number_of_connected_jsclients():
     """ ask the websocket server for the number of connected js clients """
@@ -906,8 +3430,35 @@ def main() -> int:
     """
     global ARGS
     try:
-        default_args = parse_args(SMDV_DEFAULT_ARGS.split(" "))
-        ARGS = parse_args(sys.argv[1:], **default_args.__dict__)
+        default_args = {}
+        if SMDV_DEFAULT_ARGS:
+            default_args = parse_args(SMDV_DEFAULT_ARGS.split(" ")).__dict__
+        ARGS = parse_args(sys.argv[1:], **default_args)
+
+        # fast path: hand the file to a running server in a single round trip
+        single_shot = (
+            ARGS.start_server,
+            ARGS.stop_server,
+            ARGS.start_websocket_server,
+            ARGS.stop_websocket_server,
+            ARGS.start,
+            ARGS.stop,
+            ARGS.server_status,
+            ARGS.websocket_server_status,
+            ARGS.stats,
+            ARGS.restart,
+        )
+        if ARGS.filename and not any(single_shot):
+            reply = send_filename_to_local_socket()
+            if reply is not None and "error" in reply:
+                print(f"smdv: {reply['error']}", file=sys.stderr)
+                return 1
+            if reply is not None:
+                if not ARGS.no_browser and reply["numJSClients"] == 0:
+                    open_browser()
+                return 0
+
+        import_dependencies()
 
         # first do single-shot smdv flags:
         if ARGS.start_server:
@@ -923,9 +3474,12 @@ def main() -> int:
             exit_status = kill_websocket_server()
             return exit_status
         if ARGS.start:
-            run_server_in_subprocess(server="flask")
+            if not ARGS.single_process:
+                run_server_in_subprocess(server="flask")
             run_server_in_subprocess(server="websocket")
             return 0
+        if ARGS.stop and ARGS.single_process:
+            return kill_websocket_server()
         if ARGS.stop:
             exit_status1 = send_delete_request_to_server()
             exit_status2 = kill_websocket_server()
@@ -937,21 +3491,27 @@ def main() -> int:
         if ARGS.websocket_server_status:
             print(request_server_status(server="websocket"))
             return 0
+        if ARGS.stats:
+            print(json.dumps(EVENT_LOOP.run_until_complete(ask_stats()), indent=2))
+            return 0
 
         # first, start websocket server. Assume the server is already running on failure
         if ARGS.restart:  # force restart
             kill_websocket_server()
             wait_for_server(server="websocket", status="stopped")
-        run_server_in_subprocess(server="websocket")
+        websocket_ready = run_server_in_subprocess(server="websocket")
 
         # next, start smdv server. Assume the server is already running on failure
-        if ARGS.restart:  # force restart
+        if ARGS.restart and not ARGS.single_process:  # force restart
             send_delete_request_to_server()
             wait_for_server(server="flask", status="stopped")
-        run_server_in_subprocess(server="flask")
+        if not ARGS.single_process:
+            flask_ready = run_server_in_subprocess(server="flask")
 
-        # wait for the websocket server to be fully started:
-        wait_for_server(server="websocket", status="running")
+        # wait for the servers to be fully started:
+        wait_for_server(server="websocket", status="running", ready=websocket_ready)
+        if not ARGS.single_process:
+            wait_for_server(server="flask", status="running", ready=flask_ready)
 
         # if no browser connection can be found: open browser
         if not ARGS.no_browser and number_of_connected_jsclients() == 0:
@@ -971,6 +3531,9 @@ def main() -> int:
             return 0
 
         # else, check if something was piped into smdv and update the body accordingly:
+        if not os.isatty(0) and ARGS.follow:
+            send_stream_from_stdin()
+            return 0
         if not os.isatty(0):
             send_message_from_stdin()
             return 0
@@ -983,42 +3546,19 @@ def main() -> int:
         return 1
 
 
-def md2body(content: str = "") -> str:
+def md2body(content: str = "", cwd: str = None) -> str:
     """ convert markdown to html using the github flavored markdown [gfm] spec of pandoc
 
     Args:
         content: the markdown string to convert
+        cwd: the directory relative urls are resolved against (default: current)
 
     Returns:
         html: str: the resulting html
 
     """
-    # bugfix for pandoc: make % shown as a single % (in stead of stopping conversion)
-    content = content.replace("%", "%%")
-    md_out = subprocess.Popen(
-        ["printf", content.encode()], stdout=subprocess.PIPE
-    ).stdout
-
-    html = (
-        subprocess.check_output(
-            ["pandoc", "--from", "gfm", "--to", "html"], stdin=md_out
-        )
-        .decode()
-        .strip()
-    )
-
-    urls = (re.findall('src="(.*?)"', html)
-            + re.findall("src='(.*?)'", html)
-            + re.findall('href="(.*?)"', html)
-            + re.findall("href='(.*?)'", html))
-
-
-    cwd = os.path.abspath(os.getcwd()).replace(ARGS.home, "") + "/"
-    for url in urls:
-        if not (url.startswith("/") or url.startswith("http://") or url.startswith("https://")):
-            html = html.replace(url, f"http://{ARGS.host}:{ARGS.port}/@static{cwd}{url}")
-
-    return html
+    html = pandoc(content, source="gfm", target="html").strip()
+    return rewrite_urls(html, cwd=cwd)
 
 
 # open a new browser
@@ -1029,6 +3569,8 @@ def open_browser():
         filename: str="": the filename to open the browser at.
     """
     url = f"http://{ARGS.host}:{ARGS.port}"
+    if ARGS.session:
+        url += "/?" + urllib.parse.urlencode({"session": ARGS.session})
     if ARGS.browser == "chromium --app":
         subprocess.Popen(["chromium", f"--app={url}"])
     elif ARGS.browser:
@@ -1039,6 +3581,109 @@ def open_browser():
         webbrowser.open(url)
 
 
+# register an asset of the smdv page
+def page_asset(name: str, content: str) -> str:
+    """ register a stylesheet or script of the smdv page
+
+    The content hash is part of the name of the asset, so browsers may cache
+    the asset forever.
+
+    Args:
+        name: the name of the asset (e.g. smdv.css)
+        content: the content of the asset
+
+    Returns:
+        url: str: the (root relative) url the asset is served on
+    """
+    data = content.encode()
+    stem, ext = os.path.splitext(name)
+    name = f"{stem}.{hashlib.sha256(data).hexdigest()[:16]}{ext}"
+    ASSETS[name] = data
+    return f"/@asset/{name}"
+
+
+# build the smdv page
+def page_html() -> str:
+    """ build the html page (navbar and websocket client) served by smdv
+
+    The page is rendered once: its stylesheets and script are registered as
+    content-hashed assets, which leaves a small html shell to be served on
+    every request.
+
+    Returns:
+        html: str: the html page
+    """
+    global PAGE_HTML
+    if PAGE_HTML is None:
+        stylesheets = [
+            ARGS.md_css_cdn or page_asset("github-markdown.css", MARKDOWN_STYLESHEET),
+            page_asset("smdv.css", STYLESHEET),
+        ]
+        script = JSTEMPLATE.format(
+            home=ARGS.home, host=ARGS.websocket_host, port=ARGS.websocket_port
+        )
+        PAGE_HTML = HTMLTEMPLATE.format(
+            interactive=f"{'--interactive' if ARGS.interactive else ''}",
+            stylesheets="\n        ".join(
+                f'<link rel="stylesheet" href="{href}">' for href in stylesheets
+            ),
+            script=page_asset("smdv.js", script),
+        )
+    return PAGE_HTML
+
+
+# convert content with pandoc
+def pandoc(content: str, source: str = "gfm", target: str = "html") -> str:
+    """ convert content with pandoc
+
+    The conversion is done by one of the warm pandoc servers of the pandoc
+    pool if available. If the pool is disabled or fails, a one-shot pandoc
+    subprocess is used in stead.
+
+    Args:
+        content: the content to convert
+        source: the pandoc input format
+        target: the pandoc output format
+
+    Returns:
+        output: str: the converted content
+    """
+    if PANDOC_POOL is not None and len(content) <= STREAM_SIZE:
+        try:
+            return PANDOC_POOL.convert(content, source=source, target=target)
+        except ConnectionError:
+            pass  # fall back to one-shot pandoc
+
+    # stream the content to pandoc while reading its output (avoids a pipe deadlock)
+    command = ["pandoc", "--from", source, "--to", target]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    writer = threading.Thread(target=write_in_chunks, args=(process.stdin, content))
+    writer.start()
+    output = process.stdout.read()
+    process.stdout.close()
+    writer.join()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return output.decode()
+
+
+# get the pandoc version
+def pandoc_version() -> str:
+    """ get the version of the installed pandoc (cached after the first call)
+
+    Returns:
+        version: str: the first line of `pandoc --version` (empty if not found)
+    """
+    global PANDOC_VERSION
+    if PANDOC_VERSION is None:
+        try:
+            output = subprocess.check_output(["pandoc", "--version"])
+            PANDOC_VERSION = output.decode().split("\n")[0].strip()
+        except (OSError, subprocess.CalledProcessError):
+            PANDOC_VERSION = ""
+    return PANDOC_VERSION
+
+
 # parse command line arguments
 def parse_args(args: tuple, **kwargs) -> argparse.Namespace:
     """ populate the smdv command line arguments
@@ -1089,70 +3734,219 @@ def parse_args(args: tuple, **kwargs) -> argparse.Namespace:
         help="port for websocket communication",
     )
     parser.add_argument(
-        "--host",
-        default=kwargs.get("host", "localhost"),
-        help="host on which smdv is served (for now, only localhost is supported)",
-        choices=["localhost", "127.0.0.1"],
+        "--host",
+        default=kwargs.get("host", "localhost"),
+        help="host on which smdv is served (for now, only localhost is supported)",
+        choices=["localhost", "127.0.0.1"],
+    )
+    parser.add_argument(
+        "--websocket-host",
+        default=kwargs.get("websocket_host", "localhost"),
+        help="host for websocket communication (for now, only localhost is supported)",
+        choices=["localhost", "127.0.0.1"],
+    )
+    parser.add_argument(
+        "--md-css-cdn",
+        default=kwargs.get("md_css_cdn", ""),
+        help="location of [github flavored] markdown css cdn (served by smdv itself by default)",
+    )
+    parser.add_argument(
+        "-b",
+        "--browser",
+        default=kwargs.get("browser", os.environ.get("BROWSER", "")),
+        help="default browser to spawn (uses $BROWSER by default)",
+    )
+    parser.add_argument(
+        "-r",
+        "--restart",
+        action="store_true",
+        default=kwargs.get("restart", False),
+        help="force a restart of smdv (both servers)",
+    )
+    parser.add_argument(
+        "--hide-navbar",
+        action="store_true",
+        default=kwargs.get("hide_navbar", False),
+        help="don't show the smdv navbar by default",
+    )
+    parser.add_argument(
+        "-t",
+        "--terminal",
+        default=kwargs.get("terminal", os.environ.get("TERMINAL", "")),
+        help="default terminal to spawn (uses $TERMINAL by default)",
+    )
+    parser.add_argument(
+        "-B",
+        "--no-browser",
+        action="store_true",
+        default=kwargs.get("no_browser", False),
+        help="start the server without opening a browser.",
+    )
+    parser.add_argument(
+        "-v",
+        "--nvim-address",
+        default=kwargs.get("nvim_address", "127.0.0.1:9878"),
+        help="address or socket to communicate with vim",
+    )
+    parser.add_argument(
+        "-i",
+        "--interactive",
+        action="store_true",
+        default=kwargs.get("interactive", False),
+        help=("open smdv in interactive mode (every file opened in "
+              "smdv will also automatically be opened in vim)."),
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=kwargs.get("cache_size", 4096),
+        help="number of rendered blocks (markdown blocks, notebook cells, ...) to keep in memory",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=kwargs.get("cache_dir", ""),
+        help="directory for the on-disk render cache (disabled by default)",
+    )
+    parser.add_argument(
+        "--cache-dir-size",
+        type=int,
+        default=kwargs.get("cache_dir_size", 2 ** 28),
+        help="maximum size (in bytes) of the on-disk render cache",
+    )
+    parser.add_argument(
+        "--static-max-age",
+        type=int,
+        default=kwargs.get("static_max_age", 0),
+        help="seconds browsers may use files of the home folder without revalidating them",
+    )
+    parser.add_argument(
+        "--resource-size",
+        type=int,
+        default=kwargs.get("resource_size", 2 ** 29),
+        help="maximum size (in bytes) of the on-disk store of plots and large outputs",
+    )
+    parser.add_argument(
+        "-s",
+        "--single-process",
+        action="store_true",
+        default=kwargs.get("single_process", False),
+        help=(
+            "serve the page, static files and websocket from a single process "
+            "on --port (no flask server; PUT requests are not supported)"
+        ),
+    )
+    parser.add_argument(
+        "--protocol",
+        default=kwargs.get("protocol", "delta"),
+        choices=["delta", "full"],
+        help=(
+            "websocket protocol: send only the changed fields to the browser (delta) "
+            "or the full message on every update (full)"
+        ),
+    )
+    parser.add_argument(
+        "--no-compression",
+        action="store_true",
+        default=kwargs.get("no_compression", False),
+        help="disable permessage-deflate compression of websocket frames",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=kwargs.get("debounce", 0.0),
+        help="time (in seconds) to wait for newer content before rendering a file",
+    )
+    parser.add_argument(
+        "--send-timeout",
+        type=float,
+        default=kwargs.get("send_timeout", 10.0),
+        help="disconnect browsers that don't accept an update within this many seconds",
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=kwargs.get("render_workers", 4),
+        help="number of threads rendering files and scanning directories",
+    )
+    parser.add_argument(
+        "--large-file-size",
+        type=int,
+        default=kwargs.get("large_file_size", 2 ** 24),
+        help="show files larger than this many bytes as text in a scrolling window",
+    )
+    parser.add_argument(
+        "--line-numbers",
+        action="store_true",
+        default=kwargs.get("line_numbers", False),
+        help="show line numbers for text and source files",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        default=kwargs.get("follow", False),
+        help="stream stdin into smdv as it arrives (e.g. long_job | smdv --follow)",
     )
     parser.add_argument(
-        "--websocket-host",
-        default=kwargs.get("websocket_host", "localhost"),
-        help="host for websocket communication (for now, only localhost is supported)",
-        choices=["localhost", "127.0.0.1"],
+        "--scrollback",
+        type=int,
+        default=kwargs.get("scrollback", 10000),
+        help="the number of lines smdv keeps of content streamed with --follow",
     )
     parser.add_argument(
-        "--md-css-cdn",
-        default=kwargs.get(
-            "md_css_cdn",
-            "https://cdnjs.cloudflare.com/ajax/libs/github-markdown-css/3.0.1/github-markdown.css",
+        "--session",
+        default=kwargs.get("session", ""),
+        help=(
+            "id of the preview session to show the file or piped content in "
+            "(every session has its own document, history and browser tabs)"
         ),
-        help="location of [github flavored] markdown css cdn (can be a local file)",
     )
     parser.add_argument(
-        "-b",
-        "--browser",
-        default=kwargs.get("browser", os.environ.get("BROWSER", "")),
-        help="default browser to spawn (uses $BROWSER by default)",
+        "--session-timeout",
+        type=float,
+        default=kwargs.get("session_timeout", 600.0),
+        help=(
+            "time (in seconds) after which a session without browser tabs is dropped "
+            "(0: never)"
+        ),
     )
     parser.add_argument(
-        "-r",
-        "--restart",
-        action="store_true",
-        default=kwargs.get("restart", False),
-        help="force a restart of smdv (both servers)",
+        "--prefetch-budget",
+        type=float,
+        default=kwargs.get("prefetch_budget", 0.25),
+        help=(
+            "fraction of the time smdv may spend pre-rendering the documents "
+            "likely opened next (0: disable prefetching)"
+        ),
     )
     parser.add_argument(
-        "--hide-navbar",
+        "--no-watch",
         action="store_true",
-        default=kwargs.get("hide_navbar", False),
-        help="don't show the smdv navbar by default",
+        default=kwargs.get("no_watch", False),
+        help="don't reload the open file when it changes on disk",
     )
     parser.add_argument(
-        "-t",
-        "--terminal",
-        default=kwargs.get("terminal", os.environ.get("TERMINAL", "")),
-        help="default terminal to spawn (uses $TERMINAL by default)",
+        "--watch-debounce",
+        type=float,
+        default=kwargs.get("watch_debounce", 0.1),
+        help="reload a changed file once it stayed untouched for this many seconds",
     )
     parser.add_argument(
-        "-B",
-        "--no-browser",
-        action="store_true",
-        default=kwargs.get("no_browser", False),
-        help="start the server without opening a browser.",
+        "--dir-page-size",
+        type=int,
+        default=kwargs.get("dir_page_size", 500),
+        help="show folders with more entries in a scrolling window, fetched in pages of this size",
     )
     parser.add_argument(
-        "-v",
-        "--nvim-address",
-        default=kwargs.get("nvim_address", "127.0.0.1:9878"),
-        help="address or socket to communicate with vim",
+        "--pandoc-workers",
+        type=int,
+        default=kwargs.get("pandoc_workers", 2),
+        help="number of long-lived pandoc servers to render with (0: one-shot pandoc)",
     )
-    parser.add_argument(
-        "-i",
-        "--interactive",
-        action="store_true",
-        default=kwargs.get("interactive", False),
-        help=("open smdv in interactive mode (every file opened in "
-              "smdv will also automatically be opened in vim)."),
+    parser.add_argument(  # file descriptor to signal on once the server accepts connections
+        "--ready-fd",
+        type=int,
+        default=kwargs.get("ready_fd", -1),
+        help=argparse.SUPPRESS,  # internal: passed by run_server_in_subprocess
     )
     single_shot_arguments = parser.add_mutually_exclusive_group()
     single_shot_arguments.add_argument(
@@ -1167,6 +3961,12 @@ def parse_args(args: tuple, **kwargs) -> argparse.Namespace:
         default=kwargs.get("websocket_server_status", False),
         help="ask status of the smdv server",
     )
+    single_shot_arguments.add_argument(
+        "--stats",
+        action="store_true",
+        default=kwargs.get("stats", False),
+        help="print the statistics (render cache, pandoc pool, ...) of the websocket server",
+    )
     single_shot_arguments.add_argument(
         "--start-server",
         action="store_true",
@@ -1204,17 +4004,68 @@ def parse_args(args: tuple, **kwargs) -> argparse.Namespace:
         help="start smdv (both servers)",
     )
     parsed_args = parser.parse_args(args=args)
+    if parsed_args.follow and parsed_args.filename:
+        raise ValueError("--follow streams stdin: no filename can be given")
     if parsed_args.stdin is None:
         parsed_args.stdin = "md"
     if parsed_args.home.endswith("/"):
         parsed_args.home = parsed_args.home[:-1]
     if not os.path.isdir(parsed_args.home):
         raise ValueError(f"invalid home location given from smdv: {parsed_args.home}")
+    if parsed_args.single_process:  # the websocket server serves everything
+        parsed_args.websocket_host = parsed_args.host
+        parsed_args.websocket_port = parsed_args.port
     if parsed_args.hide_navbar:
         raise ValueError(f"hiding the navbar is not yet supported")
     return parsed_args
 
 
+# build the message that opens a path
+def path2message(path: str) -> dict:
+    """ build the message that opens a path (file or directory) in smdv
+
+    Args:
+        path: the path (relative to the smdv home) to open
+
+    Returns:
+        message: dict: the message to send to the websocket server
+            (None if the path is a binary file)
+
+    Raises:
+        FileNotFoundError: if the path does not exist
+    """
+    cwd, filename = change_current_working_directory(path)
+    if filename:
+        if is_binary_file(filename):
+            return None
+        large = os.path.getsize(filename) > ARGS.large_file_size
+        return {
+            "func": "file",
+            "cwd": cwd,
+            "cwdBody": dir2body(cwd),
+            "cwdEncoded": True,
+            "filename": filename,
+            "fileBody": "" if large else read_file(filename),
+            "fileCwd": cwd,
+            "fileOpen": True,
+            "fileEncoding": "window" if large else "",
+            "fileEncoded": False,
+        }
+    # this only happens if requested path is a directory
+    return {
+        "func": "dir",
+        "cwd": cwd,
+        "cwdBody": dir2body(cwd),
+        "cwdEncoded": True,
+        "filename": filename,
+        "fileBody": "",
+        "fileCwd": cwd,
+        "fileOpen": False,
+        "fileEncoding": "",
+        "fileEncoded": False,
+    }
+
+
 # print a message (useful for logging)
 def print_message(message: dict, **kwargs):
     """ print a message
@@ -1231,6 +4082,45 @@ def print_message(message: dict, **kwargs):
             print(f"{'    '*indent}{k}\t{repr(v)}")
 
 
+# read a text file
+def read_file(path: str) -> str:
+    """ read a text file
+
+    Args:
+        path: str: the path of the file
+
+    Returns:
+        content: str: the content of the file
+    """
+    with open(path, "r") as file:
+        return file.read()
+
+
+# generate a key for the render cache
+def render_cache_key(encoding: str, content: str, cwd: str = None) -> str:
+    """ generate a render cache key
+
+    The key is a hash of the content, the encoding, the directory used for
+    rewriting relative urls, the address of the smdv server and the pandoc
+    version.
+
+    Args:
+        encoding: the encoding of the content
+        content: the content to render
+        cwd: the directory relative urls are resolved against (default: current)
+
+    Returns:
+        key: str: the render cache key
+    """
+    if cwd is None:
+        cwd = os.path.abspath(os.getcwd()).replace(ARGS.home, "") + "/"
+    key = hashlib.sha256()
+    for part in (__version__, pandoc_version(), encoding, cwd, ARGS.host, ARGS.port):
+        key.update(str(part).encode() + b"\0")
+    key.update(content.encode())
+    return key.hexdigest()
+
+
 # get status for the smdv server
 def request_server_status(server: str = "flask") -> str:
     """ request the smdv server status
@@ -1261,18 +4151,135 @@ def request_server_status(server: str = "flask") -> str:
     return server_status
 
 
+# location of the resource store
+def resource_directory() -> str:
+    """ the directory of the resource store
+
+    The store lives next to the on-disk render cache (which refers to it) if
+    there is one, in the user cache directory otherwise.
+
+    Returns:
+        directory: str: the absolute path of the resource store
+    """
+    if ARGS.cache_dir:
+        return os.path.join(os.path.abspath(os.path.expanduser(ARGS.cache_dir)), "resources")
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache, "smdv", "resources")
+
+
+# serve a resource of the resource store
+def resource_response(name: str) -> tuple:
+    """ serve a resource from the resource store
+
+    Resources are content-addressed: they never change, so browsers may
+    cache them forever.
+
+    Args:
+        name: the name of the resource (its hash and extension)
+
+    Returns:
+        response: (status, headers, body) tuple
+    """
+    if not re.fullmatch(r"[0-9a-f]{64}\.[A-Za-z0-9]+", name):
+        return (http.HTTPStatus.NOT_FOUND, {}, b"not found\n")
+    try:
+        with open(os.path.join(resource_directory(), name), "rb") as file:
+            body = file.read()
+    except OSError:
+        return (http.HTTPStatus.NOT_FOUND, {}, b"not found\n")
+    headers = {
+        "Content-Type": mimetypes.guess_type(name)[0] or "application/octet-stream",
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{name.split(".")[0]}"',
+    }
+    return (http.HTTPStatus.OK, headers, body)
+
+
+# get the resource store
+def resource_store() -> ResourceStore:
+    """ get the resource store (created on first use)
+
+    Returns:
+        store: ResourceStore: the resource store
+    """
+    global RESOURCE_STORE
+    with RESOURCE_LOCK:
+        if RESOURCE_STORE is None:
+            RESOURCE_STORE = ResourceStore(resource_directory(), maxsize=ARGS.resource_size)
+    return RESOURCE_STORE
+
+
+# url of a resource
+def resource_url(name: str) -> str:
+    """ the url of a resource of the resource store
+
+    Args:
+        name: the name of the resource (its hash and extension)
+
+    Returns:
+        url: str: the url the resource is served on
+    """
+    return f"http://{ARGS.host}:{ARGS.port}/@resource/{name}"
+
+
+# rewrite the relative urls of rendered html
+def rewrite_urls(html: str, cwd: str = None) -> str:
+    """ resolve the relative urls of rendered html against the smdv static route
+
+    All src and href attributes are visited in a single pass; each relative
+    url is rewritten exactly once. Absolute urls, urls with a scheme
+    (http:, mailto:, data:, ...) and anchors are left alone. Links to
+    markdown files are opened in smdv in stead of served as static files.
+
+    Args:
+        html: the rendered html
+        cwd: the directory relative urls are resolved against (default: current)
+
+    Returns:
+        html: str: the html with the relative urls resolved
+    """
+    if cwd is None:
+        cwd = os.path.abspath(os.getcwd()).replace(ARGS.home, "") + "/"
+    prefix = f"http://{ARGS.host}:{ARGS.port}/@static{cwd}"
+    mdprefix = f"http://{ARGS.host}:{ARGS.port}{cwd}"
+
+    def rewrite(match):
+        url = match.group(3)
+        if not url or url[0] in "/#" or URL_SCHEME_PATTERN.match(url):
+            return match.group(0)
+        is_md = match.group(1) == "href" and re.split("[#?]", url)[0].endswith(".md")
+        url = (mdprefix if is_md else prefix) + url
+        return f"{match.group(1)}={match.group(2)}{url}{match.group(2)}"
+
+    return URL_PATTERN.sub(rewrite, html)
+
+
 # run the flask server
 def run_flask_server():
     """ start the flask server """
-    create_app().run(debug=False, port=ARGS.port, host=ARGS.host, threaded=True)
+    global PYCHANNEL, FLASK_SERVER
+    PYCHANNEL = PyClientChannel(
+        f"ws://{ARGS.websocket_host}:{ARGS.websocket_port}", timeout=ARGS.send_timeout
+    )
+    FLASK_SERVER = werkzeug.serving.make_server(
+        ARGS.host, ARGS.port, create_app(), threaded=True
+    )
+    page_html()
+    signal_ready()
+    FLASK_SERVER.serve_forever()
+    FLASK_SERVER.server_close()
 
 
 # run server in new subprocess
-def run_server_in_subprocess(server="flask"):
+def run_server_in_subprocess(server="flask") -> int:
     """ start the websocket server in a subprocess
 
     Args:
         server: which server to run in subprocess ["flask", "websocket"]
+
+    Returns:
+        ready: int: file descriptor that becomes readable once the server
+            accepts connections (see wait_for_server)
     """
     args = {
         "--home": ARGS.home,
@@ -1283,11 +4290,35 @@ def run_server_in_subprocess(server="flask"):
         "--websocket-host": ARGS.websocket_host,
         "--md-css-cdn": ARGS.md_css_cdn,
         "--nvim-address": ARGS.nvim_address,
+        "--cache-size": ARGS.cache_size,
+        "--cache-dir": ARGS.cache_dir,
+        "--cache-dir-size": ARGS.cache_dir_size,
+        "--resource-size": ARGS.resource_size,
+        "--static-max-age": ARGS.static_max_age,
+        "--pandoc-workers": ARGS.pandoc_workers,
+        "--protocol": ARGS.protocol,
+        "--send-timeout": ARGS.send_timeout,
+        "--debounce": ARGS.debounce,
+        "--render-workers": ARGS.render_workers,
+        "--dir-page-size": ARGS.dir_page_size,
+        "--watch-debounce": ARGS.watch_debounce,
+        "--large-file-size": ARGS.large_file_size,
+        "--scrollback": ARGS.scrollback,
+        "--prefetch-budget": ARGS.prefetch_budget,
+        "--session-timeout": ARGS.session_timeout,
     }
 
     args_list = [str(s) for kv in args.items() for s in kv]  # flattened dict as list
     if ARGS.interactive:
         args_list += ["--interactive"]
+    if ARGS.no_compression:
+        args_list += ["--no-compression"]
+    if ARGS.no_watch:
+        args_list += ["--no-watch"]
+    if ARGS.line_numbers:
+        args_list += ["--line-numbers"]
+    if ARGS.single_process:
+        args_list += ["--single-process"]
     if server == "flask":
         args_list += ["--start-server"]
     elif server == "websocket":
@@ -1296,28 +4327,103 @@ def run_server_in_subprocess(server="flask"):
         raise ValueError(
             "server to start in subprocess should be either 'flask' or 'websocket'"
         )
+    ready, ready_write = os.pipe()
+    args_list += ["--ready-fd", str(ready_write)]
     with open(os.devnull, "w") as null:
-        subprocess.Popen(["smdv"] + args_list, stdout=null, stderr=null)
+        subprocess.Popen(
+            ["smdv"] + args_list, stdout=null, stderr=null, pass_fds=(ready_write,)
+        )
+    os.close(ready_write)
+    return ready
 
 
 # websocket server
 def run_websocket_server():
     """ start and run the websocket server """
-    global WEBSOCKETS_SERVER
+    global WEBSOCKETS_SERVER, RENDER_CACHE, RENDER_EXECUTOR, PANDOC_POOL
+    global FILE_WATCHER, PREFETCHER
+    RENDER_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=ARGS.render_workers)
+    RENDER_CACHE = RenderCache(
+        maxsize=ARGS.cache_size, directory=ARGS.cache_dir, disksize=ARGS.cache_dir_size
+    )
+    if ARGS.prefetch_budget > 0:
+        PREFETCHER = Prefetcher(budget=ARGS.prefetch_budget)
+    if ARGS.pandoc_workers > 0:
+        PANDOC_POOL = PandocPool(size=ARGS.pandoc_workers)
+        try:
+            PANDOC_POOL.start()
+        except ConnectionError as e:
+            warnings.warn(f"{e}: rendering with one-shot pandoc")
+            PANDOC_POOL.stop()
+            PANDOC_POOL = None
     WEBSOCKETS_SERVER = websockets.serve(
-        serve_client, ARGS.websocket_host, ARGS.websocket_port
+        serve_client,
+        ARGS.websocket_host,
+        ARGS.websocket_port,
+        compression=None if ARGS.no_compression else "deflate",
+        process_request=serve_http_request if ARGS.single_process else None,
     )
     EVENT_LOOP.run_until_complete(WEBSOCKETS_SERVER)
+    if not ARGS.no_watch:
+        try:
+            FILE_WATCHER = FileWatcher(reload_file, debounce=ARGS.watch_debounce)
+        except (OSError, AttributeError):
+            warnings.warn("inotify is not available: files are not watched for changes")
+    path = local_socket_path()
+    if os.path.exists(path):  # left behind by a killed server
+        os.unlink(path)
+    EVENT_LOOP.run_until_complete(asyncio.start_unix_server(serve_local_client, path))
+    os.chmod(path, 0o600)
+    if ARGS.session_timeout > 0:
+        asyncio.ensure_future(evict_idle_sessions())
+    if ARGS.single_process:
+        page_html()
+    signal_ready()
     EVENT_LOOP.run_forever()
 
 
+# list a directory
+def scan_directory(path: str) -> DirectoryListing:
+    """ list a directory and render a html row (link) per entry
+
+    Args:
+        path: str: the absolute path of the directory
+
+    Returns:
+        listing: DirectoryListing: the rows (directories first) and their sort keys
+    """
+    url = lambda path: path.replace(ARGS.home, f"http://127.0.0.1:{ARGS.port}")
+    link = lambda i, t, p: (f"{t}{i}&nbsp;{os.path.basename(p)}{t[0]}/{t[1:]}", url(p))
+    with os.scandir(path) as entries:  # file types come with the listing: no stat calls
+        entries = sorted(entries, key=lambda entry: entry.name.upper())
+    dirs = [e for e in entries if e.is_dir()]
+    files = [e for e in entries if not e.is_dir()]
+    dirlinks = [link("📁", "<b>", e.path) for e in dirs]
+    filelinks = [link("📄", " ", e.path) for e in files]
+    dirhtml = [f'<a href="{url}">{name}</a>' for name, url in dirlinks]
+    filehtml = [
+        f'<a href="{url}">{name.replace("/","")}</a>' for name, url in filelinks
+    ]
+    keys = [e.name.upper() for e in dirs + files]
+    return DirectoryListing(keys, dirhtml + filehtml, len(dirs))
+
+
 # send a message to the websocket server at the python client
 def send_as_pyclient(message: dict):
     """ send a message to the websocket server as the python client
 
+    Inside the flask server, the message goes over the persistent channel
+    shared by all request threads.
+
     Args:
         message: the message to send (in dictionary format)
+
+    Raises:
+        ConnectionError: if the persistent channel does not accept the message
     """
+    if PYCHANNEL is not None:
+        PYCHANNEL.send(message)
+        return
     try:
         EVENT_LOOP.run_until_complete(send_as_pyclient_async(message))
     except RuntimeError:
@@ -1345,6 +4451,31 @@ def send_delete_request_to_server():
         return exit_code
 
 
+# open the filename with a running server
+def send_filename_to_local_socket() -> dict:
+    """ open the filename by sending it to the local socket of a running server
+
+    Only the standard library is needed for this, which makes it the fast
+    path of the command line client (e.g. when syncing a file on every save).
+
+    Returns:
+        reply: dict: the reply of the server (None if no server could be reached)
+    """
+    request = {
+        "path": os.path.abspath(os.path.expanduser(ARGS.filename)),
+        "nvimAddress": ARGS.nvim_address,
+        "session": ARGS.session,
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(ARGS.send_timeout)
+            sock.connect(local_socket_path())
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            return json.loads(sock.makefile("rb").readline())
+    except (OSError, ValueError):
+        return None
+
+
 # update body of smdv from stdin
 def send_message_from_stdin():
     """ read content from stdin and place it in the html body """
@@ -1353,18 +4484,45 @@ def send_message_from_stdin():
         message = json.loads(content)
     except json.decoder.JSONDecodeError:
         message = {"fileBody": content}
-    cwd = os.path.abspath(os.path.expanduser(os.getcwd()))[len(ARGS.home) :] + "/"
-    message["func"] = message.get("func", "file")
-    message["cwd"] = message.get("cwd", cwd)
-    message["cwdEncoded"] = bool(message.get("cwdEncoded", True))
-    message["cwdBody"] = message.get("cwdBody", dir2body(cwd))
-    message["cwdCwd"] = message.get("fileCwd", cwd)
-    message["filename"] = message.get("filename", "@pipe")
-    message["fileEncoding"] = message.get("fileEncoding", ARGS.stdin)
-    message["fileEncoded"] = bool(message.get("fileEncoded", False))
-    message["fileOpen"] = bool(message.get("fileOpen", True))
-    message["nvimAddress"] = ARGS.nvim_address
-    send_as_pyclient(message)
+    send_as_pyclient(stdin_message(message))
+
+
+# stream stdin into smdv
+def send_stream_from_stdin():
+    """ stream stdin into the html body as it arrives (until stdin is closed) """
+    message = stdin_message({"fileBody": "", "fileStream": True})
+    EVENT_LOOP.run_until_complete(send_stream_as_pyclient_async(message))
+
+
+# collect the server statistics
+def server_stats() -> dict:
+    """ collect the statistics of the websocket server
+
+    Returns:
+        stats: dict: the statistics of the render cache, pandoc pool, ...
+    """
+    return {
+        "renderCache": RENDER_CACHE.info() if RENDER_CACHE else {},
+        "directoryCache": DIRECTORY_CACHE.info() if DIRECTORY_CACHE else {},
+        "fileWatcher": FILE_WATCHER.info() if FILE_WATCHER else {},
+        "resourceStore": RESOURCE_STORE.info() if RESOURCE_STORE else {},
+        "pandocPool": PANDOC_POOL.info() if PANDOC_POOL else {},
+        "prefetcher": PREFETCHER.info() if PREFETCHER else {},
+        "sessions": {name: session.info() for name, session in SESSIONS.items()},
+    }
+
+
+# signal the launcher that the server is ready
+def signal_ready():
+    """ signal the process that launched this server that it accepts connections """
+    if ARGS.ready_fd < 0:
+        return
+    try:
+        os.write(ARGS.ready_fd, b"ready\n")
+        os.close(ARGS.ready_fd)
+    except OSError:
+        pass  # the launcher stopped waiting
+    ARGS.ready_fd = -1
 
 
 # check if a socket is in use
@@ -1393,15 +4551,261 @@ def socket_in_use(address: str) -> bool:
         return False
 
 
+# split markdown in top-level blocks
+def split_markdown(content: str) -> list:
+    """ split markdown into top-level blocks (headings, paragraphs, fences, tables, ...)
+
+    Blocks that only make sense together (list items, indented continuations,
+    html blocks spanning blank lines) are kept together. Documents with link
+    reference definitions or footnotes are not split at all, as those
+    resolve across blocks.
+
+    Args:
+        content: the markdown string to split
+
+    Returns:
+        blocks: list: the markdown source of each block
+    """
+    if re.search(r"^ {0,3}\[[^\]]+\]:", content, flags=re.M):
+        return [content]
+    fence_re = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+    heading_re = re.compile(r"^ {0,3}#{1,6}(\s|$)")
+    item_re = re.compile(r"^ {0,3}([-+*]|\d{1,9}[.)])(\s|$)")
+    html_re = re.compile(  # comments, processing instructions, declarations, cdata, tags
+        r"^ {0,3}(<!--|<\?|<!\[CDATA\[|<![a-zA-Z]|<([a-zA-Z][a-zA-Z0-9-]*)[\s/>])"
+    )
+    html_ends = {"<!--": "-->", "<?": "?>", "<![CDATA[": "]]>"}  # other declarations: ">"
+    void_tags = {"br", "hr", "img", "input", "meta", "link", "source", "wbr"}
+    blocks, lines, fence, end = [], [], "", ""
+
+    def flush():
+        if lines:
+            blocks.append("\n".join(lines))
+            lines.clear()
+
+    for line in content.split("\n"):
+        if fence:  # inside a fenced code block
+            lines.append(line)
+            stripped = line.strip()
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                fence = ""
+                flush()
+            continue
+        if end:  # inside a html block (or comment, processing instruction, ...)
+            lines.append(line)
+            if end in line.lower():
+                end = ""
+            continue
+        if not line.strip():
+            flush()
+            continue
+        match = fence_re.match(line)
+        if match:
+            flush()
+            fence = match.group(1)
+            lines.append(line)
+            continue
+        if heading_re.match(line):
+            flush()
+            blocks.append(line)
+            continue
+        if not lines and blocks and (
+            line[0] in " \t" or (item_re.match(line) and item_re.match(blocks[-1]))
+        ):
+            # continuation of the previous block (nested content / next list item)
+            lines.extend(blocks.pop().split("\n") + [""])
+        match = html_re.match(line) if not lines else None
+        if match and match.group(2):
+            if match.group(2).lower() not in void_tags:
+                end = f"</{match.group(2).lower()}"
+        elif match:
+            end = html_ends.get(match.group(1), ">")
+        if match and end in line[match.end(1) :].lower():
+            end = ""  # the html block ends on the line it starts
+        lines.append(line)
+    flush()
+    return blocks or [""]
+
+
+# serve a static file
+def static_response(path: str, request_headers: dict = None) -> tuple:
+    """ serve a file from the smdv home (single process mode)
+
+    Responses carry a strong ETag and a Last-Modified date, such that
+    browsers can revalidate their copy (304 Not Modified) in stead of
+    downloading it again. Single byte ranges are supported for large media.
+    The body is a view on a memory map of the file: it goes from the page
+    cache to the socket without being copied into a python bytes object.
+
+    Args:
+        path: the path of the file, relative to the smdv home
+        request_headers: the http request headers
+
+    Returns:
+        response: (status, headers, body) tuple
+    """
+    request_headers = request_headers or {}
+    fullpath = os.path.realpath(os.path.join(ARGS.home, path))
+    if not fullpath.startswith(os.path.realpath(ARGS.home) + "/") or not os.path.isfile(
+        fullpath
+    ):
+        return (http.HTTPStatus.NOT_FOUND, {}, b"not found\n")
+    stat = os.stat(fullpath)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}-{stat.st_ino:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": email.utils.formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": (
+            f"public, max-age={ARGS.static_max_age}" if ARGS.static_max_age > 0 else "no-cache"
+        ),
+        "Accept-Ranges": "bytes",
+    }
+    if_none_match = request_headers.get("If-None-Match")
+    if_modified_since = request_headers.get("If-Modified-Since")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if etag in tags or "*" in tags:
+            return (http.HTTPStatus.NOT_MODIFIED, headers, b"")
+    elif if_modified_since is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            since = -1
+        if int(stat.st_mtime) <= since:
+            return (http.HTTPStatus.NOT_MODIFIED, headers, b"")
+    headers["Content-Type"] = mimetypes.guess_type(fullpath)[0] or "application/octet-stream"
+    start, end = 0, stat.st_size
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", request_headers.get("Range", "").strip())
+    if match and any(match.groups()) and request_headers.get("If-Range", etag) == etag:
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last) + 1 if last else end, end)
+        else:  # suffix range: the last bytes of the file
+            start = max(end - int(last), 0)
+        if start >= end:
+            headers["Content-Range"] = f"bytes */{stat.st_size}"
+            return (http.HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, headers, b"")
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{stat.st_size}"
+    status = http.HTTPStatus.PARTIAL_CONTENT if "Content-Range" in headers else http.HTTPStatus.OK
+    if start == end:
+        return (status, headers, b"")
+    with open(fullpath, "rb") as file:
+        body = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))[start:end]
+    return (status, headers, body)
+
+
+# complete a message with content from stdin
+def stdin_message(message: dict) -> dict:
+    """ complete a message with content read from stdin
+
+    Args:
+        message: the (partial) message read from stdin
+
+    Returns:
+        message: dict: the message opening the @pipe document
+    """
+    cwd = os.path.abspath(os.path.expanduser(os.getcwd()))[len(ARGS.home) :] + "/"
+    message["func"] = message.get("func", "file")
+    message["cwd"] = message.get("cwd", cwd)
+    message["cwdEncoded"] = bool(message.get("cwdEncoded", True))
+    if "cwdBody" not in message:
+        message["cwdBody"] = dir2body(cwd)
+    message["fileCwd"] = message.get("fileCwd", cwd)
+    message["filename"] = message.get("filename", "@pipe")
+    message["fileEncoding"] = message.get("fileEncoding", ARGS.stdin)
+    message["fileEncoded"] = bool(message.get("fileEncoded", False))
+    message["fileOpen"] = bool(message.get("fileOpen", True))
+    message["nvimAddress"] = ARGS.nvim_address
+    message["session"] = ARGS.session
+    return message
+
+
+# get a range of lines of a large text file
+def text_page(key: str, start: int = 0, count: int = 100) -> dict:
+    """ get a range of lines of an opened large text file
+
+    Args:
+        key: str: the path of the file (relative to the smdv home)
+        start: int: the index of the first line
+        count: int: the number of lines (at most --dir-page-size)
+
+    Returns:
+        page: dict: the (html escaped) lines and the total number of lines
+    """
+    index = LARGE_FILES.get(ARGS.home + key)  # only files opened in smdv are served
+    if index is None:
+        return {"start": start, "total": 0, "rows": []}
+    total = index.refresh()
+    start = max(int(start), 0)
+    count = min(max(int(count), 0), ARGS.dir_page_size)
+    lines = index.lines(start, count)
+    escape = lambda line: line.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return {"start": start, "total": total, "rows": [escape(line) for line in lines]}
+
+
+# convert streamed text to blocks
+def txt2blocks(content: str, start: int = 0, blocksize: int = 64) -> list:
+    """ convert streamed text to html, in blocks of lines
+
+    The blocks are aligned to the line numbers of the stream, such that
+    dropping lines from the front of the scrollback only changes the first
+    block, and appending only changes the last ones.
+
+    Args:
+        content: the text to convert
+        start: the line number of the first line of the content
+        blocksize: the number of lines per block
+
+    Returns:
+        blocks: list: (hash, html) tuple for each block of lines
+    """
+    lines = content.split("\n")
+    blocks = []
+    first = 0
+    while first < len(lines):
+        last = first + blocksize - (start + first) % blocksize
+        text = "\n".join(lines[first:last])
+        key = hashlib.sha256(f"{start + first}:{text}".encode()).hexdigest()[:16]
+        html = txt2body(text, start=start + first)
+        blocks.append((key, f'<div class="smdv-block smdv-stream">{html}</div>'))
+        first = last
+    return blocks
+
+
 # convert text file to html
-def txt2body(content: str) -> str:
+def txt2body(content: str, cwd: str = None, start: int = 0) -> str:
     """ Convert text content to html
 
+    The text is html-escaped (in chunks of lines) and shown as a code block,
+    without the need for pandoc. Lines are numbered with --line-numbers.
+
     Args:
         content: the content to encode as html
+        cwd: unused (text has no relative urls to resolve)
+        start: the number of lines preceding the content (for the line numbers)
     """
-    content = f"```\n{content}\n```"
-    return md2body(content)
+    if content.endswith("\n"):
+        content = content[:-1]
+    chunksize = 2 ** 20
+    chunks = []
+    offset = 0
+    while offset < len(content):
+        end = content.find("\n", offset + chunksize)
+        end = len(content) if end < 0 else end + 1
+        chunk = content[offset:end]
+        chunk = chunk.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        if ARGS.line_numbers:
+            chunk = chunk.replace("\n", '</span>\n<span class="smdv-line">')
+        chunks.append(chunk)
+        offset = end
+    if ARGS.line_numbers:
+        style = f' style="counter-reset: smdv-line {start}"' if start else ""
+        return (
+            f'<pre><code class="smdv-numbered"{style}><span class="smdv-line">'
+            + "".join(chunks)
+            + "</span></code></pre>"
+        )
+    return "<pre><code>" + "".join(chunks) + "</code></pre>"
 
 
 # send message to smdv to load filename
@@ -1410,22 +4814,11 @@ def update_filename():
     path = os.path.abspath(os.path.expanduser(ARGS.filename))
     if path.startswith(ARGS.home):
         path = path[len(ARGS.home) :]
-    cwd, filename = change_current_working_directory(path)
-    with open(filename, "r") as file:
-        content = file.read()
-    message = {
-        "func": "file",
-        "cwd": cwd,
-        "cwdBody": dir2body(cwd),
-        "cwdEncoded": True,
-        "filename": filename,
-        "fileBody": content,
-        "fileCwd": cwd,
-        "fileOpen": True,
-        "fileEncoding": "",
-        "fileEncoded": False,
-        "NvimAddress": ARGS.nvim_address,
-    }
+    message = path2message(path)
+    if message is None:
+        raise ValueError(f"cannot open binary file {ARGS.filename}")
+    message["nvimAddress"] = ARGS.nvim_address
+    message["session"] = ARGS.session
     send_as_pyclient(message)
 
 
@@ -1451,21 +4844,20 @@ def validate_message(message: str):
 
 
 # wait until at least on js client is online.
-def wait_for_connected_jsclient(interval: float = 0.3, max_attempts: int = 6):
+def wait_for_connected_jsclient(timeout: float = 10.0):
     """ wait until a connection to the browser can be made.
 
-    Args:
-        interval: the interval time to check for the websocket server connection
-        max_attempts: the maximum number of tries before exiting with failure
+    The websocket server answers as soon as a browser connects.
 
-    Returns:
-        exit_status: the exit status after waiting
+    Args:
+        timeout: the maximum time (in seconds) to wait for a browser
     """
-    for _ in range(max_attempts):  # max 10 tries, throw error otherwise
-        if number_of_connected_jsclients() > 0:
-            return
-        time.sleep(interval)
-    raise ConnectionRefusedError("could not establish a connection with a browser")
+    try:
+        EVENT_LOOP.run_until_complete(
+            asyncio.wait_for(ask_num_js_clients(wait=True), timeout)
+        )
+    except asyncio.TimeoutError:
+        raise ConnectionRefusedError("could not establish a connection with a browser")
 
 
 # block until a connection to the websocket server can be established
@@ -1474,6 +4866,7 @@ def wait_for_server(
     max_attempts: int = 10,
     server: str = "flask",
     status: str = "running",
+    ready: int = -1,
 ):
     """ wait until a connection to one of the servers can be established
 
@@ -1482,14 +4875,25 @@ def wait_for_server(
         max_attempts: the maximum number of tries before exiting with failure
         server: the server to ask the status for ["flask", "websocket"]
         status: wait for ["running", "stopped"] status.
+        ready: the ready file descriptor returned by run_server_in_subprocess.
+            When given, the server signals when it's running in stead of
+            being polled.
 
     Returns:
         exit_status: the exit status after waiting
     """
     if status not in ["running", "stopped"]:
         raise ValueError("wait for server expects status 'running' or 'stopped'")
+    if ready >= 0:
+        try:
+            readable, _, _ = select.select([ready], [], [], interval * max_attempts)
+            if readable and os.read(ready, 64):
+                return
+            # end of file: the new server exited (e.g. because one was already running)
+        finally:
+            os.close(ready)
     for _ in range(max_attempts):  # max 10 tries, throw error otherwise
-        if request_server_status(server=server) == "running":
+        if request_server_status(server=server) == status:
             return
         time.sleep(interval)
     raise ConnectionRefusedError(
@@ -1497,5 +4901,32 @@ def wait_for_server(
     )
 
 
+# watch the open files of all sessions
+def watch_open_files():
+    """ let the file watcher watch the open files of all sessions (and only those) """
+    if FILE_WATCHER is not None:
+        FILE_WATCHER.watch({session.open_file_path() for session in SESSIONS.values()} - {""})
+
+
+# write a string to a stream in chunks
+def write_in_chunks(stream: io.BufferedWriter, content: str, chunksize: int = 2 ** 20):
+    """ encode and write a string to a (pipe) stream chunk by chunk, then close it
+
+    Only a single chunk is encoded at a time, such that no encoded copy of
+    the full content is made.
+
+    Args:
+        stream: the binary stream to write to
+        content: the string to write
+        chunksize: the number of characters to encode and write at once
+    """
+    try:
+        for i in range(0, len(content), chunksize):
+            stream.write(content[i : i + chunksize].encode())
+        stream.close()
+    except BrokenPipeError:
+        pass  # the reader stopped (e.g. pandoc failed): its exit status tells why
+
+
 if __name__ == "__main__":
     exit(main())
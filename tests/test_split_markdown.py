@@ -0,0 +1,45 @@
+""" tests for splitting markdown in top-level blocks """
+
+import smdv
+
+
+def test_headings_and_paragraphs_are_split():
+    assert smdv.split_markdown("# Title\n\nfirst\n\nsecond") == ["# Title", "first", "second"]
+
+
+def test_comment_with_blank_lines_is_one_block():
+    content = "# Title\n\n<!-- hidden\n\nstill hidden\n\n-->\n\nvisible"
+    assert smdv.split_markdown(content) == [
+        "# Title",
+        "<!-- hidden\n\nstill hidden\n\n-->",
+        "visible",
+    ]
+
+
+def test_one_line_comment_ends_its_block():
+    assert smdv.split_markdown("<!-- note -->\n\nvisible") == ["<!-- note -->", "visible"]
+
+
+def test_unterminated_comment_hides_the_rest_of_the_document():
+    content = "# Title\n\n<!-- hidden\n\nstill hidden"
+    assert smdv.split_markdown(content) == ["# Title", "<!-- hidden\n\nstill hidden"]
+
+
+def test_processing_instruction_declaration_and_cdata_are_kept_together():
+    assert smdv.split_markdown("<?php\n\necho 1;\n\n?>\n\nafter") == [
+        "<?php\n\necho 1;\n\n?>",
+        "after",
+    ]
+    assert smdv.split_markdown("<!DOCTYPE\n\nhtml>\n\nafter") == [
+        "<!DOCTYPE\n\nhtml>",
+        "after",
+    ]
+    assert smdv.split_markdown("<![CDATA[\na\n\nb\n]]>\n\nafter") == [
+        "<![CDATA[\na\n\nb\n]]>",
+        "after",
+    ]
+
+
+def test_html_tag_with_blank_lines_is_one_block():
+    content = "<div>\n\ninside\n\n</div>\n\nafter"
+    assert smdv.split_markdown(content) == ["<div>\n\ninside\n\n</div>", "after"]